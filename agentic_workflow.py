@@ -3,9 +3,14 @@ Agentic RAG Workflow using an agent-based architecture.
 This implementation uses specialized agents for different tasks.
 """
 import os
-from typing import Optional, Any, Dict, List
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Any, Callable, Dict, List, Sequence, Tuple
 import re
-import requests
+
+import numpy as np
 
 # IMPORTANT: Import pydantic_config FIRST to patch base classes before they're used
 # This must be imported before any llama-index workflow imports
@@ -14,6 +19,7 @@ import pydantic_config  # noqa: F401
 from pydantic import ConfigDict
 
 from llama_index.core.workflow import (
+    Event,
     StartEvent,
     StopEvent,
     step,
@@ -27,72 +33,71 @@ from llama_index.core.prompts import PromptTemplate
 from llama_index.llms.litellm import LiteLLM
 from llama_index.core.llms import LLM
 from llama_index.core.base.base_retriever import BaseRetriever
-from llama_index.core.schema import NodeWithScore
+from llama_index.core.schema import NodeWithScore, QueryBundle
 from dotenv import load_dotenv
 
+from answer_cache import RelevanceGradeCache, SemanticAnswerCache, SharedAnswerCache, normalize_query
+from completion_cache import completion_cache_scope
+from deadline import run_stage
+from llm_adapter import adapt_llm, llm_unavailable
+from llm_governor import LLMGovernorRejected, bind_llm_caller
+from model_router import llm_for_agent
+from single_flight import coalesced_query_embedding
+from firecrawl_client import firecrawl_search
+from search_cache import SearchResultCache, get_search_cache
+from web_scrape import DEFAULT_SCRAPE_TIMEOUT, WEB_SCRAPE_ENABLED, WebScraper, format_web_chunks
+from context_packing import (
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    ContextChunk,
+    PackedContext,
+    chunks_from_nodes,
+    count_tokens,
+    pack_context,
+)
+
 load_dotenv()
 
 
-# Define extract_text_from_response BEFORE patching LiteLLM
-def extract_text_from_response(response):
-    """Extract text from LLM response, converting BaseMessage objects to strings."""
-    from llama_index.core.base.llms.types import CompletionResponse
-    
-    try:
-        from langchain_core.messages.base import BaseMessage
-        if isinstance(response, BaseMessage):
-            text = response.content if hasattr(response, 'content') else str(response)
-            return CompletionResponse(text=str(text), raw=response)
-    except (ImportError, AttributeError):
-        pass
-    
-    if isinstance(response, CompletionResponse):
-        if hasattr(response, 'text'):
-            try:
-                from langchain_core.messages.base import BaseMessage
-                if isinstance(response.text, BaseMessage):
-                    text = response.text.content if hasattr(response.text, 'content') else str(response.text)
-                    return CompletionResponse(text=str(text), raw=getattr(response, 'raw', response))
-            except (ImportError, AttributeError):
-                pass
-        if isinstance(response.text, str):
-            return response
-        return CompletionResponse(text=str(response.text), raw=getattr(response, 'raw', response))
-    
-    if hasattr(response, 'text'):
-        text = response.text
-        try:
-            from langchain_core.messages.base import BaseMessage
-            if isinstance(text, BaseMessage):
-                text = text.content if hasattr(text, 'content') else str(text)
-        except (ImportError, AttributeError):
-            pass
-        text = str(text) if not isinstance(text, str) else text
-        return CompletionResponse(text=text, raw=response)
-    
-    if hasattr(response, 'content'):
-        text = response.content if isinstance(response.content, str) else str(response.content)
-        return CompletionResponse(text=text, raw=response)
-    
-    return CompletionResponse(text=str(response), raw=response)
+# Default for optional constructor settings where None is a meaningful value ("disabled")
+_FROM_ENV: Any = object()
+
 
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    """Read an optional float setting; an empty value means 'unset'."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return float(value) if value.strip() else None
 
-# Patch LiteLLM at the class level
-_original_litellm_acomplete = LiteLLM.acomplete
-_original_litellm_complete = LiteLLM.complete
 
-async def _patched_litellm_acomplete(self, prompt, **kwargs):
-    """Patched acomplete that converts BaseMessage to CompletionResponse immediately."""
-    response = await _original_litellm_acomplete(self, prompt, **kwargs)
-    return extract_text_from_response(response)
+class StageEvent(Event):
+    """Progress of a pipeline stage (streamed to clients when the workflow runs with stream=True)."""
+    stage: str
+    status: str  # "started", "finished", "skipped", "timeout" or "hit"
+    detail: Dict[str, Any] = {}
 
-def _patched_litellm_complete(self, prompt, **kwargs):
-    """Patched complete that converts BaseMessage to CompletionResponse immediately."""
-    response = _original_litellm_complete(self, prompt, **kwargs)
-    return extract_text_from_response(response)
 
-LiteLLM.acomplete = _patched_litellm_acomplete
-LiteLLM.complete = _patched_litellm_complete
+class TokenEvent(Event):
+    """A piece of the answer as it is generated."""
+    delta: str
+
+
+def _emit(context: Optional[Dict], event: Event) -> None:
+    """Send an event to the workflow's stream, if the caller asked for streaming."""
+    emit = context.get("emit") if context else None
+    if emit is not None:
+        emit(event)
+
+
+class AgenticResponse:
+    """Final workflow result: the answer text plus per-request metadata (token usage, etc.)."""
+    
+    def __init__(self, response: str, metadata: Dict = None):
+        self.response = response
+        self.metadata = metadata or {}
+    
+    def __str__(self) -> str:
+        return self.response
 
 
 class Agent:
@@ -119,7 +124,12 @@ class RetrievalAgent(Agent):
     async def execute(self, task: str, context: Dict = None) -> Dict:
         """Retrieve relevant documents."""
         query = task
-        nodes = self.retriever.retrieve(query)
+        query_embedding = (context or {}).get("query_embedding")
+        if query_embedding is not None:
+            # Reuse the embedding computed for the answer cache instead of embedding twice
+            nodes = await self.retriever.aretrieve(QueryBundle(query_str=query, embedding=query_embedding))
+        else:
+            nodes = await self.retriever.aretrieve(query)
         return {
             "agent": self.name,
             "task": "retrieval",
@@ -152,27 +162,226 @@ Decision:
 Provide your binary score ('yes' or 'no'):"""
     )
     
+    BATCH_RELEVANCY_PROMPT = PromptTemplate(
+        template="""As a grader, evaluate the relevance of each retrieved document to a question.
+
+User Question:
+--------------
+{query_str}
+
+Retrieved Documents:
+-------------------
+{context_str}
+
+Evaluation Criteria:
+- Consider keywords and topics related to the question.
+- Don't be overly stringent; filter out clearly irrelevant retrievals.
+
+Decision:
+- Use 'yes' if relevant, 'no' if not.
+
+Respond with only a JSON array of exactly {count} strings ('yes' or 'no'), one per document in order, e.g. ["yes", "no"]:"""
+    )
+    
+    MODES = ("batch", "per_node")
+    
+    def __init__(
+        self,
+        name: str,
+        llm: LLM,
+        max_concurrency: Optional[int] = None,
+        mode: Optional[str] = None,
+        accept_score: Optional[float] = _FROM_ENV,
+        reject_score: Optional[float] = _FROM_ENV,
+        grade_cache: Optional[RelevanceGradeCache] = None,
+        node_embedding: Optional[Callable[[str], Optional[Sequence[float]]]] = None,
+    ):
+        super().__init__(name, llm)
+        self.max_concurrency = max_concurrency or int(os.getenv("RELEVANCE_CONCURRENCY", "5"))
+        # Similarity thresholds for skipping the LLM judge; None (or an empty env var) disables a side.
+        # They apply to the cosine similarity of the query and chunk embeddings, never to the retriever's
+        # own score: that depends on the vector store (Chroma reports exp(-L2 distance), the in-memory
+        # batch path cosine). Defaults suit text-embedding-3-small: on-topic chunks ~0.6+, unrelated < 0.2.
+        self.accept_score = _env_float("RELEVANCE_ACCEPT_SCORE", 0.65) if accept_score is _FROM_ENV else accept_score
+        self.reject_score = _env_float("RELEVANCE_REJECT_SCORE", 0.2) if reject_score is _FROM_ENV else reject_score
+        # Stored chunk embedding by node id (vector stores don't return embeddings with their results)
+        self.node_embedding = node_embedding
+        # Per-session verdict cache; follow-up questions re-retrieve the same chunks
+        self.grade_cache = grade_cache if grade_cache is not None else RelevanceGradeCache(
+            query_similarity=_env_float("RELEVANCE_CACHE_QUERY_SIMILARITY", 0.97)
+        )
+        self.mode = mode or os.getenv("RELEVANCE_MODE", "batch")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown relevance mode '{self.mode}', expected one of {self.MODES}")
+    
+    async def _grade_node(self, node, query: str, semaphore: asyncio.Semaphore) -> Tuple[str, bool]:
+        """
+        Grade a single node; at most max_concurrency grading calls are in flight.
+
+        Returns (verdict, graded); graded is False when the verdict is the keep-it fallback.
+        """
+        prompt = self.RELEVANCY_PROMPT.format(
+            context_str=node.text, 
+            query_str=query
+        )
+        async with semaphore:
+            with completion_cache_scope("relevance"):
+                try:
+                    result = await self.llm.acomplete(prompt)
+                except Exception as e:
+                    if llm_unavailable(e):
+                        # Shed, circuit open or retries spent: fail the stage fast instead of retrying per node
+                        raise
+                    # The request itself was rejected; keep the node ungraded rather than drop it
+                    print(f"Warning: Relevance grading failed for one node, keeping it: {e}")
+                    return "yes", False
+        return result.text.lower().strip(), True
+    
+    @staticmethod
+    def _parse_batch_grades(text: str, count: int) -> Optional[List[str]]:
+        """Parse the batched grader output into count 'yes'/'no' verdicts; None if invalid."""
+        text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+        start, end = text.find("["), text.rfind("]")
+        if start == -1 or end <= start:
+            return None
+        try:
+            grades = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+        if not isinstance(grades, list) or len(grades) != count:
+            return None
+        verdicts = []
+        for grade in grades:
+            if isinstance(grade, bool):
+                verdicts.append("yes" if grade else "no")
+            elif isinstance(grade, (int, float)):
+                # Scores in [0, 1]: treat >= 0.5 as relevant
+                verdicts.append("yes" if grade >= 0.5 else "no")
+            elif isinstance(grade, str) and grade.strip().lower() in ("yes", "no"):
+                verdicts.append(grade.strip().lower())
+            else:
+                return None
+        return verdicts
+    
+    async def _grade_batch(self, nodes: List, query: str) -> Optional[List[str]]:
+        """Grade all nodes with a single LLM call; None when the output can't be used."""
+        documents = "\n\n".join(f"[{i + 1}]\n{node.text}" for i, node in enumerate(nodes))
+        prompt = self.BATCH_RELEVANCY_PROMPT.format(
+            context_str=documents,
+            query_str=query,
+            count=len(nodes)
+        )
+        def usable(text: str) -> bool:
+            # Output that doesn't parse would otherwise be replayed from the completion cache for its whole TTL
+            return self._parse_batch_grades(text, len(nodes)) is not None
+        
+        try:
+            with completion_cache_scope("relevance", validate=usable):
+                result = await self.llm.acomplete(prompt)
+        except Exception as e:
+            if llm_unavailable(e):
+                # Overloaded or down: falling back to one call per node would only make it worse
+                raise
+            print(f"Warning: Batched relevance grading failed: {e}")
+            return None
+        verdicts = self._parse_batch_grades(result.text, len(nodes))
+        if verdicts is None:
+            print(f"Warning: Could not parse batched relevance grades: {result.text[:200]!r}")
+        return verdicts
+    
+    async def _grade_with_llm(self, nodes: List, query: str):
+        """
+        Grade nodes with the LLM.
+
+        Returns (verdicts in node order, whether each verdict came from the LLM, number of LLM calls).
+        """
+        grading_calls = 0
+        if self.mode == "batch" and nodes:
+            verdicts = await self._grade_batch(nodes, query)
+            grading_calls += 1
+            if verdicts is not None:
+                return verdicts, [True] * len(verdicts), grading_calls
+        # Per-node grading (also the fallback when batched output is unusable);
+        # gather keeps results in node order
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [asyncio.ensure_future(self._grade_node(node, query, semaphore)) for node in nodes]
+        try:
+            graded_nodes = await asyncio.gather(*tasks)
+        except Exception:
+            # The LLM is unavailable: stop the other grading calls instead of leaving them running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        grading_calls += len(nodes)
+        return [verdict for verdict, _ in graded_nodes], [graded for _, graded in graded_nodes], grading_calls
+    
+    def _similarities(self, nodes: List, query_embedding: Optional[Sequence[float]]) -> List[Optional[float]]:
+        """Cosine similarity of each node's embedding to the query (None where either is unknown)."""
+        if query_embedding is None or (self.accept_score is None and self.reject_score is None):
+            return [None] * len(nodes)
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector)
+        similarities = []
+        for node in nodes:
+            embedding = getattr(getattr(node, "node", node), "embedding", None)
+            if embedding is None and self.node_embedding is not None:
+                embedding = self.node_embedding(getattr(node, "node_id", None))
+            if embedding is None or not query_norm:
+                similarities.append(None)
+                continue
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            similarities.append(float(vector @ query_vector / (norm * query_norm)) if norm else None)
+        return similarities
+    
+    def _prefilter(self, score: Optional[float]) -> Optional[str]:
+        """Auto-verdict from the query-chunk similarity, or None if the node needs an LLM judge."""
+        if score is None:
+            return None
+        if self.accept_score is not None and score >= self.accept_score:
+            return "yes"
+        if self.reject_score is not None and score < self.reject_score:
+            return "no"
+        return None
+    
     async def execute(self, task: str, context: Dict = None) -> Dict:
         """Evaluate relevance of documents."""
         nodes = context.get("nodes", [])
         query = context.get("query", "")
         
-        relevancy_results = []
-        for node in nodes:
-            prompt = self.RELEVANCY_PROMPT.format(
-                context_str=node.text, 
-                query_str=query
+        query_embedding = context.get("query_embedding")
+        
+        # Confident similarities are decided locally; only the ambiguous band goes to the LLM
+        auto_verdicts = [self._prefilter(score) for score in self._similarities(nodes, query_embedding)]
+        relevancy_results = list(auto_verdicts)
+        ambiguous = [i for i, verdict in enumerate(auto_verdicts) if verdict is None]
+        
+        # Chunks already graded for this (or a near-identical) query cost nothing
+        cache_hits = 0
+        to_grade = []
+        for i in ambiguous:
+            cached = self.grade_cache.get(getattr(nodes[i], "node_id", None), query, query_embedding)
+            if cached is None:
+                to_grade.append(i)
+            else:
+                relevancy_results[i] = cached
+                cache_hits += 1
+        
+        llm_results, graded, grading_calls = await self._grade_with_llm([nodes[i] for i in to_grade], query)
+        for i, verdict, from_llm in zip(to_grade, llm_results, graded):
+            relevancy_results[i] = verdict
+            # A failed call's keep-it fallback is not a verdict; the next query should grade the node again
+            if from_llm:
+                self.grade_cache.set(getattr(nodes[i], "node_id", None), query, verdict, query_embedding)
+        
+        baseline_calls = (1 if nodes else 0) if self.mode == "batch" else len(nodes)
+        skipped_calls = max(0, baseline_calls - grading_calls)
+        if len(to_grade) < len(nodes):
+            print(
+                f"DEBUG: Relevance prefilter decided {len(nodes) - len(ambiguous)}/{len(nodes)} nodes "
+                f"from embedding similarity, {cache_hits} from the grade cache; skipped {skipped_calls} grading calls"
             )
-            try:
-                result = await self.llm.acomplete(prompt)
-                result = extract_text_from_response(result)
-                relevancy = result.text.lower().strip()
-                relevancy_results.append(relevancy)
-            except Exception:
-                result = self.llm.complete(prompt)
-                result = extract_text_from_response(result)
-                relevancy = result.text.lower().strip()
-                relevancy_results.append(relevancy)
         
         # Clean relevancy results
         relevancy_results = [
@@ -190,10 +399,20 @@ Provide your binary score ('yes' or 'no'):"""
             "task": "relevance_evaluation",
             "result": relevant_nodes,
             "all_results": relevancy_results,
+            "grading_calls": grading_calls,
+            "skipped_calls": skipped_calls,
+            "auto_accepted": auto_verdicts.count("yes"),
+            "auto_rejected": auto_verdicts.count("no"),
+            "cache_hits": cache_hits,
             "status": "success"
         }
 
 
+TRANSFORM_CACHE_SIZE = int(os.getenv("TRANSFORM_CACHE_SIZE", "512"))
+# Queries of at most this many words that don't read as a question skip the LLM transform (0 disables)
+TRANSFORM_BYPASS_MAX_WORDS = int(os.getenv("TRANSFORM_BYPASS_MAX_WORDS", "6"))
+
+
 class WebSearchAgent(Agent):
     """Agent specialized in web search using FireCrawl."""
     
@@ -211,66 +430,196 @@ Ensure it's concise and aligned with the search objective.
 Respond with the optimized query only:"""
     )
     
-    def __init__(self, name: str, llm: LLM, firecrawl_api_key: str):
+    # Leading words that mark a natural-language question (worth rewriting) rather than keywords
+    QUESTION_WORDS = frozenset({
+        "what", "how", "why", "who", "whom", "whose", "when", "where", "which", "is", "are", "was", "were",
+        "do", "does", "did", "can", "could", "should", "would", "will", "explain", "describe", "tell",
+        "compare", "summarize", "give", "list", "find", "show",
+    })
+    
+    # Transforms don't depend on the document, so rewritten queries are shared by every session
+    _transform_cache: "OrderedDict[str, str]" = OrderedDict()
+    _transform_counts: Dict[str, int] = {"bypass": 0, "cache": 0, "llm": 0, "timeout": 0, "shed": 0, "error": 0}
+    
+    def __init__(
+        self,
+        name: str,
+        llm: LLM,
+        firecrawl_api_key: str,
+        search_cache: Optional[SearchResultCache] = None,
+        embed_model=None,
+        scrape: Optional[bool] = None,
+    ):
         super().__init__(name, llm)
         self.firecrawl_api_key = firecrawl_api_key
+        self.search_cache = search_cache if search_cache is not None else get_search_cache()
+        # Optional: scrape the top results and answer from their best chunks instead of snippets
+        if scrape is None:
+            scrape = WEB_SCRAPE_ENABLED
+        self.scraper = WebScraper(firecrawl_api_key, embed_model) if scrape and embed_model is not None else None
     
-    def _firecrawl_search(self, query: str, limit: int = 5) -> str:
-        """Perform web search using FireCrawl API."""
-        url = "https://api.firecrawl.dev/v1/search"
-        payload = {
-            "query": query,
-            "limit": limit,
-            "timeout": 60000,
-        }
-        headers = {
-            "Authorization": f"Bearer {self.firecrawl_api_key}",
-            "Content-Type": "application/json"
-        }
-        
+    async def _firecrawl_search(self, query: str, limit: int = 5, timeout: float = 60) -> List[Dict]:
+        """Perform web search using FireCrawl API (shared pooled async client)."""
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=60)
-            response.raise_for_status()
-            data = response.json()
+            data = await firecrawl_search(self.firecrawl_api_key, query, limit=limit, timeout=timeout)
             
             if data.get("success") and data.get("data"):
-                search_results = []
-                for result in data["data"]:
-                    title = result.get("title", "")
-                    description = result.get("description", "")
-                    url = result.get("url", "")
-                    if title or description:
-                        result_text = f"Title: {title}\nDescription: {description}\nURL: {url}\n"
-                        search_results.append(result_text)
-                return "\n---\n".join(search_results)
-            return ""
+                return [
+                    {
+                        "title": result.get("title", ""),
+                        "description": result.get("description", ""),
+                        "url": result.get("url", ""),
+                    }
+                    for result in data["data"]
+                    if result.get("title") or result.get("description")
+                ]
+            return []
         except Exception as e:
             print(f"FireCrawl search error: {e}")
-            return ""
+            return []
+    
+    @staticmethod
+    def _format_results(results: List[Dict]) -> str:
+        return "\n---\n".join(
+            f"Title: {r['title']}\nDescription: {r['description']}\nURL: {r['url']}\n" for r in results
+        )
+    
+    async def _scrape(self, query: str, results: List[Dict], context: Dict, timeout: float) -> Dict:
+        """Scrape-and-embed the top results; "chunks" is empty when nothing usable finished in time."""
+        try:
+            scraped = await self.scraper.retrieve(query, results, context.get("query_embedding"), timeout=timeout)
+        except asyncio.TimeoutError:
+            print("DEBUG: Embedding scraped pages ran out of time, using search snippets")
+            return {"chunks": [], "timed_out": True}
+        except Exception as e:
+            print(f"Warning: Web scrape failed, using search snippets: {e}")
+            return {"chunks": []}
+        print(
+            f"DEBUG: Scraped {scraped['pages']} pages into {scraped['chunks_indexed']} chunks, "
+            f"kept {len(scraped['chunks'])}"
+        )
+        return scraped
+    
+    @classmethod
+    def _is_keyword_query(cls, query: str) -> bool:
+        """Short keyword-style queries ("python asyncio timeout") are already good search queries."""
+        words = query.split()
+        if not words or len(words) > TRANSFORM_BYPASS_MAX_WORDS or "?" in query:
+            return False
+        return words[0].lower().strip(",.:") not in cls.QUESTION_WORDS
+    
+    async def _transform_query(self, query: str, deadline=None) -> Tuple[str, str]:
+        """
+        Rewrite the query for search. Returns (search query, source), where source is
+        "bypass", "cache", "llm", "timeout", "shed" or "error".
+        """
+        if self._is_keyword_query(query):
+            WebSearchAgent._transform_counts["bypass"] += 1
+            return query, "bypass"
+        key = normalize_query(query)
+        cached = WebSearchAgent._transform_cache.get(key)
+        if cached is not None:
+            WebSearchAgent._transform_cache.move_to_end(key)
+            WebSearchAgent._transform_counts["cache"] += 1
+            return cached, "cache"
+        
+        prompt = self.TRANSFORM_PROMPT.format(query_str=query)
+        with completion_cache_scope("transform"):
+            try:
+                result = await run_stage(self.llm.acomplete(prompt), deadline, "transform")
+                transformed_query = result.text
+            except asyncio.TimeoutError:
+                print("DEBUG: Query transform ran out of time, searching with the original query")
+                WebSearchAgent._transform_counts["timeout"] += 1
+                return query, "timeout"
+            except LLMGovernorRejected:
+                print("DEBUG: Query transform shed by the LLM governor, searching with the original query")
+                WebSearchAgent._transform_counts["shed"] += 1
+                return query, "shed"
+            except Exception as e:
+                # Already retried by the resilience layer; a blocking sync retry would only stall the loop
+                print(f"Warning: Query transform failed ({type(e).__name__}), searching with the original query")
+                WebSearchAgent._transform_counts["error"] += 1
+                return query, "error"
+        
+        transformed_query = transformed_query.strip().strip('"') or query
+        WebSearchAgent._transform_counts["llm"] += 1
+        if TRANSFORM_CACHE_SIZE > 0:
+            WebSearchAgent._transform_cache[key] = transformed_query
+            while len(WebSearchAgent._transform_cache) > TRANSFORM_CACHE_SIZE:
+                WebSearchAgent._transform_cache.popitem(last=False)
+        return transformed_query, "llm"
+    
+    async def _refresh_search(self, query: str, limit: int) -> List[Dict]:
+        """Re-run a cached search in the background (transform, usually from the transform cache, then search)."""
+        search_query, _ = await self._transform_query(query)
+        return await self._firecrawl_search(search_query, limit)
+    
+    @classmethod
+    def transform_stats(cls) -> Dict:
+        """Process-wide counts of how search queries were produced."""
+        return {**cls._transform_counts, "cache_entries": len(cls._transform_cache)}
     
     async def execute(self, task: str, context: Dict = None) -> Dict:
         """Perform web search."""
         query = context.get("query", task)
+        deadline = context.get("deadline")
+        timed_out_stages = []
         
-        # Transform query for better search
-        prompt = self.TRANSFORM_PROMPT.format(query_str=query)
-        try:
-            result = await self.llm.acomplete(prompt)
-            result = extract_text_from_response(result)
-            transformed_query = result.text
-        except Exception:
-            result = self.llm.complete(prompt)
-            result = extract_text_from_response(result)
-            transformed_query = result.text
+        # The search cache is keyed by the user's query, so a hit skips the transform as well;
+        # on a miss the query is rewritten for search (bounded; the original is good enough on timeout)
+        transformed_query, transform_source, transform_ms = None, None, None
+        timeout = max(deadline.budget_for("web_search"), 1) if deadline is not None else 60
+        search_started = time.monotonic()
+        
+        async def _search(original_query: str, limit: int) -> List[Dict]:
+            nonlocal transformed_query, transform_source, transform_ms, search_started, timeout
+            transform_started = time.monotonic()
+            transformed_query, transform_source = await self._transform_query(original_query, deadline)
+            if transform_source == "timeout":
+                timed_out_stages.append("transform")
+            transform_ms = round((time.monotonic() - transform_started) * 1000, 1)
+            # Search is bounded by what is left of the web search budget after the transform
+            timeout = max(deadline.budget_for("web_search"), 1) if deadline is not None else 60
+            search_started = time.monotonic()
+            return await self._firecrawl_search(transformed_query, limit, timeout)
+        
+        if self.search_cache is not None:
+            # Background refreshes of stale entries are not tied to this request's deadline
+            results, cache_status = await self.search_cache.get_or_fetch(
+                query, 5, _search, refresh=self._refresh_search
+            )
+            print(f"DEBUG: Search cache {cache_status} for '{query}'")
+        else:
+            results, cache_status = await _search(query, 5), None
+        search_results = self._format_results(results)
         
-        # Perform search
-        search_results = self._firecrawl_search(transformed_query)
+        scrape_stats = {}
+        if self.scraper is not None and results:
+            # Scraping gets its own budget but must also finish inside what is left of the search stage
+            scrape_timeout = DEFAULT_SCRAPE_TIMEOUT
+            if deadline is not None:
+                scrape_timeout = min(
+                    deadline.budget_for("web_scrape"),
+                    timeout - (time.monotonic() - search_started) - 0.5,
+                )
+            scraped = await self._scrape(query, results, context, scrape_timeout)
+            if scraped["chunks"]:
+                search_results = format_web_chunks(scraped["chunks"])
+                scrape_stats = {"scraped_pages": scraped["pages"], "scraped_chunks": scraped["chunks_indexed"]}
+            elif scraped.get("timed_out"):
+                timed_out_stages.append("web_scrape")
         
         return {
             "agent": self.name,
             "task": "web_search",
             "result": search_results,
             "transformed_query": transformed_query,
+            "search_cache": cache_status,
+            "transform": transform_source,
+            "transform_ms": transform_ms,
+            **scrape_stats,
+            "timed_out_stages": timed_out_stages,
             "status": "success"
         }
 
@@ -278,6 +627,9 @@ Respond with the optimized query only:"""
 class QueryAgent(Agent):
     """Agent specialized in generating final answers."""
     
+    # Bump whenever ANSWER_PROMPT or context packing changes, so shared cached answers are not reused
+    PROMPT_VERSION = "1"
+    
     ANSWER_PROMPT = """As a helpful assistant, answer the user's question based on the given context.
 
 Context:
@@ -288,88 +640,463 @@ Question:
 
 Generate a comprehensive answer:"""
     
+    def __init__(self, name: str, llm: LLM, context_token_budget: Optional[int] = None):
+        super().__init__(name, llm)
+        self.context_token_budget = context_token_budget or DEFAULT_CONTEXT_TOKEN_BUDGET
+    
+    def _pack_context(self, context: Dict) -> PackedContext:
+        """Pack retrieved nodes (or pre-joined text) and web results into the token budget."""
+        relevant_nodes = context.get("relevant_nodes")
+        if relevant_nodes is not None:
+            chunks = chunks_from_nodes(relevant_nodes)
+        else:
+            chunks = [ContextChunk(text=context.get("relevant_text", ""))]
+        # Web results rank after document chunks (no score)
+        chunks.append(ContextChunk(text=context.get("search_text", "")))
+        return pack_context(chunks, self.context_token_budget)
+    
+    @staticmethod
+    def _extractive_answer(packed: PackedContext, max_chars: int = 1500) -> str:
+        """Fallback answer when there is no time left for the LLM: the most relevant passages."""
+        excerpt = packed.text[:max_chars].rstrip()
+        if len(packed.text) > max_chars:
+            excerpt += " ..."
+        return (
+            "I couldn't finish generating a full answer in time. "
+            "These are the most relevant passages I found:\n\n" + excerpt
+        )
+    
+    async def _stream_answer(self, prompt: str, context: Dict, parts: List[str]) -> str:
+        """Generate the answer with astream_complete, emitting each delta as a TokenEvent."""
+        stream = await self.llm.astream_complete(prompt)
+        async for chunk in stream:
+            delta = getattr(chunk, "delta", None)
+            if delta:
+                parts.append(delta)
+                _emit(context, TokenEvent(delta=delta))
+        return "".join(parts)
+    
     async def execute(self, task: str, context: Dict = None) -> Dict:
         """Generate final answer."""
-        relevant_text = context.get("relevant_text", "")
-        search_text = context.get("search_text", "")
         query = context.get("query", task)
+        packed = self._pack_context(context)
         
-        if not relevant_text.strip() and not search_text.strip():
+        if not packed.text.strip():
             return {
                 "agent": self.name,
                 "task": "answer_generation",
                 "result": "No relevant information found in the documents.",
+                "context_tokens": 0,
                 "status": "success"
             }
         
-        context_str = relevant_text + "\n" + search_text
         prompt = self.ANSWER_PROMPT.format(
-            context_str=context_str,
+            context_str=packed.text,
             query_str=query
         )
+        usage = {
+            "context_tokens": packed.tokens,
+            "context_token_budget": packed.budget,
+            "context_chunks": packed.chunks_used,
+            "context_chunks_available": packed.chunks_total,
+            "context_truncated": packed.truncated,
+            "prompt_tokens": count_tokens(prompt),
+            "source_node_ids": packed.node_ids,
+        }
+        print(
+            f"DEBUG: Packed {packed.chunks_used}/{packed.chunks_total} chunks into "
+            f"{packed.tokens}/{packed.budget} context tokens ({usage['prompt_tokens']} prompt tokens)"
+        )
         
+        streamed_parts = []
         try:
-            result = await self.llm.acomplete(prompt)
-            result = extract_text_from_response(result)
-            answer = result.text
+            if context.get("emit") is not None:
+                answer = await run_stage(
+                    self._stream_answer(prompt, context, streamed_parts), context.get("deadline"), "answer", required=True
+                )
+                usage["streamed"] = True
+            else:
+                result = await run_stage(self.llm.acomplete(prompt), context.get("deadline"), "answer", required=True)
+                answer = result.text
         except Exception as e:
+            if not llm_unavailable(e):
+                return {
+                    "agent": self.name,
+                    "task": "answer_generation",
+                    "result": f"Error generating response: {str(e)}",
+                    "status": "error",
+                    **usage
+                }
+            # Out of time, or the LLM is overloaded or down
+            if streamed_parts:
+                # The client already has the beginning of the answer; keep it rather than replacing it
+                print(f"DEBUG: Answer generation stopped ({type(e).__name__}), returning the partial streamed answer")
+                answer = "".join(streamed_parts)
+                usage["streamed"] = True
+            else:
+                print(f"DEBUG: Answer generation stopped ({type(e).__name__}), returning extractive answer")
+                answer = self._extractive_answer(packed)
             return {
                 "agent": self.name,
                 "task": "answer_generation",
-                "result": f"Error generating response: {str(e)}",
-                "status": "error"
+                "result": answer,
+                "status": "degraded",
+                "degraded": True,
+                "timed_out_stages": ["answer"],
+                **usage
             }
         
+        usage["completion_tokens"] = count_tokens(answer)
+        usage["llm_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
         return {
             "agent": self.name,
             "task": "answer_generation",
             "result": answer,
-            "status": "success"
+            "status": "success",
+            **usage
+        }
+
+
+class SummaryAgent(Agent):
+    """Agent that precomputes section and document summaries at ingest time and serves them."""
+    
+    SECTION_SUMMARY_PROMPT = PromptTemplate(
+        template="""Summarize the following section of a document.
+
+Section:
+-------
+{context_str}
+-------
+
+Write a concise summary that keeps the key facts, figures and conclusions:"""
+    )
+    
+    DOCUMENT_SUMMARY_PROMPT = PromptTemplate(
+        template="""Below are summaries of consecutive parts of a document.
+
+Summaries:
+-------
+{context_str}
+-------
+
+Combine them into a single coherent summary of the whole document:"""
+    )
+    
+    # Only whole-document requests are answered from the summaries; "summary" inside a question
+    # ("what does the executive summary say about X?") or a scoped request ("summarize the
+    # termination clause") goes through retrieval like any other question.
+    _WHOLE_DOCUMENT = (
+        r"(?:(?:the|this|that|my)\s+)?(?:whole\s+|entire\s+|full\s+)?"
+        r"(?:document|doc|paper|file|pdf|report|text|article|contract|book|upload)s?"
+    )
+    _SUMMARY_NOUN = r"(?:summary|overview|gist|recap|rundown|tl;?dr|key (?:points|takeaways)|main (?:points|ideas))"
+    SUMMARY_QUERY_PATTERN = re.compile(
+        # Imperative, optionally polite: "summarize", "can you summarize this document in detail?",
+        # "give me a quick overview of the paper"
+        r"^\W*(?:(?:please|(?:can|could|would|will) you|i(?:'d| would) like(?: you)?(?: to)?|i (?:want|need)(?: you to)?)\s+)*"
+        r"(?:summari[sz]e|tl;?dr|(?:give|provide|write|make|create)\s+(?:me\s+|us\s+)?(?:a|an|the)\s+"
+        r"(?:(?:short|brief|quick|high-level|detailed)\s+)?" + _SUMMARY_NOUN + r"(?:\s+(?:of|for))?)"
+        r"(?:\s+(?:it|this|that|everything|" + _WHOLE_DOCUMENT + r"))?"
+        r"(?=\s*(?:$|[.!?,;:]|(?:for me|please|in|into|as|with|briefly|section by section)\b))"
+        # Just the noun: "tl;dr", "key takeaways?", "summary please"
+        r"|^\W*(?:(?:a|the)\s+)?" + _SUMMARY_NOUN + r"(?:\s+please)?\W*$"
+        # Whole-document phrasing anywhere: "a summary of the entire report", "what is this paper about",
+        # "can I get this document summarized?", "summarizing the pdf"
+        r"|\b" + _SUMMARY_NOUN + r"\s+(?:of|for)\s+" + _WHOLE_DOCUMENT + r"\b"
+        r"|\bwhat(?:'s| is| are)\s+(?:this|the|these)\s+(?:whole\s+|entire\s+)?"
+        r"(?:document|doc|paper|file|pdf|report|text|article|contract|book|upload)s?\s+(?:about|saying|covering)\b"
+        r"|\b(?:get|have|want|need|like)\s+(?:it|this|that|" + _WHOLE_DOCUMENT + r")\s+summari[sz]ed\b"
+        r"|\bsummari[sz](?:e|ed|ing)\s+" + _WHOLE_DOCUMENT + r"\b",
+        re.IGNORECASE,
+    )
+    SECTION_QUERY_PATTERN = re.compile(r"\b(section|sections|outline|chapter|detailed|each part)\b", re.IGNORECASE)
+    
+    def __init__(
+        self,
+        name: str,
+        llm: LLM,
+        section_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        reduce_token_budget: int = 6000,
+    ):
+        super().__init__(name, llm)
+        self.section_size = section_size or int(os.getenv("SUMMARY_SECTION_CHUNKS", "4"))
+        self.max_concurrency = max_concurrency or int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+        self.reduce_token_budget = reduce_token_budget
+        self.section_summaries: List[Document] = []
+        self.document_summary: Optional[str] = None
+        self.summary_index: Optional[SummaryIndex] = None
+    
+    @property
+    def has_summaries(self) -> bool:
+        return bool(self.document_summary)
+    
+    @classmethod
+    def is_summary_query(cls, query: str) -> bool:
+        return bool(cls.SUMMARY_QUERY_PATTERN.search(query or ""))
+    
+    async def _summarize(self, prompt_template: PromptTemplate, text: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+        async with semaphore:
+            try:
+                with completion_cache_scope("summary"):
+                    result = await self.llm.acomplete(prompt_template.format(context_str=text))
+                return re.sub(r"<think>.*?</think>", "", result.text, flags=re.DOTALL).strip() or None
+            except Exception as e:
+                print(f"Warning: Summary generation failed: {e}")
+                return None
+    
+    async def _reduce(self, summaries: List[str], semaphore: asyncio.Semaphore) -> Optional[str]:
+        """Combine summaries into one, summarizing groups in parallel until they fit the reduce budget."""
+        while len(summaries) > 1:
+            groups, current, current_tokens = [], [], 0
+            for summary in summaries:
+                tokens = count_tokens(summary)
+                if current and current_tokens + tokens > self.reduce_token_budget:
+                    groups.append(current)
+                    current, current_tokens = [], 0
+                current.append(summary)
+                current_tokens += tokens
+            groups.append(current)
+            if len(groups) == 1:
+                return await self._summarize(self.DOCUMENT_SUMMARY_PROMPT, "\n\n".join(groups[0]), semaphore)
+            reduced = await asyncio.gather(*(
+                self._summarize(self.DOCUMENT_SUMMARY_PROMPT, "\n\n".join(group), semaphore) for group in groups
+            ))
+            reduced = [summary for summary in reduced if summary]
+            if len(reduced) >= len(summaries):
+                # No progress (every group failed or was a singleton). The first summary only covers
+                # part of the document, so there is no document summary rather than a misleading one.
+                print(f"Warning: Could not reduce {len(summaries)} summaries into a document summary")
+                return None
+            summaries = reduced
+        return summaries[0] if summaries else None
+    
+    async def build(self, nodes: List) -> bool:
+        """
+        Map-reduce summaries over the document's chunks.
+        
+        Consecutive chunks are grouped into sections and summarized in parallel (bounded by
+        max_concurrency); section summaries are then reduced into a document summary.
+        Returns True when a document summary was produced.
+        """
+        ordered = sorted(
+            [getattr(node, "node", node) for node in nodes],
+            key=lambda node: (getattr(node, "ref_doc_id", None) or "", getattr(node, "start_char_idx", None) or 0),
+        )
+        texts = [node.get_content() for node in ordered if node.get_content().strip()]
+        if not texts:
+            return False
+        
+        sections = [texts[i:i + self.section_size] for i in range(0, len(texts), self.section_size)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        print(f"DEBUG: Summarizing {len(texts)} chunks in {len(sections)} sections (concurrency={self.max_concurrency})")
+        section_summaries = await asyncio.gather(*(
+            self._summarize(self.SECTION_SUMMARY_PROMPT, "\n\n".join(section), semaphore) for section in sections
+        ))
+        
+        self.section_summaries = [
+            Document(text=summary, metadata={"section": i + 1, "summary_level": "section"})
+            for i, summary in enumerate(section_summaries)
+            if summary
+        ]
+        if not self.section_summaries:
+            return False
+        self.summary_index = SummaryIndex(nodes=self.section_summaries)
+        self.document_summary = await self._reduce([doc.text for doc in self.section_summaries], semaphore)
+        print(f"DEBUG: Built {len(self.section_summaries)} section summaries and a document summary")
+        return self.has_summaries
+    
+    async def execute(self, task: str, context: Dict = None) -> Dict:
+        """Answer a summary-type question from the precomputed summaries (no LLM call)."""
+        query = (context or {}).get("query", task)
+        answer = self.document_summary or ""
+        if self.summary_index is not None and self.SECTION_QUERY_PATTERN.search(query):
+            sections = self.summary_index.as_retriever().retrieve(query)
+            section_lines = [
+                f"{item.node.metadata.get('section', i + 1)}. {item.node.get_content()}"
+                for i, item in enumerate(sections)
+            ]
+            answer = f"{answer}\n\nSection summaries:\n" + "\n\n".join(section_lines)
+        return {
+            "agent": self.name,
+            "task": "summary",
+            "result": answer,
+            "summary": True,
+            "llm_tokens": 0,
+            "status": "success" if answer else "error"
         }
 
 
 class OrchestratorAgent(Agent):
     """Orchestrator agent that coordinates other agents."""
     
-    def __init__(self, name: str, llm: LLM, agents: Dict[str, Agent]):
+    def __init__(
+        self,
+        name: str,
+        llm: LLM,
+        agents: Dict[str, Agent],
+        enable_relevance: Optional[bool] = None,
+        enable_web_search: Optional[bool] = None,
+        speculative_web_search: Optional[bool] = None,
+    ):
         super().__init__(name, llm)
         self.agents = agents
+        if enable_relevance is None:
+            enable_relevance = os.getenv("RELEVANCE_ENABLED", "1") != "0"
+        if enable_web_search is None:
+            enable_web_search = os.getenv("WEB_SEARCH_ENABLED", "1") != "0"
+        if speculative_web_search is None:
+            speculative_web_search = os.getenv("SPECULATIVE_WEB_SEARCH", "0") == "1"
+        self.enable_relevance = enable_relevance
+        self.enable_web_search = enable_web_search
+        # Start web search alongside retrieval and drop it if grading finds the document sufficient
+        self.speculative_web_search = speculative_web_search
     
     async def execute(self, task: str, context: Dict = None) -> Dict:
         """Orchestrate agent execution."""
         print(f"DEBUG: Orchestrator starting execution for task: {task[:100]}...")
         context = context or {}
         context["query"] = task
+        speculative_search = None
         
         try:
+            # Summary-type questions are answered from ingest-time summaries when available
+            summary_agent = self.agents.get("summary")
+            if summary_agent and summary_agent.has_summaries and summary_agent.is_summary_query(task):
+                print("DEBUG: Answering from precomputed document summaries")
+                _emit(context, StageEvent(stage="summary", status="hit"))
+                return await summary_agent.execute(task, context)
+            
+            deadline = context.get("deadline")
+            stats = {}
+            timed_out_stages = []
+            
+            # Web search is only ever needed when relevance grading rejects nodes; in speculative
+            # mode it starts now so its latency overlaps retrieval and grading
+            web_search_agent = self.agents.get("web_search")
+            if (
+                self.speculative_web_search and self.enable_web_search and web_search_agent
+                and self.enable_relevance and self.agents.get("relevance")
+            ):
+                print("DEBUG: Starting speculative web search")
+                speculative_search = asyncio.create_task(
+                    run_stage(web_search_agent.execute(task, dict(context)), deadline, "web_search")
+                )
+            
             # Step 1: Retrieval
             print("DEBUG: Step 1 - Retrieval")
             retrieval_agent = self.agents.get("retrieval")
-            if retrieval_agent:
-                retrieval_result = await retrieval_agent.execute(task, context)
-                context["nodes"] = retrieval_result.get("result", [])
+            if context.get("nodes") is not None:
+                # Nodes were already retrieved (e.g. by a batch retrieval pass)
+                print(f"DEBUG: Using {len(context['nodes'])} pre-retrieved nodes")
+            elif retrieval_agent:
+                _emit(context, StageEvent(stage="retrieval", status="started"))
+                try:
+                    retrieval_result = await run_stage(
+                        retrieval_agent.execute(task, context), deadline, "retrieval", required=True
+                    )
+                    context["nodes"] = retrieval_result.get("result", [])
+                    _emit(context, StageEvent(stage="retrieval", status="finished", detail={"nodes": len(context["nodes"])}))
+                except asyncio.TimeoutError:
+                    print("DEBUG: Retrieval ran out of time")
+                    context["nodes"] = []
+                    timed_out_stages.append("retrieval")
+                    _emit(context, StageEvent(stage="retrieval", status="timeout"))
                 print(f"DEBUG: Retrieved {len(context.get('nodes', []))} nodes")
             
-            # Step 2: Relevance Evaluation (SKIP for now to avoid timeout)
-            print("DEBUG: Step 2 - Skipping relevance evaluation")
+            # Step 2: Relevance Evaluation (nodes are graded concurrently)
             needs_web_search = False
-            
-            # Get text from retrieved nodes
-            if context.get("nodes"):
-                context["relevant_text"] = "\n".join([node.text for node in context["nodes"][:3]])  # Limit to top 3
+            relevance_agent = self.agents.get("relevance")
+            relevance_result = None
+            if self.enable_relevance and relevance_agent and context.get("nodes"):
+                print("DEBUG: Step 2 - Relevance evaluation")
+                _emit(context, StageEvent(stage="relevance", status="started"))
+                try:
+                    relevance_result = await run_stage(relevance_agent.execute(task, context), deadline, "relevance")
+                except Exception as e:
+                    if not llm_unavailable(e):
+                        raise
+                    # Out of time, shed, or the LLM is down: ungraded nodes are still better than none
+                    if isinstance(e, asyncio.TimeoutError):
+                        reason = "ran out of time"
+                    elif isinstance(e, LLMGovernorRejected):
+                        reason = "was shed by the LLM governor"
+                    else:
+                        reason = f"failed ({type(e).__name__})"
+                    print(f"DEBUG: Relevance evaluation {reason}, using ungraded nodes")
+                    timed_out_stages.append("relevance")
+                    _emit(context, StageEvent(stage="relevance", status="timeout"))
+            if relevance_result is not None:
+                # Retrieved nodes are packed into the answer prompt's token budget by the query agent
+                context["relevant_nodes"] = relevance_result.get("result", [])
+                needs_web_search = len(context["relevant_nodes"]) < len(context["nodes"])
+                stats["relevance_graded"] = len(context["nodes"])
+                stats["relevance_kept"] = len(context["relevant_nodes"])
+                stats["relevance_llm_calls"] = relevance_result.get("grading_calls", 0)
+                stats["relevance_skipped_calls"] = relevance_result.get("skipped_calls", 0)
+                stats["relevance_auto_accepted"] = relevance_result.get("auto_accepted", 0)
+                stats["relevance_auto_rejected"] = relevance_result.get("auto_rejected", 0)
+                stats["relevance_cache_hits"] = relevance_result.get("cache_hits", 0)
+                print(f"DEBUG: {stats['relevance_kept']}/{stats['relevance_graded']} nodes judged relevant")
+                _emit(context, StageEvent(stage="relevance", status="finished", detail={
+                    "graded": stats["relevance_graded"], "kept": stats["relevance_kept"],
+                }))
             else:
-                context["relevant_text"] = "No relevant documents found."
+                print("DEBUG: Step 2 - Skipping relevance evaluation")
+                context["relevant_nodes"] = context.get("nodes", [])
+                _emit(context, StageEvent(stage="relevance", status="skipped"))
             
-            # Step 3: Web Search (SKIP - likely causing timeout)
-            print("DEBUG: Step 3 - Skipping web search")
+            # Step 3: Web Search (corrective RAG: only when some retrieved nodes were rejected)
+            if needs_web_search and self.enable_web_search and web_search_agent:
+                if speculative_search is not None:
+                    print("DEBUG: Step 3 - Web search (awaiting speculative search)")
+                    search_call = speculative_search
+                    stats["speculative_web_search"] = "used"
+                else:
+                    print("DEBUG: Step 3 - Web search")
+                    search_call = run_stage(web_search_agent.execute(task, context), deadline, "web_search")
+                _emit(context, StageEvent(stage="web_search", status="started"))
+                try:
+                    search_result = await search_call
+                    context["search_text"] = search_result.get("result", "")
+                    timed_out_stages.extend(search_result.get("timed_out_stages", []))
+                    stats["web_search"] = True
+                    stats["web_search_cache"] = search_result.get("search_cache")
+                    stats["web_search_transform"] = search_result.get("transform")
+                    stats["web_search_transform_ms"] = search_result.get("transform_ms")
+                    if "scraped_pages" in search_result:
+                        stats["web_scraped_pages"] = search_result["scraped_pages"]
+                        stats["web_scraped_chunks"] = search_result["scraped_chunks"]
+                    _emit(context, StageEvent(stage="web_search", status="finished", detail={
+                        "cache": stats["web_search_cache"], "transform": stats["web_search_transform"],
+                    }))
+                except asyncio.TimeoutError:
+                    print("DEBUG: Web search ran out of time, answering from the document only")
+                    timed_out_stages.append("web_search")
+                    _emit(context, StageEvent(stage="web_search", status="timeout"))
+            else:
+                print("DEBUG: Step 3 - Skipping web search")
+                if speculative_search is not None:
+                    print("DEBUG: Document is sufficient, cancelling speculative web search")
+                    speculative_search.cancel()
+                    stats["speculative_web_search"] = "cancelled"
+                _emit(context, StageEvent(stage="web_search", status="skipped"))
             
             # Step 4: Generate Answer
             print("DEBUG: Step 4 - Generating answer")
             query_agent = self.agents.get("query")
             if query_agent:
+                _emit(context, StageEvent(stage="answer", status="started"))
                 answer_result = await query_agent.execute(task, context)
                 print("DEBUG: Answer generated successfully")
-                return answer_result
+                timed_out_stages.extend(answer_result.get("timed_out_stages", []))
+                if timed_out_stages:
+                    stats["degraded"] = True
+                    stats["timed_out_stages"] = timed_out_stages
+                if deadline is not None:
+                    stats["elapsed_seconds"] = round(deadline.elapsed(), 3)
+                    stats["deadline_remaining_seconds"] = round(deadline.remaining(), 3)
+                return {**answer_result, **stats}
             
             print("DEBUG: No query agent available")
             return {
@@ -388,6 +1115,10 @@ class OrchestratorAgent(Agent):
                 "result": f"Error: {str(e)}",
                 "status": "error"
             }
+        finally:
+            # Never leave a speculative search running past the request (errors, cancellation)
+            if speculative_search is not None and not speculative_search.done():
+                speculative_search.cancel()
 
 
 class AgenticRAGWorkflow(Workflow):
@@ -401,6 +1132,10 @@ class AgenticRAGWorkflow(Workflow):
         index,
         firecrawl_api_key: str,
         llm: Optional[LLM] = None,
+        context_token_budget: Optional[int] = None,
+        document_hash: Optional[str] = None,
+        enable_answer_cache: Optional[bool] = None,
+        shared_answer_cache: Optional[SharedAnswerCache] = None,
         **kwargs: Any
     ) -> None:
         """Initialize the agentic workflow."""
@@ -419,6 +1154,15 @@ class AgenticRAGWorkflow(Workflow):
         super().__init__(**sanitized_kwargs)
         self.index = index
         self.firecrawl_api_key = firecrawl_api_key
+        self.embed_model = getattr(index, "_embed_model", None) or getattr(index, "embed_model", None)
+        self.document_hash = document_hash
+        
+        # Per-session semantic answer cache (re-asked questions skip retrieval + LLM)
+        if enable_answer_cache is None:
+            enable_answer_cache = os.getenv("ANSWER_CACHE_ENABLED", "1") != "0"
+        self.answer_cache = SemanticAnswerCache() if enable_answer_cache else None
+        # Cross-session exact-match cache (same document + model + normalized query + prompt version)
+        self.shared_answer_cache = shared_answer_cache
         
         if llm is not None:
             self.llm = llm
@@ -427,16 +1171,31 @@ class AgenticRAGWorkflow(Workflow):
             model = os.getenv("LLM_MODEL", "openrouter/openai/gpt-4o-mini")
             self.llm = LiteLLM(
                 model=model,
-                api_base="https://openrouter.ai/api/v1",
+                api_base=os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1"),
                 api_key=os.getenv("OPENROUTER_API_KEY"),
+                # One attempt per call (LiteLLM's default is 10 with 4-10s waits); the resilience layer retries
+                max_retries=1,
             )
+        # Every agent call goes through the completion pipeline (cache, single-flight, governor, resilience)
+        self.llm = adapt_llm(self.llm)
         
         # Initialize agents
         retriever = self.index.as_retriever()
         self.retrieval_agent = RetrievalAgent("RetrievalAgent", self.llm, retriever)
-        self.relevance_agent = RelevanceAgent("RelevanceAgent", self.llm)
-        self.web_search_agent = WebSearchAgent("WebSearchAgent", self.llm, firecrawl_api_key)
-        self.query_agent = QueryAgent("QueryAgent", self.llm)
+        # Agents with a model list configured (RELEVANCE_MODELS, QUERY_MODELS, ...) route across it
+        node_embedding = getattr(self.index, "node_embedding", None)
+        self.relevance_agent = RelevanceAgent(
+            "RelevanceAgent",
+            llm_for_agent("relevance", self.llm),
+            node_embedding=node_embedding if callable(node_embedding) else None,
+        )
+        self.web_search_agent = WebSearchAgent(
+            "WebSearchAgent", llm_for_agent("transform", self.llm), firecrawl_api_key, embed_model=self.embed_model
+        )
+        self.query_agent = QueryAgent(
+            "QueryAgent", llm_for_agent("query", self.llm), context_token_budget=context_token_budget
+        )
+        self.summary_agent = SummaryAgent("SummaryAgent", llm_for_agent("summary", self.llm))
         
         # Create orchestrator
         self.orchestrator = OrchestratorAgent(
@@ -446,13 +1205,70 @@ class AgenticRAGWorkflow(Workflow):
                 "retrieval": self.retrieval_agent,
                 "relevance": self.relevance_agent,
                 "web_search": self.web_search_agent,
-                "query": self.query_agent
+                "query": self.query_agent,
+                "summary": self.summary_agent
             }
         )
         
         from llama_index.core import Settings
         Settings.llm = self.llm
     
+    async def build_summaries(self, nodes: List) -> bool:
+        """Optional ingest-time stage: precompute section/document summaries for this session."""
+        return await self.summary_agent.build(nodes)
+    
+    @property
+    def document_summary(self) -> Optional[str]:
+        return self.summary_agent.document_summary
+    
+    def set_document_hash(self, document_hash: Optional[str]) -> None:
+        """Record that the index now holds another document version; drops answers and grades for the old one."""
+        if document_hash == self.document_hash:
+            return
+        self.document_hash = document_hash
+        self.invalidate_answer_cache()
+    
+    def invalidate_answer_cache(self) -> None:
+        """Forget cached answers and relevance verdicts (call after re-indexing this session)."""
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+        self.relevance_agent.grade_cache.clear()
+    
+    def _shared_cache_key(self, query_str: str) -> Optional[str]:
+        if self.shared_answer_cache is None or not self.document_hash:
+            return None
+        # Answers come from the query agent's model(s)
+        answer_llm = self.query_agent.llm
+        model = getattr(answer_llm, "model", None) or type(answer_llm).__name__
+        return SharedAnswerCache.make_key(self.document_hash, model, query_str, QueryAgent.PROMPT_VERSION)
+    
+    async def abatch_retrieve(self, queries: List[str], similarity_top_k: int = 5):
+        """
+        Retrieve top-k nodes for many queries at once.
+        
+        Uses the index's vectorized batch path (one embedding request, one matrix multiply)
+        when available. Returns (query_embeddings or None, per-query NodeWithScore lists).
+        """
+        batch_retrieve = getattr(self.index, "abatch_retrieve", None)
+        if callable(batch_retrieve):
+            return await batch_retrieve(queries, similarity_top_k=similarity_top_k)
+        retriever = self.index.as_retriever(similarity_top_k=similarity_top_k)
+        results = await asyncio.gather(*(retriever.aretrieve(query) for query in queries))
+        return None, list(results)
+    
+    async def _embed_query(self, query_str: str):
+        """Embed the query once so the answer cache, retriever and relevance prefilter can share it."""
+        if self.embed_model is None:
+            return None
+        if self.summary_agent.has_summaries and SummaryAgent.is_summary_query(query_str):
+            # Answered from precomputed summaries; don't spend an embedding round trip
+            return None
+        try:
+            return await coalesced_query_embedding(self.embed_model, query_str)
+        except Exception as e:
+            print(f"Warning: Query embedding failed: {e}")
+            return None
+    
     @step
     async def process_query(self, ctx: Context, ev: StartEvent) -> StopEvent:
         """Process the query through the agentic workflow."""
@@ -463,18 +1279,91 @@ class AgenticRAGWorkflow(Workflow):
                 return StopEvent(result="No query provided.")
             
             print(f"DEBUG: Processing query: {query_str}")
+            # This query's LLM calls take turns with other queries' in the governor queue
+            bind_llm_caller()
+            # With stream=True, stage progress and answer tokens are written to the event stream
+            stream = bool(ev.get("stream"))
+            emit = ctx.write_event_to_stream if stream else None
+            
+            def _respond(answer: str, metadata: Dict, streamed: bool = False) -> StopEvent:
+                if stream and not streamed:
+                    # Cached, summary and fallback answers arrive in one piece
+                    ctx.write_event_to_stream(TokenEvent(delta=answer))
+                return StopEvent(result=AgenticResponse(answer, metadata))
+            
+            shared_key = self._shared_cache_key(query_str)
+            if shared_key is not None:
+                shared_hit = await asyncio.to_thread(self.shared_answer_cache.get, shared_key)
+                if shared_hit is not None:
+                    print(f"DEBUG: Shared answer cache hit, saved {shared_hit['llm_tokens']} LLM tokens")
+                    _emit({"emit": emit}, StageEvent(stage="cache", status="hit", detail={"cache": "shared"}))
+                    return _respond(shared_hit["answer"], {
+                        **shared_hit["metadata"],
+                        "cached": True,
+                        "cache": "shared",
+                        "saved_llm_tokens": shared_hit["llm_tokens"],
+                    })
+            
+            query_embedding = ev.get("query_embedding")
+            if query_embedding is None:
+                query_embedding = await self._embed_query(query_str)
+            if query_embedding is not None and self.answer_cache is not None:
+                cached = self.answer_cache.lookup(query_embedding, document_hash=self.document_hash)
+                if cached is not None:
+                    entry, similarity = cached
+                    print(f"DEBUG: Answer cache hit (similarity={similarity:.3f}) for: {entry.query[:100]}")
+                    _emit({"emit": emit}, StageEvent(stage="cache", status="hit", detail={"cache": "semantic"}))
+                    return _respond(entry.answer, {
+                        **entry.metadata,
+                        "cached": True,
+                        "cache": "semantic",
+                        "saved_llm_tokens": entry.metadata.get("llm_tokens", 0),
+                        "cache_similarity": round(similarity, 4),
+                        "cached_query": entry.query,
+                    })
             
             # Execute orchestrator
             print("DEBUG: Executing orchestrator...")
-            result = await self.orchestrator.execute(query_str)
+            orchestrator_context = {"query_embedding": query_embedding, "deadline": ev.get("deadline"), "emit": emit}
+            if ev.get("nodes") is not None:
+                orchestrator_context["nodes"] = ev.get("nodes")
+            result = await self.orchestrator.execute(query_str, orchestrator_context)
             
             print(f"DEBUG: Orchestrator result: {result}")
             
-            return StopEvent(result=result.get("result", "No result generated."))
+            answer = result.get("result", "No result generated.")
+            # Everything except the agent bookkeeping is per-request metadata (tokens, stage stats, ...)
+            metadata = {
+                key: value
+                for key, value in result.items()
+                if key not in ("agent", "task", "result", "all_results")
+            }
+            metadata["cached"] = False
+            streamed = bool(metadata.pop("streamed", False))
+            
+            # Partial answers (a stage ran out of time or the LLM was unavailable) are never cached
+            if result.get("status") == "success" and not metadata.get("degraded"):
+                if query_embedding is not None and self.answer_cache is not None:
+                    self.answer_cache.store(
+                        query_str,
+                        query_embedding,
+                        answer,
+                        source_node_ids=result.get("source_node_ids"),
+                        metadata=metadata,
+                        document_hash=self.document_hash,
+                    )
+                if shared_key is not None:
+                    await asyncio.to_thread(
+                        self.shared_answer_cache.put,
+                        shared_key,
+                        answer,
+                        metadata,
+                        result.get("llm_tokens", 0),
+                    )
+            
+            return _respond(answer, metadata, streamed)
         except Exception as e:
             print(f"ERROR in process_query: {e}")
             import traceback
             traceback.print_exc()
             return StopEvent(result=f"Error processing query: {str(e)}")
-
-
@@ -0,0 +1,334 @@
+"""
+Answer caches for the agentic RAG workflow.
+
+SemanticAnswerCache is attached to a single session's workflow: it remembers
+(query embedding, answer, source node ids) and serves a stored answer when a new
+question is close enough in embedding space to one that was already answered.
+
+SharedAnswerCache is an exact-match cache shared by every session and worker
+process through a local SQLite file, keyed by document content hash, model,
+normalized query and prompt version.
+
+RelevanceGradeCache keeps a session's relevance verdicts per (chunk id, query)
+so follow-up questions that retrieve the same chunks are not graded again.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "128"))
+DEFAULT_ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+DEFAULT_RELEVANCE_CACHE_SIZE = int(os.getenv("RELEVANCE_CACHE_SIZE", "1024"))
+DEFAULT_SHARED_ANSWER_CACHE_TTL = int(os.getenv("SHARED_ANSWER_CACHE_TTL", str(24 * 3600)))
+
+# Expired rows are purged every this many writes
+_PURGE_EVERY_WRITES = 100
+
+
+def _normalize_vector(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@dataclass
+class CachedAnswer:
+    """A previously generated answer and what it was built from."""
+    query: str
+    answer: str
+    embedding: np.ndarray
+    source_node_ids: List[str] = field(default_factory=list)
+    metadata: Dict = field(default_factory=dict)
+    # Content hash of the document version the answer was generated from
+    document_hash: Optional[str] = None
+
+
+class SemanticAnswerCache:
+    """
+    Per-session LRU cache of answers, matched by cosine similarity of query embeddings.
+
+    Entries remember the document hash they were answered from and lookups only match
+    entries for the caller's document hash, so an answer is never served for a document
+    version it was not generated from. invalidate() drops everything.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_ANSWER_CACHE_SIZE,
+        similarity_threshold: float = DEFAULT_ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def lookup(
+        self, embedding: Sequence[float], document_hash: Optional[str] = None
+    ) -> Optional[Tuple[CachedAnswer, float]]:
+        """Return (entry, similarity) for the closest cached query above the threshold."""
+        if embedding is None:
+            return None
+        query_vector = _normalize_vector(embedding)
+        with self._lock:
+            # Answers from another document version are stale; drop them instead of matching them
+            stale = [key for key, entry in self._entries.items() if entry.document_hash != document_hash]
+            for key in stale:
+                del self._entries[key]
+            self.invalidated += len(stale)
+            if not self._entries:
+                self.misses += 1
+                return None
+            keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[key].embedding for key in keys])
+            similarities = matrix @ query_vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self.hits += 1
+            return self._entries[keys[best]], similarity
+
+    def store(
+        self,
+        query: str,
+        embedding: Sequence[float],
+        answer: str,
+        source_node_ids: Optional[List[str]] = None,
+        metadata: Optional[Dict] = None,
+        document_hash: Optional[str] = None,
+    ) -> None:
+        """Remember an answer, evicting the least recently used entry when full."""
+        if embedding is None or self.max_entries <= 0:
+            return
+        entry = CachedAnswer(
+            query=query,
+            answer=answer,
+            embedding=_normalize_vector(embedding),
+            source_node_ids=list(source_node_ids or []),
+            metadata=dict(metadata or {}),
+            document_hash=document_hash,
+        )
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Drop every cached answer (the document changed)."""
+        with self._lock:
+            self.invalidated += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidated": self.invalidated,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a question for exact-match caching (case, whitespace, trailing punctuation)."""
+    normalized = " ".join(query.lower().split())
+    return re.sub(r"[\s?.!]+$", "", normalized)
+
+
+class SharedAnswerCache:
+    """Cross-session, cross-worker exact answer cache backed by SQLite with a TTL."""
+
+    def __init__(self, path: str, ttl_seconds: int = DEFAULT_SHARED_ANSWER_CACHE_TTL):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                llm_tokens INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_expires_at ON answers (expires_at)")
+        self._conn.commit()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_llm_tokens = 0
+
+    @staticmethod
+    def make_key(document_hash: str, model: str, query: str, prompt_version: str) -> str:
+        raw = json.dumps([document_hash, model, normalize_query(query), prompt_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return {"answer", "metadata", "llm_tokens"} for a live entry, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, metadata, llm_tokens FROM answers WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_llm_tokens += row[2]
+        return {"answer": row[0], "metadata": json.loads(row[1]), "llm_tokens": row[2]}
+
+    def put(self, key: str, answer: str, metadata: Optional[Dict] = None, llm_tokens: int = 0) -> None:
+        """Store an answer along with the LLM tokens it cost to produce."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, metadata, llm_tokens, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, answer, json.dumps(metadata or {}, default=str), int(llm_tokens), now, now + self.ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % _PURGE_EVERY_WRITES == 0:
+                self._conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_llm_tokens": self.saved_llm_tokens,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_shared_caches: Dict[str, SharedAnswerCache] = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_answer_cache(path: str, ttl_seconds: int = DEFAULT_SHARED_ANSWER_CACHE_TTL) -> Optional[SharedAnswerCache]:
+    """Process-wide SharedAnswerCache for a path (None if the path is empty or unusable)."""
+    if not path:
+        return None
+    with _shared_caches_lock:
+        if path not in _shared_caches:
+            try:
+                _shared_caches[path] = SharedAnswerCache(path, ttl_seconds)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Warning: Shared answer cache disabled ({path}): {e}")
+                return None
+        return _shared_caches[path]
+
+
+class RelevanceGradeCache:
+    """
+    Bounded per-session LRU of relevance verdicts keyed by (node id, normalized query).
+    
+    With a query_similarity threshold, a verdict can also be reused for a differently
+    worded query whose embedding is at least that similar to a query graded before.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_RELEVANCE_CACHE_SIZE,
+        query_similarity: Optional[float] = None,
+        max_queries: int = 256,
+    ):
+        self.max_entries = max_entries
+        self.query_similarity = query_similarity
+        self.max_queries = max_queries
+        self._verdicts: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._query_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _similar_queries(self, embedding: Sequence[float]) -> List[str]:
+        """Normalized queries whose embedding passes the similarity threshold, best first."""
+        if self.query_similarity is None or embedding is None or not self._query_embeddings:
+            return []
+        queries = list(self._query_embeddings.keys())
+        matrix = np.stack([self._query_embeddings[q] for q in queries])
+        similarities = matrix @ _normalize_vector(embedding)
+        order = np.argsort(-similarities)
+        return [queries[i] for i in order if similarities[i] >= self.query_similarity]
+
+    def get(self, node_id: str, query: str, embedding: Optional[Sequence[float]] = None) -> Optional[str]:
+        """Cached verdict for a chunk under this (or a near-identical) query, or None."""
+        if not node_id or self.max_entries <= 0:
+            return None
+        normalized = normalize_query(query)
+        with self._lock:
+            candidates = [normalized] + [q for q in self._similar_queries(embedding) if q != normalized]
+            for candidate in candidates:
+                key = (node_id, candidate)
+                if key in self._verdicts:
+                    self._verdicts.move_to_end(key)
+                    self.hits += 1
+                    return self._verdicts[key]
+            self.misses += 1
+            return None
+
+    def set(self, node_id: str, query: str, verdict: str, embedding: Optional[Sequence[float]] = None) -> None:
+        if not node_id or self.max_entries <= 0:
+            return
+        normalized = normalize_query(query)
+        with self._lock:
+            self._verdicts[(node_id, normalized)] = verdict
+            self._verdicts.move_to_end((node_id, normalized))
+            while len(self._verdicts) > self.max_entries:
+                self._verdicts.popitem(last=False)
+            if self.query_similarity is not None and embedding is not None:
+                self._query_embeddings[normalized] = _normalize_vector(embedding)
+                self._query_embeddings.move_to_end(normalized)
+                while len(self._query_embeddings) > self.max_queries:
+                    self._query_embeddings.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verdicts.clear()
+            self._query_embeddings.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._verdicts),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -14,6 +14,9 @@ class Settings:
     allowed_origins: list[str]
     chroma_db_path: str
     require_single_worker: bool
+    shared_answer_cache_path: str
+    shared_answer_cache_ttl: int
+    enable_document_summaries: bool
 
     @property
     def is_production(self) -> bool:
@@ -25,11 +28,18 @@ def get_settings() -> Settings:
     allowed_origins = _parse_csv(os.getenv("ALLOWED_ORIGINS"))
     chroma_db_path = os.getenv("CHROMA_DB_PATH", "./chroma_db")
     require_single_worker = os.getenv("REQUIRE_SINGLE_WORKER", "1") != "0"
+    # Empty path disables the cross-session answer cache
+    shared_answer_cache_path = os.getenv("SHARED_ANSWER_CACHE_PATH", "./answer_cache.db")
+    shared_answer_cache_ttl = int(os.getenv("SHARED_ANSWER_CACHE_TTL", str(24 * 3600)))
+    enable_document_summaries = os.getenv("DOC_SUMMARIES_ENABLED", "0") == "1"
     return Settings(
         env=env,
         allowed_origins=allowed_origins,
         chroma_db_path=chroma_db_path,
         require_single_worker=require_single_worker,
+        shared_answer_cache_path=shared_answer_cache_path,
+        shared_answer_cache_ttl=shared_answer_cache_ttl,
+        enable_document_summaries=enable_document_summaries,
     )
 
 
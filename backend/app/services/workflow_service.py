@@ -4,11 +4,12 @@ Extracted from app.py without Streamlit dependencies
 """
 import os
 import sys
+import hashlib
 import tempfile
 import asyncio
 from contextlib import redirect_stdout
 import io
-from typing import Optional, Tuple
+from typing import AsyncIterator, List, Optional, Tuple
 
 # Add project root to path to import agentic_workflow and other modules
 # This file is at: backend/app/services/workflow_service.py
@@ -32,12 +33,24 @@ if project_root not in sys.path:
 # opentelemetry version conflicts at startup; see process_document and delete_vector_collection_for_session)
 from llama_index.core import Settings, StorageContext, SimpleDirectoryReader
 from llama_index.core.node_parser import TokenTextSplitter
+from llama_index.core.workflow.errors import WorkflowTimeoutError
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.litellm import LiteLLM
-from agentic_workflow import AgenticRAGWorkflow
+from agentic_workflow import AgenticRAGWorkflow, AgenticResponse, StageEvent, TokenEvent, WebSearchAgent
+from deadline import DEADLINE_GRACE_SECONDS, DEFAULT_QUERY_DEADLINE_SECONDS, MAX_DEADLINE_SECONDS, Deadline
+from answer_cache import get_shared_answer_cache
+from search_cache import get_search_cache
+from completion_cache import get_completion_cache
+from resilience import resilience_stats
+from llm_governor import get_llm_governor
+from single_flight import single_flight_stats
+from model_router import router_stats
 import pydantic_config  # noqa: F401
 from app.config import get_settings
 
+# Point at a local stand-in (scripts/stand_in_server.py) for offline benchmarks
+OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
+
 
 class WorkflowService:
     """Service for managing RAG workflows."""
@@ -69,7 +82,7 @@ class WorkflowService:
             embed_model = OpenAIEmbedding(
                 model=model_name,
                 api_key=os.getenv("OPENROUTER_API_KEY"),
-                api_base="https://openrouter.ai/api/v1",
+                api_base=OPENROUTER_API_BASE,
             )
             return embed_model
         except (ValidationError, TypeError) as e:
@@ -84,7 +97,7 @@ class WorkflowService:
                     return OpenAIEmbedding(
                         model=model_name,
                         api_key=os.getenv("OPENROUTER_API_KEY"),
-                        api_base="https://openrouter.ai/api/v1",
+                        api_base=OPENROUTER_API_BASE,
                     )
                 except Exception as e2:
                     raise e from e2
@@ -118,8 +131,10 @@ class WorkflowService:
         
         llm = LiteLLM(
             model=model,
-            api_base="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY")
+            api_base=OPENROUTER_API_BASE,
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            # One attempt per call (LiteLLM's default is 10 with 4-10s waits); the resilience layer retries
+            max_retries=1,
         )
         
         display_name = model.replace("openrouter/", "") if model.startswith("openrouter/") else model
@@ -143,6 +158,8 @@ class WorkflowService:
                 self.docstore = storage_context.docstore if storage_context else None
                 self.index_struct = None
                 self._index_struct = None
+                self._corpus = None
+                self._embeddings = None
             
             def as_retriever(self, similarity_top_k=5, **kwargs):
                 """Create a simple retriever."""
@@ -160,6 +177,60 @@ class WorkflowService:
                 retriever = self.as_retriever(**kwargs)
                 return RetrieverQueryEngine(retriever=retriever, llm=llm or Settings.llm)
             
+            def _corpus_matrix(self):
+                """Row-normalized matrix of node embeddings (built once, reused for every batch)."""
+                if self._corpus is None:
+                    import numpy as np
+                    embedded = [node for node in self._nodes if getattr(node, "embedding", None) is not None]
+                    matrix = np.asarray([node.embedding for node in embedded], dtype=np.float32)
+                    if len(embedded):
+                        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                        matrix = matrix / np.where(norms == 0, 1, norms)
+                    self._corpus = (embedded, matrix)
+                return self._corpus
+            
+            def node_embedding(self, node_id):
+                """Stored embedding of a chunk (Chroma query results don't include embeddings)."""
+                if self._embeddings is None:
+                    self._embeddings = {
+                        node.node_id: node.embedding
+                        for node in self._nodes
+                        if getattr(node, "embedding", None) is not None
+                    }
+                return self._embeddings.get(node_id)
+            
+            async def aembed_queries(self, queries):
+                """Embed all queries in one batched embedding request."""
+                # text-embedding-3/ada use the same model for queries and documents,
+                # so the batch text endpoint is equivalent to per-query embedding here.
+                return await self._embed_model.aget_text_embedding_batch(list(queries))
+            
+            def batch_retrieve_by_embedding(self, query_embeddings, similarity_top_k=5):
+                """Score every query against the corpus in one matrix multiply; per-query top-k."""
+                import numpy as np
+                from llama_index.core.schema import NodeWithScore
+                embedded, matrix = self._corpus_matrix()
+                if not embedded or not len(query_embeddings):
+                    return [[] for _ in query_embeddings]
+                queries = np.asarray(query_embeddings, dtype=np.float32)
+                norms = np.linalg.norm(queries, axis=1, keepdims=True)
+                queries = queries / np.where(norms == 0, 1, norms)
+                scores = queries @ matrix.T
+                k = min(similarity_top_k, len(embedded))
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                results = []
+                for row, candidates in enumerate(top):
+                    ranked = candidates[np.argsort(-scores[row, candidates])]
+                    results.append([
+                        NodeWithScore(node=embedded[i], score=float(scores[row, i])) for i in ranked
+                    ])
+                return results
+            
+            async def abatch_retrieve(self, queries, similarity_top_k=5):
+                """Retrieve top-k nodes for many queries; returns (query_embeddings, per-query results)."""
+                query_embeddings = await self.aembed_queries(queries)
+                return query_embeddings, self.batch_retrieve_by_embedding(query_embeddings, similarity_top_k)
+            
             @property
             def ref_doc_info(self):
                 """Return reference document info."""
@@ -174,6 +245,16 @@ class WorkflowService:
         
         return CustomVectorIndex(vector_store, storage_context, embed_model, nodes)
     
+    @staticmethod
+    def _document_hash(documents) -> str:
+        """Content hash of the loaded documents; identifies the document version for caching."""
+        digest = hashlib.sha256()
+        for document in documents:
+            text = document.get_content() if hasattr(document, "get_content") else getattr(document, "text", "")
+            digest.update(text.encode("utf-8", errors="ignore"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
     @staticmethod
     def _collection_name_for_session(session_id: str) -> str:
         # Chroma collection names should be stable and avoid special characters where possible.
@@ -214,6 +295,7 @@ class WorkflowService:
             print(f"DEBUG: Loaded {len(documents)} documents")
         except Exception as e:
             raise ValueError(f"Failed to load documents: {e}")
+        document_hash = self._document_hash(documents)
         
         settings = get_settings()
         print("🗄️ Setting up vector store...")
@@ -296,14 +378,20 @@ class WorkflowService:
         if "FIRECRAWL_API_KEY" not in os.environ:
             raise ValueError("FireCrawl API key not found in environment variables.")
         
+        shared_answer_cache = get_shared_answer_cache(
+            settings.shared_answer_cache_path, settings.shared_answer_cache_ttl
+        )
+        
         # Create workflow
         try:
             workflow = AgenticRAGWorkflow(
                 index=index,
                 firecrawl_api_key=os.environ["FIRECRAWL_API_KEY"],
                 verbose=True,
-                timeout=249,
-                llm=llm
+                timeout=MAX_DEADLINE_SECONDS + DEADLINE_GRACE_SECONDS,
+                llm=llm,
+                document_hash=document_hash,
+                shared_answer_cache=shared_answer_cache
             )
             print("DEBUG: Workflow created successfully")
         except Exception as workflow_error:
@@ -328,8 +416,10 @@ class WorkflowService:
                         index=index,
                         firecrawl_api_key=os.environ["FIRECRAWL_API_KEY"],
                         verbose=True,
-                        timeout=249,
-                        llm=llm
+                        timeout=MAX_DEADLINE_SECONDS + DEADLINE_GRACE_SECONDS,
+                        llm=llm,
+                        document_hash=document_hash,
+                        shared_answer_cache=shared_answer_cache
                     )
                     print("✅ Fixed BaseMessage validation error!")
                     print("DEBUG: Workflow created successfully after retry")
@@ -338,27 +428,172 @@ class WorkflowService:
             else:
                 raise
         
+        # Optional ingest-time stage: section + document summaries for "summarize this" queries
+        if settings.enable_document_summaries:
+            print("📝 Building document summaries...")
+            try:
+                await workflow.build_summaries(nodes)
+            except Exception as summary_error:
+                # Summaries are an optimization; queries still work through retrieval without them
+                print(f"Warning: Failed to build document summaries: {summary_error}")
+        
         print("✅ Document processing complete!")
         return workflow, collection_name
     
-    async def run_query(self, workflow, query: str) -> Tuple[any, str]:
+    @staticmethod
+    def get_metrics() -> dict:
+        """Process-wide cache/performance counters for the metrics endpoint."""
+        settings = get_settings()
+        shared_answer_cache = get_shared_answer_cache(
+            settings.shared_answer_cache_path, settings.shared_answer_cache_ttl
+        )
+        search_cache = get_search_cache()
+        completion_cache = get_completion_cache()
+        return {
+            "shared_answer_cache": shared_answer_cache.stats() if shared_answer_cache else None,
+            "search_cache": search_cache.stats() if search_cache else None,
+            "completion_cache": completion_cache.stats() if completion_cache else None,
+            "upstreams": resilience_stats(),
+            "search_query_transforms": WebSearchAgent.transform_stats(),
+            "llm_governor": get_llm_governor().stats(),
+            "single_flight": single_flight_stats(),
+            "model_routing": router_stats(),
+        }
+    
+    @staticmethod
+    def _timed_out_response(deadline: Deadline) -> AgenticResponse:
+        """Degraded response for a query that blew through its deadline entirely."""
+        return AgenticResponse(
+            response="Sorry, I couldn't answer this question in time. Please try again or rephrase it.",
+            metadata={
+                "status": "degraded",
+                "degraded": True,
+                "timed_out_stages": ["workflow"],
+                "elapsed_seconds": round(deadline.elapsed(), 3),
+                "cached": False,
+            },
+        )
+    
+    async def _run_with_deadline(self, workflow, deadline: Deadline, **run_kwargs):
+        """Run the workflow under a deadline, degrading instead of raising if it overruns."""
+        try:
+            return await asyncio.wait_for(
+                workflow.run(deadline=deadline, **run_kwargs),
+                timeout=deadline.seconds + DEADLINE_GRACE_SECONDS
+            )
+        except (asyncio.TimeoutError, WorkflowTimeoutError):
+            print(f"DEBUG: Query exceeded its {deadline.seconds}s deadline")
+            return self._timed_out_response(deadline)
+    
+    async def run_query(self, workflow, query: str, deadline_seconds: Optional[float] = None) -> Tuple[any, str]:
         """
         Run query through workflow.
         
         Args:
             workflow: AgenticRAGWorkflow instance
             query: User query string
+            deadline_seconds: Per-request deadline (defaults to QUERY_DEADLINE_SECONDS);
+                stages that run out of time are skipped and the answer is marked degraded
             
         Returns:
             Tuple of (result, logs)
         """
+        deadline = Deadline(deadline_seconds or DEFAULT_QUERY_DEADLINE_SECONDS)
         f = io.StringIO()
         with redirect_stdout(f):
-            result = await asyncio.wait_for(
-                workflow.run(query_str=query),
-                timeout=300  # 5 minutes timeout
-            )
+            result = await self._run_with_deadline(workflow, deadline, query_str=query)
         
         logs = f.getvalue()
         return result, logs
 
+    async def stream_query(
+        self, workflow, query: str, deadline_seconds: Optional[float] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Run query through workflow, yielding events as they happen.
+
+        Yields dicts with "event" and "data": "stage" (pipeline progress), "token"
+        (a piece of the answer), then one "done" (final answer and metadata) or
+        "error". Closing the generator early (client disconnect) cancels the run.
+        """
+        deadline = Deadline(deadline_seconds or DEFAULT_QUERY_DEADLINE_SECONDS)
+        handler = workflow.run(query_str=query, deadline=deadline, stream=True)
+        events = handler.stream_events().__aiter__()
+        try:
+            # Every wait for the next event counts against the deadline, so a stalled run can't
+            # hold the connection open (the timeout isn't held across yields to the client)
+            while True:
+                try:
+                    ev = await asyncio.wait_for(
+                        events.__anext__(), timeout=max(0.0, deadline.remaining() + DEADLINE_GRACE_SECONDS)
+                    )
+                except StopAsyncIteration:
+                    break
+                if isinstance(ev, StageEvent):
+                    yield {"event": "stage", "data": {"stage": ev.stage, "status": ev.status, **ev.detail}}
+                elif isinstance(ev, TokenEvent):
+                    yield {"event": "token", "data": {"delta": ev.delta}}
+            result = await asyncio.wait_for(handler, timeout=max(0.0, deadline.remaining() + DEADLINE_GRACE_SECONDS))
+        except (asyncio.TimeoutError, WorkflowTimeoutError):
+            print(f"DEBUG: Streamed query exceeded its {deadline.seconds}s deadline")
+            result = self._timed_out_response(deadline)
+        except Exception as e:
+            yield {"event": "error", "data": {"detail": f"Failed to process query: {str(e)}"}}
+            return
+        finally:
+            if not handler.done():
+                await handler.cancel_run()
+
+        metadata = getattr(result, "metadata", None) or {}
+        yield {
+            "event": "done",
+            "data": {
+                "response": result.response if hasattr(result, "response") else str(result),
+                "cached": bool(metadata.get("cached", False)),
+                "degraded": bool(metadata.get("degraded", False)),
+                "metadata": metadata or None,
+            },
+        }
+
+    async def run_batch_query(
+        self,
+        workflow,
+        queries: List[str],
+        similarity_top_k: int = 5,
+        answer: bool = True,
+        concurrency: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        Answer many questions over one document.
+        
+        All queries are embedded in a single request and scored against the session's
+        corpus in one matrix multiply; answers are then generated concurrently from the
+        pre-retrieved nodes (bounded by BATCH_QUERY_CONCURRENCY).
+        
+        Returns:
+            One dict per query with "query", "nodes" and (if answer=True) "result"/"error"
+        """
+        query_embeddings, retrieved = await workflow.abatch_retrieve(queries, similarity_top_k=similarity_top_k)
+        items = [{"query": query, "nodes": nodes} for query, nodes in zip(queries, retrieved)]
+        if not answer:
+            return items
+        
+        semaphore = asyncio.Semaphore(concurrency or int(os.getenv("BATCH_QUERY_CONCURRENCY", "4")))
+        
+        async def _answer(i: int):
+            async with semaphore:
+                run_kwargs = {"query_str": queries[i], "nodes": retrieved[i]}
+                if query_embeddings is not None:
+                    run_kwargs["query_embedding"] = query_embeddings[i]
+                # Each query gets its own deadline, starting when it gets a concurrency slot
+                return await self._run_with_deadline(workflow, Deadline(), **run_kwargs)
+        
+        with redirect_stdout(io.StringIO()):
+            answers = await asyncio.gather(*(_answer(i) for i in range(len(queries))), return_exceptions=True)
+        for item, result in zip(items, answers):
+            if isinstance(result, BaseException):
+                item["error"] = str(result) or type(result).__name__
+            else:
+                item["result"] = result
+        return items
+
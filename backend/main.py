@@ -5,10 +5,12 @@ FastAPI Backend for FireCrawl Agent RAG Application
 import os
 os.environ.setdefault("ANONYMIZED_TELEMETRY", "false")
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
+import asyncio
+import json
 import sys
 import tempfile
 import uuid
@@ -20,6 +22,7 @@ from app.config import get_settings, validate_production_env
 from app.routers.auth import router as auth_router
 from app.routers.compat import router as compat_router
 from app.routers.payments import router as payments_router
+from app.deps.auth import get_current_user
 from apex.infrastructure.email.sendgrid import SendGridEmailAdapter
 
 
@@ -99,6 +102,11 @@ except (ImportError, ModuleNotFoundError) as e:
     else:
         raise ImportError(f"Could not find workflow_service.py at {workflow_service_path}: {e}") from e
 
+from loop_monitor import get_loop_monitor, start_loop_monitor, stop_loop_monitor
+from firecrawl_client import close_firecrawl_client
+# Upper bound for client-requested deadlines (the workflow timeout is built from the same value)
+from deadline import MAX_DEADLINE_SECONDS
+
 # IMPORTANT: Prevent nest_asyncio/uvloop conflicts
 # nest_asyncio is only needed for Streamlit, not for FastAPI
 # Uvloop conflicts with nest_asyncio, so we'll use standard asyncio
@@ -116,6 +124,13 @@ async def startup():
     validate_production_env(settings)
     _ensure_ssl_cert_file()
     await init_apex_async()
+    # Opt-in (LOOP_MONITOR=1): log event-loop stalls and blocking calls made from coroutines
+    start_loop_monitor()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_firecrawl_client()
+    await stop_loop_monitor()
 
 # CORS middleware
 settings = get_settings()
@@ -164,6 +179,37 @@ async def health_check():
         }
     }
 
+@app.get("/api/metrics")
+async def metrics():
+    """Cache and performance counters for this worker."""
+    answer_caches = [
+        session_data["workflow"].answer_cache.stats()
+        for session_data in sessions.values()
+        if getattr(session_data.get("workflow"), "answer_cache", None) is not None
+    ]
+    grade_caches = [
+        session_data["workflow"].relevance_agent.grade_cache.stats()
+        for session_data in sessions.values()
+        if getattr(session_data.get("workflow"), "relevance_agent", None) is not None
+    ]
+    loop_monitor = get_loop_monitor()
+    return {
+        **WorkflowService.get_metrics(),
+        "event_loop": loop_monitor.stats() if loop_monitor else None,
+        "session_answer_caches": {
+            "sessions": len(answer_caches),
+            "hits": sum(stats["hits"] for stats in answer_caches),
+            "misses": sum(stats["misses"] for stats in answer_caches),
+            "entries": sum(stats["entries"] for stats in answer_caches),
+        },
+        "session_relevance_caches": {
+            "sessions": len(grade_caches),
+            "hits": sum(stats["hits"] for stats in grade_caches),
+            "misses": sum(stats["misses"] for stats in grade_caches),
+            "entries": sum(stats["entries"] for stats in grade_caches),
+        },
+    }
+
 @app.post("/api/upload")
 async def upload_document(file: UploadFile = File(...)):
     """
@@ -198,7 +244,9 @@ async def upload_document(file: UploadFile = File(...)):
                 "collection_name": collection_name,
                 "filename": file.filename,
                 "uploaded_at": datetime.now().isoformat(),
-                "file_size": len(content)
+                "file_size": len(content),
+                "document_hash": getattr(workflow, "document_hash", None),
+                "summary": getattr(workflow, "document_summary", None)
             }
             
             return {
@@ -215,21 +263,13 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Failed to process document: {str(e)}"
         )
 
-@app.post("/api/chat")
-async def chat(query: dict):
-    """
-    Process a chat query.
-    
-    Request body:
-        {
-            "session_id": "uuid",
-            "message": "user query"
-        }
-    """
+def _validate_chat_request(query: dict):
+    """Check a chat request body; returns (session_id, message, deadline_seconds)."""
     session_id = query.get("session_id")
     message = query.get("message")
+    deadline_seconds = query.get("deadline_seconds")
     
-    if not session_id:
+    if not session_id or not isinstance(session_id, str):
         raise HTTPException(
             status_code=400,
             detail="session_id is required"
@@ -241,25 +281,55 @@ async def chat(query: dict):
             detail="Session not found. Please upload a document first."
         )
     
-    if not message or not message.strip():
+    if not isinstance(message, str) or not message.strip():
         raise HTTPException(
             status_code=400,
             detail="message is required"
         )
     
+    if deadline_seconds is not None and (
+        isinstance(deadline_seconds, bool)
+        or not isinstance(deadline_seconds, (int, float))
+        or not 0 < deadline_seconds <= MAX_DEADLINE_SECONDS
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"deadline_seconds must be between 0 and {MAX_DEADLINE_SECONDS}"
+        )
+    
+    return session_id, message.strip(), deadline_seconds
+
+@app.post("/api/chat")
+async def chat(query: dict):
+    """
+    Process a chat query.
+    
+    Request body:
+        {
+            "session_id": "uuid",
+            "message": "user query",
+            "deadline_seconds": 60  // optional, defaults to QUERY_DEADLINE_SECONDS
+        }
+    """
+    session_id, message, deadline_seconds = _validate_chat_request(query)
+    
     try:
         # WorkflowService is already imported at module level
         workflow = sessions[session_id]["workflow"]
         workflow_service = WorkflowService()
         
         # Run workflow
-        result, logs = await workflow_service.run_query(workflow, message.strip())
+        result, logs = await workflow_service.run_query(workflow, message, deadline_seconds=deadline_seconds)
         
         response_text = result.response if hasattr(result, 'response') else str(result)
+        metadata = getattr(result, "metadata", None) or {}
         
         return {
             "response": response_text,
             "session_id": session_id,
+            "cached": bool(metadata.get("cached", False)),
+            "degraded": bool(metadata.get("degraded", False)),
+            "metadata": metadata or None,
             "logs": logs if logs else None
         }
     except Exception as e:
@@ -268,6 +338,214 @@ async def chat(query: dict):
             detail=f"Failed to process query: {str(e)}"
         )
 
+@app.post("/api/chat/stream")
+async def chat_stream(query: dict):
+    """
+    Process a chat query, streaming progress and answer tokens as server-sent events.
+    
+    Takes the same request body as /api/chat. Events:
+        event: stage  data: {"stage": "retrieval", "status": "started", ...}
+        event: token  data: {"delta": "partial answer text"}
+        event: done   data: {"response", "session_id", "cached", "degraded", "metadata"}
+        event: error  data: {"detail": "..."}
+    """
+    session_id, message, deadline_seconds = _validate_chat_request(query)
+    workflow = sessions[session_id]["workflow"]
+    
+    async def _events():
+        async for item in WorkflowService().stream_query(workflow, message, deadline_seconds=deadline_seconds):
+            if item["event"] == "done":
+                item["data"]["session_id"] = session_id
+            yield f"event: {item['event']}\ndata: {json.dumps(item['data'], default=str)}\n\n"
+    
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        # Don't let proxies buffer the stream into one response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# WebSocket chat: seconds a new connection has to authenticate, and concurrent chats per connection
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+
+@app.websocket("/api/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    """
+    Chat over one long-lived WebSocket, multiplexing sessions and concurrent questions.
+    
+    The first message must be {"type": "auth", "token": "<access token>"}; the server
+    answers {"type": "ready"}. After that:
+        {"type": "chat", "id": "c1", "session_id": "uuid", "message": "...", "deadline_seconds": 60}
+        {"type": "cancel", "id": "c1"}
+        {"type": "ping"}
+    Every server message for a chat carries its "id": "stage", "token", then one of
+    "done", "error" or "cancelled" (see API_DOCUMENTATION.md).
+    """
+    await websocket.accept()
+    try:
+        auth = await asyncio.wait_for(websocket.receive_json(), timeout=WS_AUTH_TIMEOUT_SECONDS)
+        if not isinstance(auth, dict) or auth.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="First message must be an auth message")
+        user = await get_current_user(f"Bearer {auth.get('token') or ''}")
+    except (asyncio.TimeoutError, HTTPException, ValueError) as e:
+        detail = getattr(e, "detail", None) or "Authentication timed out"
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=4401)
+        return
+    except WebSocketDisconnect:
+        return
+    
+    # Chats run concurrently; one lock keeps their messages from interleaving on the socket
+    send_lock = asyncio.Lock()
+    inflight: Dict[str, asyncio.Task] = {}
+    
+    async def send(payload: dict):
+        async with send_lock:
+            await websocket.send_json(payload)
+    
+    async def run_chat(chat_id: str, session_id: str, message: str, deadline_seconds):
+        try:
+            workflow = sessions[session_id]["workflow"]
+            async for item in WorkflowService().stream_query(workflow, message, deadline_seconds=deadline_seconds):
+                data = item["data"]
+                if item["event"] == "done":
+                    data["session_id"] = session_id
+                await send({"type": item["event"], "id": chat_id, **data})
+        except asyncio.CancelledError:
+            # stream_query has already cancelled the workflow run
+            try:
+                await send({"type": "cancelled", "id": chat_id})
+            except Exception:
+                pass
+        except Exception as e:
+            print(f"Warning: WebSocket chat {chat_id} failed: {e}")
+            # Free the id first so the client can reuse it as soon as it sees the error
+            inflight.pop(chat_id, None)
+            try:
+                await send({"type": "error", "id": chat_id, "detail": f"Failed to process query: {str(e)}"})
+            except Exception:
+                pass
+        finally:
+            inflight.pop(chat_id, None)
+    
+    await send({"type": "ready", "user_id": str(getattr(user, "id", ""))})
+    try:
+        while True:
+            try:
+                msg = await websocket.receive_json()
+            except (ValueError, KeyError, TypeError):
+                # Not JSON, or a binary frame
+                await send({"type": "error", "id": None, "detail": "Messages must be JSON text"})
+                continue
+            kind = msg.get("type") if isinstance(msg, dict) else None
+            chat_id = str(msg.get("id") or "") if kind else ""
+            if kind == "ping":
+                await send({"type": "pong"})
+            elif kind == "cancel":
+                task = inflight.get(chat_id)
+                if task is not None:
+                    task.cancel()
+            elif kind == "chat":
+                if not chat_id or chat_id in inflight:
+                    await send({"type": "error", "id": chat_id or None, "detail": "chat messages need a unique id"})
+                    continue
+                if len(inflight) >= WS_MAX_INFLIGHT:
+                    await send({"type": "error", "id": chat_id, "detail": f"At most {WS_MAX_INFLIGHT} chats can run at once"})
+                    continue
+                try:
+                    session_id, message, deadline_seconds = _validate_chat_request(msg)
+                except HTTPException as e:
+                    await send({"type": "error", "id": chat_id, "detail": e.detail})
+                    continue
+                inflight[chat_id] = asyncio.create_task(run_chat(chat_id, session_id, message, deadline_seconds))
+            else:
+                await send({"type": "error", "id": chat_id or None, "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is listening any more; stop the LLM calls
+        for task in list(inflight.values()):
+            task.cancel()
+
+MAX_BATCH_QUERIES = 100
+
+@app.post("/api/chat/batch")
+async def chat_batch(query: dict):
+    """
+    Answer (or just retrieve for) a list of questions over one session's document.
+    
+    Request body:
+        {
+            "session_id": "uuid",
+            "queries": ["question 1", "question 2"],
+            "top_k": 5,            (optional)
+            "retrieve_only": false (optional; skip answer generation)
+        }
+    """
+    session_id = query.get("session_id")
+    queries = query.get("queries")
+    
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    
+    if session_id not in sessions:
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found. Please upload a document first."
+        )
+    
+    if not isinstance(queries, list) or not queries:
+        raise HTTPException(status_code=400, detail="queries must be a non-empty list")
+    
+    queries = [q.strip() for q in queries if isinstance(q, str) and q.strip()]
+    if not queries:
+        raise HTTPException(status_code=400, detail="queries must contain at least one question")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    
+    try:
+        top_k = int(query.get("top_k", 5))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="top_k must be an integer")
+    
+    try:
+        workflow = sessions[session_id]["workflow"]
+        workflow_service = WorkflowService()
+        items = await workflow_service.run_batch_query(
+            workflow,
+            queries,
+            similarity_top_k=max(1, top_k),
+            answer=not query.get("retrieve_only", False),
+        )
+        
+        results = []
+        for item in items:
+            entry = {
+                "query": item["query"],
+                "nodes": [
+                    {"node_id": n.node.node_id, "score": n.score, "text": n.node.get_content()}
+                    for n in item["nodes"]
+                ],
+            }
+            if "result" in item:
+                result = item["result"]
+                metadata = getattr(result, "metadata", None) or {}
+                entry["response"] = result.response if hasattr(result, 'response') else str(result)
+                entry["cached"] = bool(metadata.get("cached", False))
+                entry["degraded"] = bool(metadata.get("degraded", False))
+                entry["metadata"] = metadata or None
+            if "error" in item:
+                entry["error"] = item["error"]
+            results.append(entry)
+        
+        return {"session_id": session_id, "results": results, "count": len(results)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process batch query: {str(e)}"
+        )
+
 @app.get("/api/sessions/{session_id}")
 async def get_session(session_id: str):
     """Get session information."""
@@ -0,0 +1,199 @@
+"""
+Persistent prompt -> completion cache for deterministic LLM calls.
+
+Completions are stored in SQLite keyed by model, prompt and sampling parameters, so
+repeated grading / rewriting work costs no tokens, across sessions, workers and
+restarts. Caching is opt-in per agent: only calls made inside
+completion_cache_scope(agent) for an agent listed in COMPLETION_CACHE_AGENTS
+(default: relevance grading and query transforms) are looked up or stored, so
+free-form answers are never replayed. A scope can pass a validator so output the
+caller can't use (e.g. unparseable batch grades) is neither stored nor replayed.
+Entries expire after
+COMPLETION_CACHE_TTL and the least recently used ones are evicted beyond
+COMPLETION_CACHE_MAX_ENTRIES.
+
+Any object with the same get/put/stats methods can be plugged in with
+set_completion_cache().
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+DEFAULT_COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", "./completion_cache.db")
+DEFAULT_COMPLETION_CACHE_TTL = int(os.getenv("COMPLETION_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "50000"))
+# Agents whose prompts are deterministic enough to replay: relevance, transform, summary
+COMPLETION_CACHE_AGENTS = frozenset(
+    agent.strip() for agent in os.getenv("COMPLETION_CACHE_AGENTS", "relevance,transform").split(",") if agent.strip()
+)
+
+# Expired and excess entries are purged every this many writes (sooner for small caches)
+_PURGE_EVERY_WRITES = 100
+# Eviction trims down to this share of max_entries, so it doesn't run on every write
+_EVICT_TO = 0.9
+
+_cache_scope: contextvars.ContextVar[bool] = contextvars.ContextVar("completion_cache_scope", default=False)
+_cache_validator: contextvars.ContextVar[Optional[Callable[[str], bool]]] = contextvars.ContextVar(
+    "completion_cache_validator", default=None
+)
+
+
+@contextmanager
+def completion_cache_scope(agent: str, validate: Optional[Callable[[str], bool]] = None):
+    """
+    LLM calls made in this block (and tasks started from it) use the cache if `agent` opted in.
+
+    `validate(text)` must return True for a completion to be stored or served from the cache.
+    """
+    token = _cache_scope.set(agent in COMPLETION_CACHE_AGENTS)
+    validator_token = _cache_validator.set(validate)
+    try:
+        yield
+    finally:
+        _cache_validator.reset(validator_token)
+        _cache_scope.reset(token)
+
+
+def completion_cache_active() -> bool:
+    return _cache_scope.get()
+
+
+def completion_cache_validator() -> Optional[Callable[[str], bool]]:
+    return _cache_validator.get()
+
+
+class CompletionCache:
+    """SQLite-backed completion store with a TTL and least-recently-used eviction."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: int = DEFAULT_COMPLETION_CACHE_TTL,
+        max_entries: int = DEFAULT_COMPLETION_CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                llm_tokens INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_expires_at ON completions (expires_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used_at ON completions (last_used_at)")
+        self._conn.commit()
+        self._writes = 0
+        self._purge_every = max(1, min(_PURGE_EVERY_WRITES, max_entries // 10))
+        self.hits = 0
+        self.misses = 0
+        self.saved_llm_tokens = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return {"text", "llm_tokens"} for a live entry, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, llm_tokens FROM completions WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self.saved_llm_tokens += row[1]
+        return {"text": row[0], "llm_tokens": row[1]}
+
+    def put(self, key: str, model: str, text: str, llm_tokens: int = 0) -> None:
+        """Store a completion along with the LLM tokens it cost."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, text, llm_tokens, created_at, expires_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, text, int(llm_tokens), now, now + self.ttl_seconds, now),
+            )
+            self._writes += 1
+            if self._writes % self._purge_every == 0:
+                self._purge(now)
+            self._conn.commit()
+
+    def _purge(self, now: float) -> None:
+        self._conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        if count > self.max_entries:
+            excess = count - int(self.max_entries * _EVICT_TO)
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_used_at LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_llm_tokens": self.saved_llm_tokens,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_completion_cache = None
+_completion_cache_loaded = False
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """The process-wide completion cache (None if COMPLETION_CACHE_PATH is empty or unusable)."""
+    global _completion_cache, _completion_cache_loaded
+    if _completion_cache_loaded:
+        return _completion_cache
+    with _completion_cache_lock:
+        if not _completion_cache_loaded:
+            if DEFAULT_COMPLETION_CACHE_PATH:
+                try:
+                    _completion_cache = CompletionCache(DEFAULT_COMPLETION_CACHE_PATH)
+                except (sqlite3.Error, OSError) as e:
+                    print(f"Warning: Completion cache disabled ({DEFAULT_COMPLETION_CACHE_PATH}): {e}")
+            _completion_cache_loaded = True
+    return _completion_cache
+
+
+def set_completion_cache(cache) -> None:
+    """Replace the process-wide completion cache (any object with get/put/stats; None disables it)."""
+    global _completion_cache, _completion_cache_loaded
+    with _completion_cache_lock:
+        _completion_cache = cache
+        _completion_cache_loaded = True
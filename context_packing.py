@@ -0,0 +1,187 @@
+"""
+Token-budgeted context packing for answer generation.
+
+Retrieved chunks are merged when they are adjacent in the source document,
+overlapping text is dropped, and the result is packed into a fixed token
+budget in relevance order so prompt size (and time-to-first-token) stays bounded.
+"""
+import os
+from dataclasses import dataclass, field, replace
+from typing import List, Optional
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+DEFAULT_TOKEN_ENCODING = os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+
+# Don't bother squeezing in a truncated chunk when less than this much budget is left
+MIN_TRUNCATED_CHUNK_TOKENS = 64
+
+_encodings = {}
+
+
+def _get_encoding(name: str = DEFAULT_TOKEN_ENCODING):
+    """Load (and cache) a tiktoken encoding; returns None if tiktoken is unavailable."""
+    if name not in _encodings:
+        try:
+            import tiktoken
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            print(f"Warning: tiktoken encoding '{name}' unavailable, estimating tokens: {e}")
+            _encodings[name] = None
+    return _encodings[name]
+
+
+def count_tokens(text: str, encoding: str = DEFAULT_TOKEN_ENCODING) -> int:
+    """Count tokens in text (falls back to a ~4 chars/token estimate without tiktoken)."""
+    if not text:
+        return 0
+    enc = _get_encoding(encoding)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding: str = DEFAULT_TOKEN_ENCODING) -> str:
+    """Return the longest prefix of text that fits in max_tokens."""
+    if max_tokens <= 0:
+        return ""
+    enc = _get_encoding(encoding)
+    if enc is None:
+        return text[: max_tokens * 4]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
+
+@dataclass
+class ContextChunk:
+    """A piece of candidate context with its relevance score and source position."""
+    text: str
+    score: Optional[float] = None
+    source_id: Optional[str] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+    node_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PackedContext:
+    """Result of packing: the context string plus accounting for the request."""
+    text: str
+    tokens: int
+    budget: int
+    chunks_used: int
+    chunks_total: int
+    truncated: bool = False
+    node_ids: List[str] = field(default_factory=list)
+
+
+def chunks_from_nodes(nodes) -> List[ContextChunk]:
+    """Convert retrieved NodeWithScore objects into ContextChunks."""
+    chunks = []
+    for item in nodes or []:
+        node = getattr(item, "node", item)
+        text = node.get_content() if hasattr(node, "get_content") else getattr(node, "text", "")
+        if not text or not text.strip():
+            continue
+        chunks.append(ContextChunk(
+            text=text,
+            score=getattr(item, "score", None),
+            source_id=getattr(node, "ref_doc_id", None),
+            start=getattr(node, "start_char_idx", None),
+            end=getattr(node, "end_char_idx", None),
+            node_ids=[node.node_id] if getattr(node, "node_id", None) else [],
+        ))
+    return chunks
+
+
+def _score_key(chunk: ContextChunk) -> float:
+    return chunk.score if chunk.score is not None else float("-inf")
+
+
+def merge_adjacent_chunks(chunks: List[ContextChunk]) -> List[ContextChunk]:
+    """
+    Merge chunks that touch or overlap in the same source document, dropping the
+    overlapping characters. Chunks without position info are deduplicated by text.
+    """
+    positioned = {}
+    loose = []
+    for chunk in chunks:
+        if chunk.source_id is not None and chunk.start is not None and chunk.end is not None:
+            positioned.setdefault(chunk.source_id, []).append(chunk)
+        else:
+            loose.append(chunk)
+
+    merged = []
+    for source_id, group in positioned.items():
+        group.sort(key=lambda c: c.start)
+        current = None
+        for chunk in group:
+            if current is None:
+                current = replace(chunk, node_ids=list(chunk.node_ids))
+                continue
+            if chunk.start <= current.end:
+                overlap = current.end - chunk.start
+                if chunk.end > current.end:
+                    current.text += chunk.text[overlap:]
+                    current.end = chunk.end
+                current.score = max(_score_key(current), _score_key(chunk))
+                current.node_ids.extend(chunk.node_ids)
+            else:
+                merged.append(current)
+                current = replace(chunk, node_ids=list(chunk.node_ids))
+        if current is not None:
+            merged.append(current)
+
+    # Deduplicate chunks without positions: drop exact repeats and text already contained elsewhere
+    for chunk in sorted(loose, key=_score_key, reverse=True):
+        normalized = " ".join(chunk.text.split())
+        if any(normalized in " ".join(existing.text.split()) for existing in merged):
+            continue
+        merged.append(chunk)
+
+    return merged
+
+
+def pack_context(
+    chunks: List[ContextChunk],
+    token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    separator: str = "\n\n",
+    encoding: str = DEFAULT_TOKEN_ENCODING,
+) -> PackedContext:
+    """Merge, dedupe and pack chunks into the token budget, most relevant first."""
+    candidates = [c for c in merge_adjacent_chunks(chunks) if c.text.strip()]
+    candidates.sort(key=_score_key, reverse=True)
+
+    separator_tokens = count_tokens(separator, encoding)
+    parts = []
+    node_ids = []
+    used = 0
+    truncated = False
+    for chunk in candidates:
+        cost = count_tokens(chunk.text, encoding) + (separator_tokens if parts else 0)
+        if used + cost <= token_budget:
+            parts.append(chunk.text)
+            node_ids.extend(chunk.node_ids)
+            used += cost
+            continue
+        truncated = True
+        remaining = token_budget - used - (separator_tokens if parts else 0)
+        if remaining >= MIN_TRUNCATED_CHUNK_TOKENS:
+            # Fill the rest of the budget with the head of this chunk and stop
+            text = truncate_to_tokens(chunk.text, remaining, encoding)
+            parts.append(text)
+            node_ids.extend(chunk.node_ids)
+            used += count_tokens(text, encoding) + (separator_tokens if len(parts) > 1 else 0)
+            break
+        # Too little room to be useful; a smaller, less relevant chunk may still fit whole
+
+    return PackedContext(
+        text=separator.join(parts),
+        tokens=used,
+        budget=token_budget,
+        chunks_used=len(parts),
+        chunks_total=len(candidates),
+        truncated=truncated,
+        node_ids=node_ids,
+    )
@@ -0,0 +1,95 @@
+"""
+Per-request deadlines for the agentic workflow.
+
+A Deadline is created when a request arrives and passed through the orchestrator
+to every agent. Optional stages (relevance grading, query transform, web search)
+get their own time budget, capped so that enough time is always left to generate
+the answer; a stage that runs out of budget is cancelled and the answer is
+generated from whatever finished.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_QUERY_DEADLINE_SECONDS = float(os.getenv("QUERY_DEADLINE_SECONDS", "240"))
+# Upper bound for client-requested deadlines; the workflow's own timeout is built from it
+MAX_DEADLINE_SECONDS = max(300.0, DEFAULT_QUERY_DEADLINE_SECONDS)
+# Extra time the workflow gets past its deadline to hand back a degraded answer
+DEADLINE_GRACE_SECONDS = 10
+DEFAULT_ANSWER_RESERVE_SECONDS = float(os.getenv("ANSWER_RESERVE_SECONDS", "30"))
+# Short deadlines keep back at most this share of the deadline for the answer, so optional
+# stages still get time (a flat 30s reserve would leave nothing for a 20s deadline)
+DEFAULT_ANSWER_RESERVE_FRACTION = float(os.getenv("ANSWER_RESERVE_FRACTION", "0.5"))
+DEFAULT_STAGE_BUDGETS: Dict[str, float] = {
+    "retrieval": float(os.getenv("STAGE_BUDGET_RETRIEVAL", "20")),
+    "relevance": float(os.getenv("STAGE_BUDGET_RELEVANCE", "20")),
+    "transform": float(os.getenv("STAGE_BUDGET_TRANSFORM", "8")),
+    "web_search": float(os.getenv("STAGE_BUDGET_WEB_SEARCH", "30")),
+    # Scrape-and-embed of top results; runs inside the web search stage
+    "web_scrape": float(os.getenv("STAGE_BUDGET_WEB_SCRAPE", "15")),
+}
+
+
+class Deadline:
+    """Absolute deadline for one request, with per-stage time budgets."""
+
+    def __init__(
+        self,
+        seconds: float = DEFAULT_QUERY_DEADLINE_SECONDS,
+        stage_budgets: Optional[Dict[str, float]] = None,
+        answer_reserve: float = DEFAULT_ANSWER_RESERVE_SECONDS,
+        answer_reserve_fraction: float = DEFAULT_ANSWER_RESERVE_FRACTION,
+    ):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        self.stage_budgets = {**DEFAULT_STAGE_BUDGETS, **(stage_budgets or {})}
+        self.answer_reserve = min(answer_reserve, answer_reserve_fraction * seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget_for(self, stage: str, required: bool = False) -> float:
+        """
+        Seconds a stage may run.
+
+        Optional stages get min(stage budget, remaining time minus the answer reserve);
+        required stages (retrieval, answer generation) may use all remaining time.
+        """
+        available = self.remaining() if required else self.remaining() - self.answer_reserve
+        limit = self.stage_budgets.get(stage)
+        if limit is not None:
+            available = min(available, limit)
+        return max(0.0, available)
+
+
+async def run_stage(
+    awaitable: Awaitable[T],
+    deadline: Optional[Deadline],
+    stage: str,
+    required: bool = False,
+) -> T:
+    """
+    Await a stage within its budget.
+
+    Raises asyncio.TimeoutError (after cancelling the stage) when the budget runs out.
+    Without a deadline the stage simply runs to completion.
+    """
+    if deadline is None:
+        return await awaitable
+    budget = deadline.budget_for(stage, required=required)
+    if budget <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise asyncio.TimeoutError(f"No time left for stage '{stage}'")
+    return await asyncio.wait_for(awaitable, timeout=budget)
@@ -0,0 +1,106 @@
+"""
+Process-wide async HTTP client for the FireCrawl API.
+
+One httpx.AsyncClient is shared by every WebSearchAgent in the process, so searches
+reuse pooled keep-alive connections (HTTP/2 when the `h2` package is installed)
+instead of opening a new TLS connection per request, and never block the event loop.
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+
+import httpx
+
+from resilience import get_endpoint
+
+FIRECRAWL_API_URL = os.getenv("FIRECRAWL_API_URL", "https://api.firecrawl.dev").rstrip("/")
+FIRECRAWL_MAX_CONNECTIONS = int(os.getenv("FIRECRAWL_MAX_CONNECTIONS", "20"))
+FIRECRAWL_MAX_KEEPALIVE = int(os.getenv("FIRECRAWL_MAX_KEEPALIVE", "10"))
+FIRECRAWL_CONNECT_TIMEOUT = float(os.getenv("FIRECRAWL_CONNECT_TIMEOUT", "5"))
+FIRECRAWL_HTTP2 = os.getenv("FIRECRAWL_HTTP2", "1") == "1"
+# Every hedge is a second billed search, so hedging searches is opt-in
+SEARCH_HEDGING = os.getenv("SEARCH_HEDGING", "0") == "1"
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_firecrawl_client() -> httpx.AsyncClient:
+    """Shared client for the running event loop (created on first use)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # Pooled connections belong to the loop that opened them; scripts that call
+    # asyncio.run() more than once get a fresh client per loop
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            base_url=FIRECRAWL_API_URL,
+            http2=FIRECRAWL_HTTP2 and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=FIRECRAWL_MAX_CONNECTIONS,
+                max_keepalive_connections=FIRECRAWL_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(60.0, connect=FIRECRAWL_CONNECT_TIMEOUT),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_firecrawl_client() -> None:
+    """Close the shared client (on application shutdown)."""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def firecrawl_search(api_key: str, query: str, limit: int = 5, timeout: float = 60) -> Dict:
+    """
+    POST /v1/search and return the decoded JSON body.
+
+    `timeout` bounds each attempt (and is passed to FireCrawl as its own search
+    timeout). Calls go through the "firecrawl_search" resilience endpoint; raises
+    httpx.HTTPError on transport or HTTP status errors and CircuitOpenError while
+    the breaker is open.
+    """
+    async def _search() -> Dict:
+        client = get_firecrawl_client()
+        response = await client.post(
+            "/v1/search",
+            json={"query": query, "limit": limit, "timeout": int(timeout * 1000)},
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=min(timeout, FIRECRAWL_CONNECT_TIMEOUT)),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    # Searches are idempotent, so slow ones can be hedged (at the cost of a second billed search)
+    return await get_endpoint("firecrawl_search", hedge=SEARCH_HEDGING).call(_search)
+
+
+async def firecrawl_scrape(api_key: str, url: str, timeout: float = 30) -> str:
+    """POST /v1/scrape for one page and return its main content as markdown ("" if none)."""
+    async def _scrape() -> Dict:
+        client = get_firecrawl_client()
+        response = await client.post(
+            "/v1/scrape",
+            json={"url": url, "formats": ["markdown"], "onlyMainContent": True, "timeout": int(timeout * 1000)},
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=min(timeout, FIRECRAWL_CONNECT_TIMEOUT)),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    # Scrapes are billed per page; retry them, but don't double them up with hedges
+    data = await get_endpoint("firecrawl_scrape", hedge=False).call(_scrape)
+    if not data.get("success"):
+        return ""
+    return (data.get("data") or {}).get("markdown") or ""
@@ -1,6 +1,6 @@
 import { Loader2, Send } from 'lucide-react';
-import { useLayoutEffect, useRef, useState } from 'react';
-import { sendMessage } from '../services/api';
+import { useEffect, useLayoutEffect, useRef, useState } from 'react';
+import { ChatHandle, ChatSocket, StageUpdate, StreamHandlers, streamMessage } from '../services/api';
 import { Message } from './DashboardLayout';
 import MessageBubble from './MessageBubble';
 import ProcessDetails from './ProcessDetails';
@@ -25,7 +25,47 @@ export default function ChatInterface({
   setWorkflowLogs,
 }: ChatInterfaceProps) {
   const [input, setInput] = useState('');
+  const [stage, setStage] = useState<string | null>(null);
+  const [streaming, setStreaming] = useState(false);
   const containerRef = useRef<HTMLDivElement>(null);
+  const abortRef = useRef<AbortController | null>(null);
+  // One WebSocket carries every turn; the SSE endpoint is the fallback when it can't connect
+  const socketRef = useRef<ChatSocket | null>(null);
+  const turnRef = useRef<ChatHandle | null>(null);
+
+  // Stop generation on the server when the chat goes away mid-answer
+  useEffect(
+    () => () => {
+      turnRef.current?.cancel();
+      abortRef.current?.abort();
+      socketRef.current?.close();
+    },
+    []
+  );
+
+  const askOverSocket = async (question: string, handlers: StreamHandlers): Promise<void> => {
+    if (!socketRef.current) socketRef.current = new ChatSocket();
+    let settle: () => void = () => {};
+    const finished = new Promise<void>((resolve) => {
+      settle = resolve;
+    });
+    turnRef.current = await socketRef.current.send(sessionId, question, {
+      ...handlers,
+      onDone: (response) => {
+        handlers.onDone?.(response);
+        settle();
+      },
+      onError: (detail) => {
+        handlers.onError?.(detail);
+        settle();
+      },
+      onCancelled: () => {
+        handlers.onCancelled?.();
+        settle();
+      },
+    });
+    await finished;
+  };
 
   useLayoutEffect(() => {
     if (containerRef.current) {
@@ -49,32 +89,47 @@ export default function ChatInterface({
     setInput('');
     setIsProcessing(true);
 
-    try {
-      const response = await sendMessage(sessionId, input.trim());
+    const question = input.trim();
+    const controller = new AbortController();
+    abortRef.current = controller;
+    let answer = '';
+    const showAnswer = (content: string) =>
+      setMessages([...newMessages, { role: 'assistant', content, logIndex: userMessage.logIndex }]);
+    const showError = (detail: string) =>
+      setMessages([...newMessages, { role: 'assistant', content: detail || 'Failed to process request' }]);
+
+    const handlers: StreamHandlers = {
+      onStage: (update: StageUpdate) => setStage(update.stage),
+      onToken: (delta) => {
+        answer += delta;
+        setStreaming(true);
+        showAnswer(answer);
+      },
+      onDone: (response) => {
+        if (response.logs) {
+          setWorkflowLogs([...workflowLogs, response.logs]);
+        }
+        showAnswer(response.response);
+      },
+      onError: showError,
+    };
 
-      if (response.logs) {
-        setWorkflowLogs([...workflowLogs, response.logs]);
+    try {
+      try {
+        await askOverSocket(question, handlers);
+      } catch {
+        // The socket couldn't connect (e.g. a proxy without WebSocket support): stream over HTTP
+        await streamMessage(sessionId, question, handlers, controller.signal);
       }
-
-      const assistantMessage: Message = {
-        role: 'assistant',
-        content: response.response,
-        logIndex: userMessage.logIndex,
-      };
-
-      setMessages([...newMessages, assistantMessage]);
     } catch (error: any) {
-      setMessages([
-        ...newMessages,
-        {
-          role: 'assistant',
-          content:
-            error.response?.data?.detail ||
-            error.message ||
-            'Failed to process request',
-        },
-      ]);
+      if (error?.name !== 'AbortError') {
+        showError(error.message);
+      }
     } finally {
+      turnRef.current = null;
+      abortRef.current = null;
+      setStage(null);
+      setStreaming(false);
       setIsProcessing(false);
     }
   };
@@ -119,10 +174,10 @@ export default function ChatInterface({
 
 
 
-        {isProcessing && (
+        {isProcessing && !streaming && (
           <div className="flex items-center gap-2 text-gray-400">
             <Loader2 className="h-5 w-5 animate-spin text-blue-500" />
-            🤔 Thinking...
+            🤔 Thinking...{stage ? ` (${stage.replace('_', ' ')})` : ''}
           </div>
         )}
       </div>
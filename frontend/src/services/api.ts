@@ -62,9 +62,34 @@ export interface UploadResponse {
   uploaded_at: string;
 }
 
+export interface ChatMetadata {
+  status?: string;
+  context_tokens?: number;
+  context_token_budget?: number;
+  context_chunks?: number;
+  context_chunks_available?: number;
+  context_truncated?: boolean;
+  prompt_tokens?: number;
+  source_node_ids?: string[];
+  completion_tokens?: number;
+  llm_tokens?: number;
+  cached?: boolean;
+  cache?: 'shared' | 'semantic';
+  saved_llm_tokens?: number;
+  cache_similarity?: number;
+  cached_query?: string;
+  degraded?: boolean;
+  timed_out_stages?: string[];
+  elapsed_seconds?: number;
+  deadline_remaining_seconds?: number;
+}
+
 export interface ChatResponse {
   response: string;
   session_id: string;
+  cached?: boolean;
+  degraded?: boolean;
+  metadata?: ChatMetadata | null;
   logs?: string | null;
 }
 
@@ -73,6 +98,7 @@ export interface SessionInfo {
   filename: string;
   uploaded_at: string;
   file_size?: number;
+  summary?: string | null;
 }
 
 export const uploadDocument = async (formData: FormData): Promise<UploadResponse> => {
@@ -92,6 +118,160 @@ export const sendMessage = async (sessionId: string, message: string): Promise<C
   return response.data;
 };
 
+export interface StageUpdate {
+  stage: string;
+  status: 'started' | 'finished' | 'skipped' | 'timeout' | 'hit';
+  [detail: string]: unknown;
+}
+
+export interface StreamHandlers {
+  onStage?: (update: StageUpdate) => void;
+  onToken?: (delta: string) => void;
+  onDone?: (response: ChatResponse) => void;
+  onError?: (detail: string) => void;
+  // The chat was cancelled (WebSocket only) and no done/error will follow
+  onCancelled?: () => void;
+}
+
+// Streams /api/chat/stream (server-sent events over a POST, so EventSource can't be used).
+// Abort the signal to stop generation on the server as well.
+export const streamMessage = async (
+  sessionId: string,
+  message: string,
+  handlers: StreamHandlers,
+  signal?: AbortSignal
+): Promise<void> => {
+  const token = localStorage.getItem('access_token');
+  const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify({ session_id: sessionId, message }),
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    const body = await response.json().catch(() => null);
+    handlers.onError?.(body?.detail ?? `Request failed with status ${response.status}`);
+    return;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let data = '';
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === 'stage') handlers.onStage?.(payload as StageUpdate);
+      else if (event === 'token') handlers.onToken?.(payload.delta);
+      else if (event === 'done') handlers.onDone?.(payload as ChatResponse);
+      else if (event === 'error') handlers.onError?.(payload.detail);
+    }
+  }
+};
+
+const wsUrl = (path: string): string => {
+  if (!API_BASE_URL) {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    return `${protocol}//${window.location.host}${path}`;
+  }
+  return `${API_BASE_URL.replace(/^http/, 'ws')}${path}`;
+};
+
+export interface ChatHandle {
+  id: string;
+  cancel: () => void;
+}
+
+// One authenticated WebSocket shared by every chat turn (any number of sessions).
+// Connects lazily on the first send and reconnects on the next send after a close.
+export class ChatSocket {
+  private socket: WebSocket | null = null;
+  private ready: Promise<WebSocket> | null = null;
+  private handlers = new Map<string, StreamHandlers>();
+  private pingTimer: ReturnType<typeof setInterval> | null = null;
+  private nextId = 0;
+
+  private connect(): Promise<WebSocket> {
+    if (this.ready) return this.ready;
+    this.ready = new Promise((resolve, reject) => {
+      const socket = new WebSocket(wsUrl('/api/chat/ws'));
+      socket.onopen = () => {
+        socket.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('access_token') ?? '' }));
+      };
+      socket.onmessage = (event) => {
+        const msg = JSON.parse(event.data);
+        if (msg.type === 'ready') {
+          this.socket = socket;
+          // Keep proxies from closing an idle connection
+          this.pingTimer = setInterval(() => socket.send(JSON.stringify({ type: 'ping' })), 30000);
+          resolve(socket);
+          return;
+        }
+        if (msg.type === 'error' && !msg.id) {
+          reject(new Error(msg.detail));
+          return;
+        }
+        const handlers = this.handlers.get(msg.id);
+        if (!handlers) return;
+        const { type } = msg;
+        if (type === 'stage') handlers.onStage?.(msg as StageUpdate);
+        else if (type === 'token') handlers.onToken?.(msg.delta);
+        else if (type === 'done') handlers.onDone?.(msg as ChatResponse);
+        else if (type === 'error') handlers.onError?.(msg.detail);
+        else if (type === 'cancelled') handlers.onCancelled?.();
+        if (type === 'done' || type === 'error' || type === 'cancelled') this.handlers.delete(msg.id);
+      };
+      socket.onclose = () => {
+        if (this.pingTimer) clearInterval(this.pingTimer);
+        this.pingTimer = null;
+        this.socket = null;
+        this.ready = null;
+        reject(new Error('Chat connection closed'));
+        this.handlers.forEach((handlers) => handlers.onError?.('Chat connection closed'));
+        this.handlers.clear();
+      };
+    });
+    return this.ready;
+  }
+
+  async send(sessionId: string, message: string, handlers: StreamHandlers): Promise<ChatHandle> {
+    const socket = await this.connect();
+    const id = `c${++this.nextId}`;
+    this.handlers.set(id, handlers);
+    socket.send(JSON.stringify({ type: 'chat', id, session_id: sessionId, message }));
+    return {
+      id,
+      cancel: () => {
+        const turn = this.handlers.get(id);
+        if (!turn) return;
+        this.handlers.delete(id);
+        socket.send(JSON.stringify({ type: 'cancel', id }));
+        // The server's "cancelled" reply will find no handlers; settle the turn here
+        turn.onCancelled?.();
+      },
+    };
+  }
+
+  close(): void {
+    this.socket?.close();
+  }
+}
+
 export const getSession = async (sessionId: string): Promise<SessionInfo> => {
   const response = await api.get<SessionInfo>(`/api/sessions/${sessionId}`);
   return response.data;
@@ -0,0 +1,261 @@
+"""
+Adapter layer between the agents and their LLMs.
+
+to_completion_response() normalizes whatever an LLM returns (a CompletionResponse,
+a langchain BaseMessage, anything with .text or .content) into a CompletionResponse
+with str text. The types are imported once, and the handler for each response type
+is resolved the first time that type is seen, so the common case (a CompletionResponse
+whose text is already a str) is a dict lookup and a type check.
+
+AdaptedLLM wraps an LLM (a LiteLLM in practice) by composition and sends every
+completion through the shared call pipeline: the persistent completion cache (opt-in
+per agent), single-flight coalescing, the LLM governor and the resilience layer
+(circuit breaker, budgeted retries, optional hedging). Its responses are already
+normalized, so callers use them as they are.
+"""
+import asyncio
+import os
+from typing import Any, Callable, Dict, Optional
+
+from llama_index.core.base.llms.types import (
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.llms import LLM, CustomLLM
+from pydantic import PrivateAttr
+
+from completion_cache import completion_cache_active, completion_cache_validator, get_completion_cache
+from context_packing import count_tokens
+from llm_governor import DEFAULT_COMPLETION_ESTIMATE, LLMGovernorRejected, get_llm_governor
+from resilience import CircuitOpenError, get_endpoint, is_retryable
+from single_flight import SINGLE_FLIGHT_ENABLED, completion_flights, completion_key
+
+try:
+    from langchain_core.messages.base import BaseMessage
+except ImportError:
+    BaseMessage = None
+
+# Completions are safe to repeat but cost tokens, so hedging them is opt-in
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    return content if isinstance(content, str) else str(content)
+
+
+def _from_message(response: Any) -> CompletionResponse:
+    return CompletionResponse(text=_message_text(response), raw=response)
+
+
+def _from_completion(response: CompletionResponse) -> CompletionResponse:
+    text = response.text
+    if isinstance(text, str):
+        return response
+    if BaseMessage is not None and isinstance(text, BaseMessage):
+        text = _message_text(text)
+    return CompletionResponse(text=str(text), raw=getattr(response, "raw", response))
+
+
+def _from_other(response: Any) -> CompletionResponse:
+    # Duck-typed: pydantic fields aren't class attributes, so this is decided per response
+    if hasattr(response, "text"):
+        text = response.text
+        if BaseMessage is not None and isinstance(text, BaseMessage):
+            text = _message_text(text)
+        return CompletionResponse(text=text if isinstance(text, str) else str(text), raw=response)
+    if hasattr(response, "content"):
+        return CompletionResponse(text=_message_text(response), raw=response)
+    return CompletionResponse(text=str(response), raw=response)
+
+
+# Response type -> handler, filled in as types are seen
+_handlers: Dict[type, Callable[[Any], CompletionResponse]] = {CompletionResponse: _from_completion}
+
+
+def _resolve(cls: type) -> Callable[[Any], CompletionResponse]:
+    if BaseMessage is not None and issubclass(cls, BaseMessage):
+        handler = _from_message
+    elif issubclass(cls, CompletionResponse):
+        handler = _from_completion
+    else:
+        handler = _from_other
+    _handlers[cls] = handler
+    return handler
+
+
+def to_completion_response(response: Any) -> CompletionResponse:
+    """Normalize an LLM response to a CompletionResponse with str text (returned as-is if it already is one)."""
+    handler = _handlers.get(type(response))
+    if handler is None:
+        handler = _resolve(type(response))
+    return handler(response)
+
+
+def llm_unavailable(exc: BaseException) -> bool:
+    """
+    True when a failed completion says the LLM can't take calls right now: shed by the
+    governor, circuit open, or a transient error the resilience layer already retried
+    (or had no retry budget left for). Calling again straight away would only pile on.
+    """
+    return isinstance(exc, (LLMGovernorRejected, CircuitOpenError)) or is_retryable(exc)
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    """Total tokens reported by the provider for a LiteLLM response, if any."""
+    usage = getattr(response, "raw", None)
+    usage = usage.get("usage") if isinstance(usage, dict) else getattr(usage, "usage", None)
+    total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+def governor_estimate(llm: Any, prompt: Any, kwargs: Dict) -> int:
+    """Tokens to reserve with the LLM governor (0 when there is no tokens/min limit to charge)."""
+    if get_llm_governor().tokens.unlimited:
+        return 0
+    completion = kwargs.get("max_tokens") or getattr(llm, "max_tokens", None) or DEFAULT_COMPLETION_ESTIMATE
+    return count_tokens(str(prompt)) + completion
+
+
+def _cacheable(text: Any, validate: Optional[Callable[[str], bool]]) -> bool:
+    """Non-empty text the calling scope can use (see completion_cache_scope's validator)."""
+    if not isinstance(text, str) or not text.strip():
+        return False
+    return validate is None or bool(validate(text))
+
+
+def _store_completion(
+    cache, key: str, model: str, response: CompletionResponse, validate: Optional[Callable[[str], bool]] = None
+) -> None:
+    if _cacheable(response.text, validate):
+        cache.put(key, model, response.text, usage_tokens(response) or 0)
+
+
+class AdaptedLLM(CustomLLM):
+    """An LLM whose calls go through the completion cache, single-flight, the governor and the resilience layer."""
+
+    _llm: LLM = PrivateAttr()
+
+    def __init__(self, llm: LLM, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._llm = llm
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "adapted_llm"
+
+    @property
+    def inner(self) -> LLM:
+        return self._llm
+
+    @property
+    def model(self) -> str:
+        return getattr(self._llm, "model", None) or type(self._llm).__name__
+
+    @property
+    def temperature(self) -> Optional[float]:
+        return getattr(self._llm, "temperature", None)
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        return getattr(self._llm, "max_tokens", None)
+
+    @property
+    def additional_kwargs(self) -> Dict[str, Any]:
+        return getattr(self._llm, "additional_kwargs", None) or {}
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llm.metadata
+
+    def _completion_key(self, prompt: str, formatted: bool, kwargs: Dict) -> str:
+        """Model, prompt and everything else that shapes the completion (single-flight / cache key)."""
+        params = {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "additional_kwargs": self.additional_kwargs,
+            **kwargs,
+        }
+        if formatted:
+            params["formatted"] = True
+        return completion_key(self.model, prompt, params)
+
+    async def _governed_acomplete(self, prompt: str, formatted: bool, kwargs: Dict) -> CompletionResponse:
+        governor = get_llm_governor()
+        estimate = governor_estimate(self, prompt, kwargs)
+
+        async def _attempt():
+            try:
+                return await self._llm.acomplete(prompt, formatted=formatted, **kwargs)
+            except Exception as e:
+                if getattr(e, "status_code", None) == 429:
+                    governor.record_throttle()
+                raise
+
+        # One permit covers the call and its retries; then circuit breaker, budgeted retries
+        # and (optionally) hedging per model
+        async with governor.permit(estimate) as permit:
+            response = await get_endpoint(f"llm:{self.model}", hedge=LLM_HEDGING).call(_attempt)
+            if estimate:
+                permit.tokens_used = usage_tokens(response)
+        return to_completion_response(response)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        # Deterministic call sites (completion_cache_scope) are answered from the persistent cache
+        cache = get_completion_cache() if completion_cache_active() else None
+        if not SINGLE_FLIGHT_ENABLED and cache is None:
+            return await self._governed_acomplete(prompt, formatted, kwargs)
+        key = self._completion_key(prompt, formatted, kwargs)
+        validate = completion_cache_validator()
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, key)
+            # An entry the caller can't use (stored before it was validated) is a miss and gets replaced
+            if cached is not None and _cacheable(cached["text"], validate):
+                return CompletionResponse(text=cached["text"])
+
+        async def _fetch():
+            response = await self._governed_acomplete(prompt, formatted, kwargs)
+            if cache is not None:
+                # Stored once per upstream call, not once per coalesced caller
+                await asyncio.to_thread(_store_completion, cache, key, self.model, response, validate)
+            return response
+
+        if not SINGLE_FLIGHT_ENABLED:
+            return await _fetch()
+        # Identical concurrent prompts (same model and sampling params) share one upstream call
+        return await completion_flights.do(key, _fetch)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        cache = get_completion_cache() if completion_cache_active() else None
+        if cache is None:
+            return to_completion_response(self._llm.complete(prompt, formatted=formatted, **kwargs))
+        key = self._completion_key(prompt, formatted, kwargs)
+        validate = completion_cache_validator()
+        cached = cache.get(key)
+        if cached is not None and _cacheable(cached["text"], validate):
+            return CompletionResponse(text=cached["text"])
+        response = to_completion_response(self._llm.complete(prompt, formatted=formatted, **kwargs))
+        _store_completion(cache, key, self.model, response, validate)
+        return response
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            # One governor permit per stream, held until the last token
+            async with get_llm_governor().permit(governor_estimate(self, prompt, kwargs)):
+                stream = await self._llm.astream_complete(prompt, formatted=formatted, **kwargs)
+                async for chunk in stream:
+                    yield chunk
+
+        return gen()
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        return self._llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+
+def adapt_llm(llm: LLM) -> LLM:
+    """Put `llm` behind the shared completion pipeline (an already adapted LLM is returned as-is)."""
+    if isinstance(llm, AdaptedLLM):
+        return llm
+    return AdaptedLLM(llm)
@@ -0,0 +1,264 @@
+"""
+Process-wide governor for LLM calls.
+
+Every LiteLLM completion waits for a permit before it goes upstream. A permit needs
+a free concurrency slot (LLM_MAX_CONCURRENCY), one request from the requests/min
+bucket (LLM_RPM) and its estimated tokens from the tokens/min bucket (LLM_TPM).
+Waiting callers are served round-robin per caller (one caller per query), so a
+query that fans out into many relevance grades can't starve the others. A caller
+that would wait longer than LLM_GOVERNOR_MAX_WAIT, or arrives while the queue is
+full, is rejected at once instead of piling onto an upstream that is already
+rate limiting us; an upstream 429 drains the request bucket so everyone slows down
+together.
+"""
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+DEFAULT_LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+DEFAULT_LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+DEFAULT_LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+DEFAULT_LLM_MAX_WAIT = float(os.getenv("LLM_GOVERNOR_MAX_WAIT", "30"))
+DEFAULT_LLM_MAX_QUEUE = int(os.getenv("LLM_GOVERNOR_MAX_QUEUE", "256"))
+DEFAULT_LLM_BURST_SECONDS = float(os.getenv("LLM_GOVERNOR_BURST_SECONDS", "10"))
+# Completion tokens assumed for a call that doesn't set max_tokens
+DEFAULT_COMPLETION_ESTIMATE = int(os.getenv("LLM_GOVERNOR_COMPLETION_ESTIMATE", "256"))
+
+# Wait-time samples kept for percentiles
+_WAIT_SAMPLES = 1024
+
+# Who is asking: calls made under the same caller share one place in the round-robin
+_llm_caller: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_caller", default=None)
+_caller_ids = itertools.count(1)
+
+
+def bind_llm_caller(caller: Optional[str] = None) -> str:
+    """Attribute LLM calls made from this context (and tasks it starts) to one caller."""
+    caller = caller or f"caller-{next(_caller_ids)}"
+    _llm_caller.set(caller)
+    return caller
+
+
+class LLMGovernorRejected(Exception):
+    """Raised when a call is shed (queue full or wait too long) instead of being sent upstream."""
+
+
+class TokenBucket:
+    """Refills at `per_minute / 60` per second up to `capacity`; a limit of 0 means unlimited."""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (requests bigger than the bucket need a full bucket)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float) -> None:
+        # May go negative (requests bigger than the bucket, usage above the estimate): later calls repay it
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= amount
+
+    def drain(self) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+@dataclass
+class Permit:
+    """A granted LLM call. Set `tokens_used` once the real usage is known."""
+    caller: str
+    tokens: int
+    waited: float = 0.0
+    tokens_used: Optional[int] = None
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+class LLMGovernor:
+    """Concurrency limit plus requests/min and tokens/min buckets with a fair (round-robin) queue."""
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_LLM_MAX_CONCURRENCY,
+        rpm: float = DEFAULT_LLM_RPM,
+        tpm: float = DEFAULT_LLM_TPM,
+        max_wait: float = DEFAULT_LLM_MAX_WAIT,
+        max_queue: int = DEFAULT_LLM_MAX_QUEUE,
+        burst_seconds: float = DEFAULT_LLM_BURST_SECONDS,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self.in_flight = 0
+        # caller -> its waiting permits, in arrival order; callers are served round-robin
+        self._queues: "OrderedDict[str, Deque[Permit]]" = OrderedDict()
+        self._queued = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self.granted = 0
+        self.queued_total = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.throttled = 0
+        self.max_queue_depth = 0
+
+    def _dispatch(self) -> None:
+        """Grant permits to waiting callers while there is capacity, round-robin by caller."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queues and self.in_flight < self.max_concurrency:
+            caller, queue = next(iter(self._queues.items()))
+            permit = queue[0]
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(permit.tokens))
+            if delay > 0:
+                # The caller at the head keeps its turn; wake up when the buckets have refilled
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(caller)
+            else:
+                del self._queues[caller]
+            self._grant(permit)
+            permit.future.set_result(None)
+
+    def _grant(self, permit: Permit) -> None:
+        self.requests.take(1)
+        self.tokens.take(permit.tokens)
+        self.in_flight += 1
+        self.granted += 1
+
+    def _remove(self, permit: Permit) -> None:
+        queue = self._queues.get(permit.caller)
+        if queue is not None and permit in queue:
+            queue.remove(permit)
+            self._queued -= 1
+            if not queue:
+                del self._queues[permit.caller]
+
+    async def acquire(self, tokens: int, caller: Optional[str] = None) -> Permit:
+        """Wait for a permit. Raises LLMGovernorRejected if the call is shed."""
+        permit = Permit(caller=caller or _llm_caller.get() or "default", tokens=max(0, tokens))
+        started = time.monotonic()
+        if (
+            not self._queues
+            and self.in_flight < self.max_concurrency
+            and self.requests.wait_time(1) == 0
+            and self.tokens.wait_time(permit.tokens) == 0
+        ):
+            self._grant(permit)
+            self._waits.append(0.0)
+            return permit
+
+        if self._queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise LLMGovernorRejected(f"LLM queue is full ({self._queued} waiting)")
+        permit.future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(permit.caller, deque()).append(permit)
+        self._queued += 1
+        self.queued_total += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queued)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(permit.future), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if permit.future.done() and not permit.future.cancelled():
+                # Granted just as we gave up: hand the slot straight back
+                self.release(permit)
+            else:
+                permit.future.cancel()
+                self._remove(permit)
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_timeout += 1
+                raise LLMGovernorRejected(f"Waited more than {self.max_wait}s for an LLM slot") from None
+            raise
+        permit.waited = time.monotonic() - started
+        self._waits.append(permit.waited)
+        return permit
+
+    def release(self, permit: Permit) -> None:
+        """Free the permit's slot and settle its token estimate against real usage."""
+        self.in_flight -= 1
+        if permit.tokens_used is not None:
+            self.tokens.take(permit.tokens_used - permit.tokens)
+        if self._queues:
+            self._dispatch()
+
+    def record_throttle(self) -> None:
+        """The upstream answered 429: stop granting until the request bucket refills."""
+        self.throttled += 1
+        self.requests.drain()
+
+    @asynccontextmanager
+    async def permit(self, tokens: int, caller: Optional[str] = None):
+        permit = await self.acquire(tokens, caller)
+        try:
+            yield permit
+        finally:
+            self.release(permit)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def _pct(fraction: float) -> Optional[float]:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000, 1)
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rpm_limit": self.requests.per_minute or None,
+            "tpm_limit": self.tokens.per_minute or None,
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            "queued_callers": len(self._queues),
+            "max_queue_depth": self.max_queue_depth,
+            "granted": self.granted,
+            "queued": self.queued_total,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "upstream_throttled": self.throttled,
+            "wait_p50_ms": _pct(0.50),
+            "wait_p95_ms": _pct(0.95),
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else None,
+        }
+
+
+_governor: Optional[LLMGovernor] = None
+
+
+def get_llm_governor() -> LLMGovernor:
+    """The process-wide governor (created on first use)."""
+    global _governor
+    if _governor is None:
+        _governor = LLMGovernor()
+    return _governor
@@ -0,0 +1,222 @@
+"""
+Opt-in event-loop instrumentation (LOOP_MONITOR=1).
+
+LoopMonitor runs a heartbeat task on the event loop and a watchdog thread next to
+it. The heartbeat measures scheduling lag; when the loop stops beating for longer
+than the threshold, the watchdog logs the loop thread's current stack, which points
+at the callback that is blocking it.
+
+The sync-call guard wraps known blocking calls (requests, LiteLLM.complete,
+time.sleep) and logs a warning with the caller's stack whenever one of them is
+made on a thread that is running an event loop.
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Dict, Optional
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR", "0") == "1"
+DEFAULT_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "100"))
+DEFAULT_HEARTBEAT_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50"))
+
+# Frames shown when logging a blocked loop or a sync call
+_STACK_LIMIT = 15
+# Lag samples kept for percentiles
+_LAG_SAMPLES = 2048
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoopMonitor:
+    """Measures event-loop lag and logs the stack of callbacks that block the loop."""
+
+    def __init__(
+        self,
+        threshold_ms: float = DEFAULT_BLOCK_THRESHOLD_MS,
+        interval_ms: float = DEFAULT_HEARTBEAT_INTERVAL_MS,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._lags = deque(maxlen=_LAG_SAMPLES)
+        self.max_lag = 0.0
+        self.blocked_events = 0
+        self.longest_block = 0.0
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Start monitoring the running loop (must be called from inside it)."""
+        if self._task is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        print(
+            f"🔎 Event loop monitor started (threshold {self.threshold * 1000:.0f}ms, "
+            f"heartbeat {self.interval * 1000:.0f}ms)"
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            scheduled = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - scheduled - self.interval)
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if self._reported_beat == self._last_beat:
+                # The watchdog logged this block while it was happening; record how long it lasted
+                self.longest_block = max(self.longest_block, now - self._last_beat)
+            self._last_beat = now
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+            if blocked_for < self.threshold or self._reported_beat == last_beat:
+                continue
+            # Report each block once, with the loop thread's stack at the time it was noticed
+            self._reported_beat = last_beat
+            self.blocked_events += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=_STACK_LIMIT)) if frame else "<unavailable>\n"
+            print(
+                f"WARNING: Event loop blocked for {blocked_for * 1000:.0f}ms "
+                f"(threshold {self.threshold * 1000:.0f}ms). Loop thread stack:\n{stack}"
+            )
+
+    def stats(self) -> Dict:
+        lags = list(self._lags)
+        return {
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "lag_p50_ms": round(_percentile(lags, 0.50) * 1000, 2),
+            "lag_p99_ms": round(_percentile(lags, 0.99) * 1000, 2),
+            "lag_max_ms": round(self.max_lag * 1000, 2),
+            "blocked_events": self.blocked_events,
+            "longest_block_ms": round(self.longest_block * 1000, 2),
+            "sync_calls": dict(_sync_call_counts),
+        }
+
+
+# --- Sync-call guard ---
+
+_sync_call_counts: Dict[str, int] = {}
+_reported_call_sites = set()
+_guard_installed = False
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _guard(name: str, func: Callable) -> Callable:
+    """Wrap a blocking callable so calls made on an event-loop thread are reported."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _in_event_loop():
+            _sync_call_counts[name] = _sync_call_counts.get(name, 0) + 1
+            stack = traceback.extract_stack(limit=_STACK_LIMIT)[:-1]
+            call_site = (name, stack[-1].filename, stack[-1].lineno) if stack else (name,)
+            # Log each offending call site once; the counters keep the totals
+            if call_site not in _reported_call_sites:
+                _reported_call_sites.add(call_site)
+                print(
+                    f"WARNING: Blocking call {name}() made inside a running event loop:\n"
+                    + "".join(traceback.format_list(stack))
+                )
+        return func(*args, **kwargs)
+
+    wrapper._loop_monitor_guard = True
+    return wrapper
+
+
+def _wrap_attribute(owner, attribute: str, name: str) -> None:
+    func = getattr(owner, attribute, None)
+    if func is None or getattr(func, "_loop_monitor_guard", False):
+        return
+    setattr(owner, attribute, _guard(name, func))
+
+
+def install_sync_call_guard() -> None:
+    """Report known blocking calls (requests, LiteLLM.complete, time.sleep) made from coroutines."""
+    global _guard_installed
+    if _guard_installed:
+        return
+    _guard_installed = True
+
+    # requests.get/post/... all go through Session.request
+    try:
+        import requests
+        _wrap_attribute(requests.Session, "request", "requests")
+    except ImportError:
+        pass
+
+    try:
+        from llama_index.llms.litellm import LiteLLM
+        _wrap_attribute(LiteLLM, "complete", "LiteLLM.complete")
+        _wrap_attribute(LiteLLM, "chat", "LiteLLM.chat")
+    except ImportError:
+        pass
+
+    _wrap_attribute(time, "sleep", "time.sleep")
+
+
+_monitor: Optional[LoopMonitor] = None
+
+
+def get_loop_monitor() -> Optional[LoopMonitor]:
+    """The process-wide monitor, if one was started."""
+    return _monitor
+
+
+def start_loop_monitor(enabled: bool = LOOP_MONITOR_ENABLED) -> Optional[LoopMonitor]:
+    """Start the monitor and sync-call guard on the running loop when enabled (LOOP_MONITOR=1)."""
+    global _monitor
+    if not enabled:
+        return None
+    if _monitor is None:
+        install_sync_call_guard()
+        _monitor = LoopMonitor()
+        _monitor.start()
+    return _monitor
+
+
+async def stop_loop_monitor() -> None:
+    global _monitor
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
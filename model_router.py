@@ -0,0 +1,277 @@
+"""
+Latency-aware routing of LLM calls across several models, with fallbacks.
+
+Each agent can be given an ordered list of models (RELEVANCE_MODELS, TRANSFORM_MODELS,
+QUERY_MODELS, SUMMARY_MODELS, falling back to LLM_MODELS), e.g. small fast models for
+relevance grading and query transforms and a stronger one for answers. A RoutedLLM
+sends each call to the fastest healthy model in its list, judged by a rolling window
+of latencies (time to first token for streams) shared by every router in the process,
+and falls back to the next model when a call fails. A model whose recent error rate
+crosses ROUTER_MAX_ERROR_RATE, or whose circuit breaker is open, is skipped for
+ROUTER_COOLDOWN_SECONDS. Until a model has ROUTER_MIN_SAMPLES latencies the list order
+decides, and ROUTER_EXPLORE_RATE of calls try another healthy model so its numbers stay
+current.
+"""
+import os
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseAsyncGen, LLMMetadata
+from llama_index.core.llms import LLM, CustomLLM
+from llama_index.llms.litellm import LiteLLM
+from pydantic import PrivateAttr
+
+from llm_adapter import adapt_llm
+from llm_governor import LLMGovernorRejected
+from resilience import CircuitOpenError, is_retryable
+
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_COOLDOWN_SECONDS = float(os.getenv("ROUTER_COOLDOWN_SECONDS", "30"))
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", "0.05"))
+
+# Agent -> env var with its model list (LLM_MODELS applies to any agent without its own)
+AGENT_MODEL_ENV = {
+    "relevance": "RELEVANCE_MODELS",
+    "transform": "TRANSFORM_MODELS",
+    "query": "QUERY_MODELS",
+    "summary": "SUMMARY_MODELS",
+}
+
+
+def _median(values) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+class ModelHealth:
+    """Rolling latency and error window for one model."""
+
+    def __init__(self, model: str, window: int = ROUTER_WINDOW):
+        self.model = model
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._ttfts: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.cooldowns = 0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def error_rate(self) -> float:
+        return (self._outcomes.count(False) / len(self._outcomes)) if self._outcomes else 0.0
+
+    def latency(self, stream: bool) -> Optional[float]:
+        """Median latency (time to first token for streams), or None until there are enough samples."""
+        samples = self._ttfts if stream else self._latencies
+        return _median(samples) if len(samples) >= ROUTER_MIN_SAMPLES else None
+
+    def record_success(self, seconds: float, stream: bool = False) -> None:
+        self.calls += 1
+        self._outcomes.append(True)
+        (self._ttfts if stream else self._latencies).append(seconds)
+
+    def record_error(self, exc: BaseException) -> None:
+        self.calls += 1
+        self.errors += 1
+        if isinstance(exc, CircuitOpenError):
+            self._cool_down("its circuit is open")
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= ROUTER_MIN_SAMPLES and self.error_rate() >= ROUTER_MAX_ERROR_RATE:
+            self._cool_down(f"error rate {self.error_rate():.0%}")
+
+    def _cool_down(self, reason: str) -> None:
+        if self.healthy:
+            self.cooldowns += 1
+            print(f"Warning: Routing around {self.model} for {ROUTER_COOLDOWN_SECONDS:.0f}s ({reason})")
+        self.cooldown_until = time.monotonic() + ROUTER_COOLDOWN_SECONDS
+        # Judge the model afresh once the cooldown is over
+        self._outcomes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        latency = _median(self._latencies)
+        ttft = _median(self._ttfts)
+        return {
+            "healthy": self.healthy,
+            "calls": self.calls,
+            "errors": self.errors,
+            "recent_error_rate": round(self.error_rate(), 4),
+            "cooldowns": self.cooldowns,
+            "latency_p50_ms": round(latency * 1000, 1) if latency is not None else None,
+            "ttft_p50_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        }
+
+
+_health: Dict[str, ModelHealth] = {}
+# agent -> model -> calls routed there first; agent -> calls that fell back to another model
+_routes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_fallbacks: Dict[str, int] = defaultdict(int)
+
+
+def get_model_health(model: str) -> ModelHealth:
+    if model not in _health:
+        _health[model] = ModelHealth(model)
+    return _health[model]
+
+
+def rank_models(models: List[str], stream: bool = False) -> List[str]:
+    """Models in the order to try them: fastest healthy first, unhealthy last (as a final fallback)."""
+    healthy = [m for m in models if get_model_health(m).healthy]
+    unhealthy = [m for m in models if m not in healthy]
+    # Measured models first, fastest first; models without enough samples follow in list order
+    position = {m: i for i, m in enumerate(models)}
+    healthy.sort(key=lambda m: (
+        get_model_health(m).latency(stream) is None,
+        get_model_health(m).latency(stream) or 0.0,
+        position[m],
+    ))
+    if len(healthy) > 1 and random.random() < ROUTER_EXPLORE_RATE:
+        explored = healthy.pop(random.randrange(1, len(healthy)))
+        healthy.insert(0, explored)
+    return healthy + unhealthy
+
+
+def router_stats() -> Dict[str, Any]:
+    return {
+        "models": {model: health.stats() for model, health in _health.items()},
+        "routes": {agent: dict(models) for agent, models in _routes.items()},
+        "fallbacks": dict(_fallbacks),
+    }
+
+
+class RoutedLLM(CustomLLM):
+    """LLM that routes every call to the fastest healthy of several models and falls back on errors."""
+
+    model: str = ""
+    agent: str = ""
+    _llms: Dict[str, LLM] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, agent: str, llms: Dict[str, LLM], **kwargs: Any):
+        super().__init__(agent=agent, model=",".join(llms), **kwargs)
+        self._llms = dict(llms)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "routed_llm"
+
+    @property
+    def models(self) -> List[str]:
+        return list(self._llms)
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llms[self.models[0]].metadata
+
+    def _record_error(self, model: str, exc: BaseException) -> None:
+        # A bad request says nothing about the model's health, but another model may still take it
+        if isinstance(exc, CircuitOpenError) or is_retryable(exc):
+            get_model_health(model).record_error(exc)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        last_error: Optional[BaseException] = None
+        for attempt, model in enumerate(rank_models(self.models)):
+            if attempt == 0:
+                _routes[self.agent][model] += 1
+            else:
+                _fallbacks[self.agent] += 1
+                print(f"DEBUG: {self.agent} falling back to {model} after {type(last_error).__name__}")
+            started = time.monotonic()
+            try:
+                response = await self._llms[model].acomplete(prompt, formatted=formatted, **kwargs)
+            except LLMGovernorRejected:
+                raise
+            except Exception as e:
+                self._record_error(model, e)
+                last_error = e
+                continue
+            get_model_health(model).record_success(time.monotonic() - started)
+            return response
+        raise last_error
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            last_error: Optional[BaseException] = None
+            for attempt, model in enumerate(rank_models(self.models, stream=True)):
+                if attempt == 0:
+                    _routes[self.agent][model] += 1
+                else:
+                    _fallbacks[self.agent] += 1
+                    print(f"DEBUG: {self.agent} falling back to {model} after {type(last_error).__name__}")
+                started = time.monotonic()
+                first_token = True
+                try:
+                    stream = await self._llms[model].astream_complete(prompt, formatted=formatted, **kwargs)
+                    async for chunk in stream:
+                        if first_token:
+                            get_model_health(model).record_success(time.monotonic() - started, stream=True)
+                            first_token = False
+                        yield chunk
+                    return
+                except LLMGovernorRejected:
+                    raise
+                except Exception as e:
+                    self._record_error(model, e)
+                    if not first_token:
+                        # The caller already has part of this model's answer; don't splice in another
+                        raise
+                    last_error = e
+            raise last_error
+
+        return gen()
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        # Sync fallback path: no latency ranking, just the list order with fallbacks
+        last_error: Optional[BaseException] = None
+        for model in self.models:
+            try:
+                return self._llms[model].complete(prompt, formatted=formatted, **kwargs)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._llms[self.models[0]].stream_complete(prompt, formatted=formatted, **kwargs)
+
+
+_model_llms: Dict[tuple, LLM] = {}
+
+
+def _litellm_for(model: str, like: LLM) -> LLM:
+    """An adapted LiteLLM for `model` with the same endpoint and key as `like` (shared per process)."""
+    if getattr(like, "model", None) == model:
+        return like
+    like_kwargs = getattr(like, "additional_kwargs", None) or {}
+    api_base = like_kwargs.get("api_base") or os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
+    api_key = like_kwargs.get("api_key") or os.getenv("OPENROUTER_API_KEY")
+    key = (model, api_base, api_key)
+    if key not in _model_llms:
+        # One attempt per call (LiteLLM's default is 10 with 4-10s waits); the resilience layer retries
+        _model_llms[key] = adapt_llm(LiteLLM(model=model, api_base=api_base, api_key=api_key, max_retries=1))
+    return _model_llms[key]
+
+
+def models_for_agent(agent: str) -> List[str]:
+    raw = os.getenv(AGENT_MODEL_ENV.get(agent, ""), "") or os.getenv("LLM_MODELS", "")
+    return [model.strip() for model in raw.split(",") if model.strip()]
+
+
+def llm_for_agent(agent: str, default_llm: LLM) -> LLM:
+    """
+    The LLM an agent should use: `default_llm` unless a model list is configured for it,
+    a LiteLLM for a single configured model, or a RoutedLLM over several.
+    """
+    models = list(dict.fromkeys(models_for_agent(agent)))
+    if not models:
+        return default_llm
+    if len(models) == 1:
+        return _litellm_for(models[0], default_llm)
+    return RoutedLLM(agent, {model: _litellm_for(model, default_llm) for model in models})
@@ -0,0 +1,284 @@
+"""
+Shared resilience layer for upstream calls (FireCrawl, OpenRouter via LiteLLM).
+
+Each upstream endpoint gets a ResilientEndpoint with:
+  - a circuit breaker: after CIRCUIT_FAILURE_THRESHOLD consecutive failures calls
+    fail fast for CIRCUIT_RESET_SECONDS, then a single probe decides whether to close it
+  - hedged requests (idempotent calls only): when an attempt is slower than the
+    endpoint's recent HEDGE_PERCENTILE latency, a second identical attempt is started
+    and whichever finishes first wins
+  - jittered retries limited by a retry budget: retries are allowed only while they
+    stay under RETRY_BUDGET_RATIO of recent requests, so an outage does not turn
+    into a retry storm
+
+Counters for every endpoint are exposed through resilience_stats().
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.25"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "4"))
+
+# Latency samples kept per endpoint for percentiles
+_LATENCY_SAMPLES = 512
+# Retry budget: tokens never accumulate beyond this, so a long quiet period can't fund a storm
+_RETRY_BUDGET_CAP = 10.0
+# Hedges are never fired sooner than this, whatever the percentile says
+_MIN_HEDGE_DELAY = 0.05
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+# Failures of the connection itself rather than of the request; retrying may succeed.
+# asyncio.TimeoutError is TimeoutError on 3.11+, listed for older interpreters.
+_TRANSIENT_ERRORS = (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Transport errors, timeouts, 408/429 and 5xx are retryable.
+
+    Everything else (other 4xx, and bugs or bad output such as TypeError, KeyError or a
+    parsing error) is not: retrying would only repeat it and trip the circuit breaker.
+    LiteLLM's connection, timeout, rate-limit and server errors carry one of the
+    retryable status codes.
+    """
+    if isinstance(exc, (asyncio.CancelledError, CircuitOpenError)):
+        return False
+    status = _status_code(exc)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    return isinstance(exc, _TRANSIENT_ERRORS)
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    def __init__(
+        self,
+        name: str = "",
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                print(f"Warning: Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a half-open probe slot when the call ended without a verdict (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+
+class RetryBudget:
+    """Token bucket: each request deposits `ratio` tokens, each retry withdraws one."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, initial: float = 2.0):
+        self.ratio = ratio
+        self.tokens = initial
+
+    def deposit(self) -> None:
+        self.tokens = min(_RETRY_BUDGET_CAP, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ResilientEndpoint:
+    """Circuit breaker + hedging + budgeted retries around calls to one upstream endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        hedge: bool = True,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+    ):
+        self.name = name
+        self.hedge = hedge
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_percentile = hedge_percentile
+        self.breaker = CircuitBreaker(name)
+        self.retry_budget = RetryBudget()
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.retries = 0
+        self.retry_budget_exhausted = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little latency history."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(_MIN_HEDGE_DELAY, _percentile(self._latencies, self.hedge_percentile))
+
+    async def _hedged(self, factory: Callable[[], Awaitable[T]], delay: float) -> T:
+        primary = asyncio.ensure_future(factory())
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            # Slower than usual: race a second identical request against the first
+            self.hedges += 1
+            hedge = asyncio.ensure_future(factory())
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt(self, factory: Callable[[], Awaitable[T]], idempotent: bool) -> T:
+        delay = self.hedge_delay() if (idempotent and self.hedge) else None
+        if delay is None:
+            return await factory()
+        return await self._hedged(factory, delay)
+
+    async def call(self, factory: Callable[[], Awaitable[T]], idempotent: bool = True) -> T:
+        """
+        Run `factory()` (a fresh coroutine per attempt) under the breaker, hedging and retry budget.
+
+        Raises CircuitOpenError when the breaker is open, otherwise the last attempt's error.
+        """
+        self.calls += 1
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.short_circuited += 1
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            started = time.monotonic()
+            try:
+                result = await self._attempt(factory, idempotent)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                attempt += 1
+                if not is_retryable(e):
+                    # The endpoint answered; the request itself was bad
+                    self.breaker.release()
+                    raise
+                self.failures += 1
+                self.breaker.record_failure()
+                if attempt >= self.max_attempts:
+                    raise
+                if not self.retry_budget.withdraw():
+                    self.retry_budget_exhausted += 1
+                    raise
+                self.retries += 1
+                # Full jitter: spread retries out so callers don't hit the upstream in lockstep
+                backoff = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)))
+                print(f"DEBUG: {self.name} attempt {attempt} failed ({type(e).__name__}), retrying in {backoff:.2f}s")
+                await asyncio.sleep(backoff)
+                continue
+            self._latencies.append(time.monotonic() - started)
+            self.successes += 1
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict:
+        latencies = list(self._latencies)
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "retries": self.retries,
+            "retry_budget_exhausted": self.retry_budget_exhausted,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50_ms": round(_percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(_percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+            "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        }
+
+
+_endpoints: Dict[str, ResilientEndpoint] = {}
+
+
+def get_endpoint(name: str, hedge: bool = True, max_attempts: int = RETRY_MAX_ATTEMPTS) -> ResilientEndpoint:
+    """Process-wide ResilientEndpoint for a name (settings apply on first use)."""
+    if name not in _endpoints:
+        _endpoints[name] = ResilientEndpoint(name, hedge=hedge, max_attempts=max_attempts)
+    return _endpoints[name]
+
+
+def resilience_stats() -> Dict[str, Dict]:
+    return {name: endpoint.stats() for name, endpoint in _endpoints.items()}
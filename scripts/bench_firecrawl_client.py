@@ -0,0 +1,191 @@
+"""
+Benchmark the shared async FireCrawl client against the previous per-request `requests.post`.
+
+Starts a local stand-in for the FireCrawl search endpoint (HTTP/1.1 keep-alive, fixed
+latency) and runs the same number of searches through:
+  - requests.post in worker threads (a new connection per search, as before)
+  - the shared pooled httpx.AsyncClient directly (what pooling alone buys)
+  - firecrawl_client.firecrawl_search (the pooled client behind the resilience layer:
+    circuit breaker, retry budget, optional hedging)
+
+Usage:
+  python scripts/bench_firecrawl_client.py --requests 300 --concurrency 10 --latency-ms 20
+
+Each path first runs one untimed batch of `--concurrency` searches, so the numbers are
+steady state (the pooled clients open their connections during the warm-up).
+
+The stand-in server is plain HTTP, so the pooled client runs HTTP/1.1 here; against the
+real API (HTTPS) it negotiates HTTP/2 when `h2` is installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESPONSE = json.dumps({
+    "success": True,
+    "data": [
+        {"title": f"Result {i}", "description": "Stand-in search result", "url": f"https://example.com/{i}"}
+        for i in range(5)
+    ],
+}).encode("utf-8")
+
+
+def _start_stand_in_server(latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        connections = set()
+
+        def do_POST(self):
+            Handler.connections.add(self.client_address)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(RESPONSE)))
+            self.end_headers()
+            try:
+                self.wfile.write(RESPONSE)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client dropped the request (e.g. the losing half of a hedged pair)
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # The default listen backlog (5) drops concurrent connects, which shows up as 1s SYN-retry tails
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.handler = Handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _report(name: str, wall: float, latencies: list, connections: int) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+    print(
+        f"{name:<24} wall {wall:7.3f}s  {len(latencies) / wall:8.1f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f}ms  p99 {p99 * 1000:7.1f}ms  "
+        f"connections {connections}"
+    )
+
+
+async def _bench_requests(url: str, total: int, concurrency: int) -> tuple:
+    import requests
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    def _search(i: int) -> None:
+        start = time.perf_counter()
+        response = requests.post(
+            f"{url}/v1/search", json={"query": f"q{i}", "limit": 5}, headers={"Authorization": "Bearer x"}, timeout=60
+        )
+        response.raise_for_status()
+        response.json()
+        latencies.append(time.perf_counter() - start)
+
+    async def _one(i: int) -> None:
+        async with semaphore:
+            await asyncio.to_thread(_search, i)
+
+    await asyncio.gather(*(_one(i) for i in range(concurrency)))
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+async def _bench_raw_pooled(total: int, concurrency: int) -> tuple:
+    from firecrawl_client import close_firecrawl_client, get_firecrawl_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await get_firecrawl_client().post(
+                "/v1/search", json={"query": f"q{i}", "limit": 5}, headers={"Authorization": "Bearer x"}
+            )
+            response.raise_for_status()
+            response.json()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(_one(i) for i in range(concurrency)))
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(total)))
+    wall = time.perf_counter() - start
+    await close_firecrawl_client()
+    return wall, latencies
+
+
+async def _bench_pooled(total: int, concurrency: int) -> tuple:
+    from firecrawl_client import close_firecrawl_client, firecrawl_search
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await firecrawl_search("x", f"q{i}", limit=5, timeout=60)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(_one(i) for i in range(concurrency)))
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(total)))
+    wall = time.perf_counter() - start
+    await close_firecrawl_client()
+    return wall, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    server = _start_stand_in_server(args.latency_ms / 1000)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    # firecrawl_client reads its base URL at import time
+    os.environ["FIRECRAWL_API_URL"] = url
+    print(f"Stand-in FireCrawl at {url}: {args.requests} searches, concurrency {args.concurrency}, "
+          f"{args.latency_ms:.0f}ms server latency\n")
+
+    server.handler.connections.clear()
+    wall, latencies = asyncio.run(_bench_requests(url, args.requests, args.concurrency))
+    _report("requests.post (threads)", wall, latencies, len(server.handler.connections))
+
+    server.handler.connections.clear()
+    wall, latencies = asyncio.run(_bench_raw_pooled(args.requests, args.concurrency))
+    _report("pooled httpx client", wall, latencies, len(server.handler.connections))
+
+    server.handler.connections.clear()
+    wall, latencies = asyncio.run(_bench_pooled(args.requests, args.concurrency))
+    _report("firecrawl_search", wall, latencies, len(server.handler.connections))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
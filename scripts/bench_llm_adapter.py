@@ -0,0 +1,164 @@
+"""
+Microbenchmark of the per-call overhead of normalizing LLM responses.
+
+Compares the previous `extract_text_from_response` (imports CompletionResponse and
+tries langchain_core on every call, and ran twice per completion: once in the patched
+LiteLLM.acomplete and again in the agent) with `llm_adapter.to_completion_response`
+(types resolved once, handler cached per response type, run once per completion).
+It also times a full `AdaptedLLM.acomplete` (single-flight, governor, resilience)
+around an instant stand-in LLM, against calling the stand-in directly.
+
+Usage:
+  python scripts/bench_llm_adapter.py --calls 100000
+
+Without langchain_core installed the previous version pays for a failed import on
+every call; with it installed it pays for the import lookups.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the stand-in calls out of the persistent completion cache
+os.environ.setdefault("COMPLETION_CACHE_PATH", "")
+
+
+def previous_extract_text_from_response(response):
+    """extract_text_from_response as it was before llm_adapter."""
+    from llama_index.core.base.llms.types import CompletionResponse
+
+    try:
+        from langchain_core.messages.base import BaseMessage
+        if isinstance(response, BaseMessage):
+            text = response.content if hasattr(response, 'content') else str(response)
+            return CompletionResponse(text=str(text), raw=response)
+    except (ImportError, AttributeError):
+        pass
+
+    if isinstance(response, CompletionResponse):
+        if hasattr(response, 'text'):
+            try:
+                from langchain_core.messages.base import BaseMessage
+                if isinstance(response.text, BaseMessage):
+                    text = response.text.content if hasattr(response.text, 'content') else str(response.text)
+                    return CompletionResponse(text=str(text), raw=getattr(response, 'raw', response))
+            except (ImportError, AttributeError):
+                pass
+        if isinstance(response.text, str):
+            return response
+        return CompletionResponse(text=str(response.text), raw=getattr(response, 'raw', response))
+
+    if hasattr(response, 'text'):
+        text = response.text
+        try:
+            from langchain_core.messages.base import BaseMessage
+            if isinstance(text, BaseMessage):
+                text = text.content if hasattr(text, 'content') else str(text)
+        except (ImportError, AttributeError):
+            pass
+        text = str(text) if not isinstance(text, str) else text
+        return CompletionResponse(text=text, raw=response)
+
+    if hasattr(response, 'content'):
+        text = response.content if isinstance(response.content, str) else str(response.content)
+        return CompletionResponse(text=text, raw=response)
+
+    return CompletionResponse(text=str(response), raw=response)
+
+
+def _per_call_us(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def _report(name: str, per_call_us: float, baseline_us: float = None) -> None:
+    speedup = f"  ({baseline_us / per_call_us:5.1f}x faster)" if baseline_us else ""
+    print(f"{name:<48} {per_call_us:9.2f} us/call{speedup}")
+
+
+def bench_normalize(calls: int) -> None:
+    from llama_index.core.base.llms.types import CompletionResponse
+
+    from llm_adapter import to_completion_response
+
+    response = CompletionResponse(text="yes", raw={"usage": {"total_tokens": 42}})
+    previous = _per_call_us(lambda: previous_extract_text_from_response(previous_extract_text_from_response(response)), calls)
+    adapter = _per_call_us(lambda: to_completion_response(response), calls)
+    _report("previous extract (x2 per completion)", previous)
+    _report("to_completion_response (x1)", adapter, previous)
+
+    class Message:
+        content = "yes"
+
+    message = Message()
+    previous = _per_call_us(lambda: previous_extract_text_from_response(message), calls)
+    adapter = _per_call_us(lambda: to_completion_response(message), calls)
+    _report("previous extract, non-CompletionResponse", previous)
+    _report("to_completion_response, non-CompletionResponse", adapter, previous)
+
+
+def bench_pipeline(calls: int) -> None:
+    from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+    from llama_index.core.llms import CustomLLM
+
+    from llm_adapter import adapt_llm
+
+    class StandInLLM(CustomLLM):
+        model: str = "stand-in"
+
+        @property
+        def metadata(self) -> LLMMetadata:
+            return LLMMetadata(model_name=self.model)
+
+        def complete(self, prompt, formatted=False, **kwargs):
+            return CompletionResponse(text="yes")
+
+        async def acomplete(self, prompt, formatted=False, **kwargs):
+            return CompletionResponse(text="yes")
+
+        def stream_complete(self, prompt, formatted=False, **kwargs):
+            yield CompletionResponse(text="yes", delta="yes")
+
+    raw = StandInLLM()
+    adapted = adapt_llm(raw)
+
+    async def _run(llm) -> float:
+        start = time.perf_counter()
+        for i in range(calls):
+            await llm.acomplete(f"prompt {i}")
+        return (time.perf_counter() - start) / calls * 1e6
+
+    direct = asyncio.run(_run(raw))
+    piped = asyncio.run(_run(adapted))
+    _report("stand-in LLM acomplete (direct)", direct)
+    _report("AdaptedLLM.acomplete (full pipeline)", piped)
+    print(f"{'pipeline overhead':<48} {piped - direct:9.2f} us/call")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50000)
+    args = parser.parse_args()
+
+    try:
+        import langchain_core  # noqa: F401
+        print("langchain_core installed\n")
+    except ImportError:
+        print("langchain_core not installed\n")
+
+    bench_normalize(args.calls)
+    print()
+    bench_pipeline(max(1, args.calls // 10))
+
+
+if __name__ == "__main__":
+    main()
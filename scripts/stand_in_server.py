@@ -0,0 +1,296 @@
+"""
+Local stand-in for FireCrawl and OpenRouter that records and replays cassettes.
+
+Requests are routed by path prefix:
+  /firecrawl/...   -> FireCrawl  (point FIRECRAWL_API_URL at http://HOST:PORT/firecrawl)
+  /openrouter/...  -> OpenRouter (point OPENROUTER_API_BASE at http://HOST:PORT/openrouter)
+
+Record mode forwards every request to the real service and appends the exchange
+(request body, status, response body, observed latency) to a JSONL cassette.
+Authorization headers are forwarded but never written to the cassette.
+
+Replay mode needs no network: it answers from the cassette and sleeps according
+to a latency distribution per service, so load and latency tests are repeatable.
+
+Usage:
+  # Record while exercising the app against the live services
+  python scripts/stand_in_server.py record --cassette cassettes/session.jsonl
+
+  # Replay offline with latency profiles
+  python scripts/stand_in_server.py replay --cassette cassettes/session.jsonl \\
+      --latency firecrawl=lognormal:800,0.4 --latency openrouter=uniform:200,900
+
+  FIRECRAWL_API_URL=http://127.0.0.1:8787/firecrawl \\
+  OPENROUTER_API_BASE=http://127.0.0.1:8787/openrouter uvicorn main:app
+
+Latency specs: fixed:MS | uniform:LO_MS,HI_MS | lognormal:MEDIAN_MS,SIGMA | recorded[:SCALE]
+Requests are matched on service, path and a hash of the JSON body (volatile fields such as
+timeouts are ignored). Without --strict, an unmatched request gets a recorded response for
+the same path (round-robin) and an X-Stand-In-Match: fallback header.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+UPSTREAMS = {
+    "firecrawl": "https://api.firecrawl.dev",
+    "openrouter": "https://openrouter.ai/api/v1",
+}
+
+# Request fields that differ between otherwise identical calls and must not affect matching
+VOLATILE_FIELDS = {"timeout", "user", "metadata", "stream_options"}
+
+
+def request_key(service: str, method: str, path: str, body: bytes) -> str:
+    try:
+        payload = json.loads(body) if body else None
+        if isinstance(payload, dict):
+            payload = {k: v for k, v in payload.items() if k not in VOLATILE_FIELDS}
+        canonical = json.dumps(payload, sort_keys=True)
+    except ValueError:
+        canonical = body.decode("utf-8", errors="replace")
+    raw = json.dumps([service, method, path, canonical])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LatencyModel:
+    """Samples a response delay (seconds) from a spec like 'lognormal:800,0.4'."""
+
+    def __init__(self, spec: str = "recorded"):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        if kind not in ("fixed", "uniform", "lognormal", "recorded"):
+            raise ValueError(f"Unknown latency distribution '{kind}'")
+
+    def sample(self, recorded_ms: float) -> float:
+        if self.kind == "fixed":
+            ms = self.args[0]
+        elif self.kind == "uniform":
+            ms = random.uniform(self.args[0], self.args[1])
+        elif self.kind == "lognormal":
+            median, sigma = self.args
+            ms = random.lognormvariate(math.log(median), sigma)
+        else:
+            ms = recorded_ms * (self.args[0] if self.args else 1.0)
+        return max(0.0, ms) / 1000
+
+
+class Cassette:
+    """Append-only JSONL store of recorded exchanges, indexed by request key and path."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[dict]] = {}
+        self._by_path: Dict[Tuple[str, str], List[dict]] = {}
+        self._key_cycles: Dict[str, itertools.cycle] = {}
+        self._path_cycles: Dict[Tuple[str, str], itertools.cycle] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, exchange: dict) -> None:
+        self._by_key.setdefault(exchange["key"], []).append(exchange)
+        self._by_path.setdefault((exchange["service"], exchange["path"]), []).append(exchange)
+        self._key_cycles.pop(exchange["key"], None)
+        self._path_cycles.pop((exchange["service"], exchange["path"]), None)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._by_key.values())
+
+    def append(self, exchange: dict) -> None:
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(exchange) + "\n")
+            self._index(exchange)
+
+    def find(self, key: str, service: str, path: str, strict: bool) -> Tuple[Optional[dict], str]:
+        """Next recorded exchange for this request: ("exact" | "fallback" | "none")."""
+        with self._lock:
+            if key in self._by_key:
+                cycle = self._key_cycles.setdefault(key, itertools.cycle(self._by_key[key]))
+                return next(cycle), "exact"
+            if not strict and (service, path) in self._by_path:
+                cycle = self._path_cycles.setdefault((service, path), itertools.cycle(self._by_path[(service, path)]))
+                return next(cycle), "fallback"
+        return None, "none"
+
+
+def make_handler(mode: str, cassette: Cassette, latencies: Dict[str, LatencyModel], strict: bool):
+    import httpx
+
+    upstream_client = httpx.Client(timeout=120) if mode == "record" else None
+    counters = {"exact": 0, "fallback": 0, "none": 0, "recorded": 0, "upstream_errors": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _route(self) -> Tuple[Optional[str], str]:
+            prefix, _, rest = self.path.lstrip("/").partition("/")
+            if prefix not in UPSTREAMS:
+                return None, self.path
+            return prefix, "/" + rest
+
+        def _send(self, status: int, body: bytes, content_type: str, extra: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (extra or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _send_stream(self, status: int, body: str, content_type: str, delay: float) -> None:
+            # Replay server-sent events one by one, spreading the latency over the stream
+            events = [e for e in body.split("\n\n") if e.strip()]
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            first_byte = delay / 2
+            per_event = (delay - first_byte) / max(1, len(events))
+            time.sleep(first_byte)
+            try:
+                for event in events:
+                    self.wfile.write((event + "\n\n").encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(per_event)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _handle(self, method: str) -> None:
+            if self.path == "/__stats":
+                body = json.dumps({"mode": mode, "exchanges": len(cassette), **counters}).encode("utf-8")
+                return self._send(200, body, "application/json")
+            service, path = self._route()
+            if service is None:
+                return self._send(404, b'{"error": "unknown service prefix"}', "application/json")
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            key = request_key(service, method, path, body)
+
+            if mode == "record":
+                headers = {
+                    name: value for name, value in self.headers.items()
+                    if name.lower() in ("authorization", "content-type", "accept", "http-referer", "x-title")
+                }
+                started = time.monotonic()
+                try:
+                    response = upstream_client.request(method, UPSTREAMS[service] + path, content=body, headers=headers)
+                except httpx.HTTPError as e:
+                    # Nothing came back from upstream, so there is nothing to record
+                    counters["upstream_errors"] += 1
+                    print(f"Warning: upstream {service} {method} {path} failed: {e!r}")
+                    error = json.dumps({"error": f"upstream request failed: {type(e).__name__}: {e}"})
+                    return self._send(502, error.encode("utf-8"), "application/json")
+                latency_ms = (time.monotonic() - started) * 1000
+                content_type = response.headers.get("content-type", "application/json")
+                cassette.append({
+                    "service": service,
+                    "method": method,
+                    "path": path,
+                    "key": key,
+                    "request": body.decode("utf-8", errors="replace"),
+                    "status": response.status_code,
+                    "content_type": content_type,
+                    "body": response.text,
+                    "latency_ms": round(latency_ms, 1),
+                })
+                counters["recorded"] += 1
+                return self._send(response.status_code, response.content, content_type)
+
+            exchange, match = cassette.find(key, service, path, strict)
+            counters[match] += 1
+            if exchange is None:
+                return self._send(404, b'{"error": "no recorded response for this request"}', "application/json")
+            delay = latencies.get(service, latencies["default"]).sample(exchange.get("latency_ms", 0.0))
+            if exchange["content_type"].startswith("text/event-stream"):
+                return self._send_stream(exchange["status"], exchange["body"], exchange["content_type"], delay)
+            time.sleep(delay)
+            self._send(
+                exchange["status"],
+                exchange["body"].encode("utf-8"),
+                exchange["content_type"],
+                {"X-Stand-In-Match": match},
+            )
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return Handler
+
+
+def parse_latencies(specs: List[str]) -> Dict[str, LatencyModel]:
+    latencies = {"default": LatencyModel("recorded")}
+    for spec in specs or []:
+        service, sep, distribution = spec.partition("=")
+        if not sep:
+            service, distribution = "default", spec
+        latencies[service] = LatencyModel(distribution)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--cassette", required=True, help="JSONL cassette file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", action="append", help="[service=]distribution, repeatable (replay only)")
+    parser.add_argument("--strict", action="store_true", help="404 on requests without an exact recorded match")
+    parser.add_argument("--firecrawl-upstream", default=UPSTREAMS["firecrawl"])
+    parser.add_argument("--openrouter-upstream", default=UPSTREAMS["openrouter"])
+    parser.add_argument("--seed", type=int, help="Seed latency sampling for repeatable runs")
+    args = parser.parse_args()
+
+    UPSTREAMS["firecrawl"] = args.firecrawl_upstream.rstrip("/")
+    UPSTREAMS["openrouter"] = args.openrouter_upstream.rstrip("/")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    cassette = Cassette(args.cassette)
+    if args.mode == "replay" and not len(cassette):
+        parser.error(f"Cassette {args.cassette} is empty or missing")
+    handler = make_handler(args.mode, cassette, parse_latencies(args.latency), args.strict)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    base = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Stand-in server ({args.mode}, {len(cassette)} exchanges in {args.cassette}) on {base}")
+    print(f"  FIRECRAWL_API_URL={base}/firecrawl")
+    print(f"  OPENROUTER_API_BASE={base}/openrouter")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
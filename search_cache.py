@@ -0,0 +1,142 @@
+"""
+Process-wide cache of web search results.
+
+Results are keyed by (normalized user query, limit); the agent rewrites the query for
+search inside the fetch, so a hit skips the rewrite too. Entries younger than the TTL
+are served as-is; entries that are past the TTL but still inside the stale window are
+served immediately while a background task refreshes them (stale-while-revalidate),
+so a repeated search never waits on FireCrawl unless the entry is missing or too old.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from answer_cache import normalize_query
+
+DEFAULT_SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+DEFAULT_SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+DEFAULT_SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "3600"))
+
+SearchFetch = Callable[[str, int], Awaitable[Any]]
+
+
+class SearchResultCache:
+    """Bounded LRU of search results with a TTL and a stale-while-revalidate window."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_SEARCH_CACHE_SIZE,
+        ttl_seconds: float = DEFAULT_SEARCH_CACHE_TTL,
+        stale_seconds: float = DEFAULT_SEARCH_CACHE_STALE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        # key -> (results, fetched_at)
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[Any, float]]" = OrderedDict()
+        self._refreshing: Set[Tuple[str, int]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_calls = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @staticmethod
+    def make_key(query: str, limit: int) -> Tuple[str, int]:
+        return normalize_query(query), limit
+
+    def _store(self, key: Tuple[str, int], results: Any) -> None:
+        # Empty results are usually errors or timeouts; don't pin them for the whole TTL
+        if not results or self.max_entries <= 0:
+            return
+        self._entries[key] = (results, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _refresh(self, key: Tuple[str, int], query: str, limit: int, fetch: SearchFetch) -> None:
+        try:
+            self._store(key, await fetch(query, limit))
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"Warning: Background search refresh failed for '{query}': {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    async def get_or_fetch(
+        self,
+        query: str,
+        limit: int,
+        fetch: SearchFetch,
+        refresh: Optional[SearchFetch] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Return (results, status) where status is "hit", "stale" or "miss".
+
+        `fetch` is awaited on a miss; `refresh` (defaults to `fetch`) runs in the
+        background when a stale entry is served.
+        """
+        key = self.make_key(query, limit)
+        entry = self._entries.get(key)
+        if entry is not None:
+            results, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return results, "hit"
+            if age < self.ttl_seconds + self.stale_seconds:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self.refresh_calls += 1
+                    task = asyncio.create_task(self._refresh(key, query, limit, refresh or fetch))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                return results, "stale"
+            del self._entries[key]
+
+        self.misses += 1
+        results = await fetch(query, limit)
+        self._store(key, results)
+        return results, "miss"
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        served = self.hits + self.stale_hits
+        total = served + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round(served / total, 4) if total else 0.0,
+            # Served entries skip a FireCrawl call, but each background refresh makes one
+            "saved_api_calls": max(0, served - self.refresh_calls),
+            "background_refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+_search_cache: Optional[SearchResultCache] = None
+
+
+def get_search_cache() -> Optional[SearchResultCache]:
+    """The process-wide search cache (None when SEARCH_CACHE_SIZE is 0)."""
+    global _search_cache
+    if DEFAULT_SEARCH_CACHE_SIZE <= 0:
+        return None
+    if _search_cache is None:
+        _search_cache = SearchResultCache()
+    return _search_cache
@@ -0,0 +1,111 @@
+"""
+Single-flight coalescing of identical in-flight upstream calls.
+
+When several requests need the same result at the same moment (a popular document
+going around, many users asking the same question), only the first one calls the
+upstream; the others wait for that call and share its result or error. Nothing is
+cached: once the call finishes the key is forgotten. The shared call is cancelled
+only when every caller waiting on it has gone away.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, TypeVar
+
+T = TypeVar("T")
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers with the same key share it."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """Await `factory()` for this key, or join the identical call already in flight."""
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.upstream_calls += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            # Shielded: one caller timing out must not cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._flights),
+        }
+
+
+completion_flights = SingleFlight("completions")
+embedding_flights = SingleFlight("embeddings")
+
+
+def _digest(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def completion_key(model: str, prompt: Any, params: Dict[str, Any]) -> str:
+    """Key for a completion: model, prompt and every sampling parameter."""
+    return _digest([model, str(prompt), params])
+
+
+def _embed_model_name(embed_model) -> str:
+    return getattr(embed_model, "model_name", None) or type(embed_model).__name__
+
+
+async def coalesced_query_embedding(embed_model, text: str) -> List[float]:
+    """embed_model.aget_query_embedding(text), shared with identical concurrent requests."""
+    if not SINGLE_FLIGHT_ENABLED:
+        return await embed_model.aget_query_embedding(text)
+    key = _digest([_embed_model_name(embed_model), "query", text])
+    return await embedding_flights.do(key, lambda: embed_model.aget_query_embedding(text))
+
+
+async def coalesced_text_embedding_batch(embed_model, texts: List[str]) -> List[List[float]]:
+    """embed_model.aget_text_embedding_batch(texts), shared with identical concurrent requests."""
+    if not SINGLE_FLIGHT_ENABLED:
+        return await embed_model.aget_text_embedding_batch(texts)
+    key = _digest([_embed_model_name(embed_model), "text", texts])
+    return await embedding_flights.do(key, lambda: embed_model.aget_text_embedding_batch(texts))
+
+
+def single_flight_stats() -> Dict[str, Dict]:
+    return {
+        "completions": completion_flights.stats(),
+        "embeddings": embedding_flights.stats(),
+    }
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# Use LiteLLM's bundled model cost map instead of fetching it on import
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+# Keep test runs out of the persistent completion cache
+os.environ.setdefault("COMPLETION_CACHE_PATH", "")
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Clock:
+    """Settable stand-in for time.time / time.monotonic."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import answer_cache
+from answer_cache import RelevanceGradeCache, SemanticAnswerCache, SharedAnswerCache
+
+
+def test_semantic_answer_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_entries=2, similarity_threshold=0.99)
+    cache.store("first", [1.0, 0.0, 0.0], "answer one")
+    cache.store("second", [0.0, 1.0, 0.0], "answer two")
+    assert cache.lookup([1.0, 0.0, 0.0])[0].answer == "answer one"
+
+    cache.store("third", [0.0, 0.0, 1.0], "answer three")
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0])[0].answer == "answer one"
+    assert cache.lookup([0.0, 0.0, 1.0])[0].answer == "answer three"
+
+
+def test_semantic_answer_cache_never_serves_answers_for_another_document_version():
+    cache = SemanticAnswerCache(similarity_threshold=0.99)
+    cache.store("question", [1.0, 0.0], "old answer", document_hash="v1")
+    assert cache.lookup([1.0, 0.0], document_hash="v1")[0].answer == "old answer"
+
+    assert cache.lookup([1.0, 0.0], document_hash="v2") is None
+    # The stale entry is gone, even for a caller still on the old version
+    assert cache.lookup([1.0, 0.0], document_hash="v1") is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_semantic_answer_cache_invalidate_drops_every_entry():
+    cache = SemanticAnswerCache(similarity_threshold=0.99)
+    cache.store("question", [1.0, 0.0], "answer")
+    cache.invalidate()
+    assert cache.lookup([1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_shared_answer_cache_entries_expire_after_the_ttl(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(answer_cache, "time", SimpleNamespace(time=clock))
+    cache = SharedAnswerCache(str(tmp_path / "answers.db"), ttl_seconds=60)
+    key = SharedAnswerCache.make_key("doc", "model", "What is it?", "1")
+    cache.put(key, "An answer", {"sources": 1}, llm_tokens=100)
+
+    assert SharedAnswerCache.make_key("doc", "model", "  what is it", "1") == key
+    assert SharedAnswerCache.make_key("other doc", "model", "What is it?", "1") != key
+    assert cache.get(key)["answer"] == "An answer"
+    clock.now += 61
+    assert cache.get(key) is None
+
+
+def test_relevance_grade_cache_evicts_least_recently_used():
+    cache = RelevanceGradeCache(max_entries=2)
+    cache.set("node-a", "What is it?", "yes")
+    cache.set("node-b", "What is it?", "no")
+    assert cache.get("node-a", "what is it") == "yes"
+
+    cache.set("node-c", "What is it?", "yes")
+    assert cache.get("node-b", "What is it?") is None
+    assert cache.get("node-a", "What is it?") == "yes"
+    assert cache.get("node-c", "What is it?") == "yes"
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+import completion_cache
+from completion_cache import CompletionCache, completion_cache_scope
+from llm_adapter import AdaptedLLM
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(completion_cache, "time", SimpleNamespace(time=clock))
+    cache = CompletionCache(str(tmp_path / "completions.db"), ttl_seconds=60)
+    cache.put("key", "model", "yes", llm_tokens=12)
+
+    clock.now += 59
+    assert cache.get("key") == {"text": "yes", "llm_tokens": 12}
+    clock.now += 2
+    assert cache.get("key") is None
+    assert cache.stats()["saved_llm_tokens"] == 12
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(completion_cache, "time", SimpleNamespace(time=clock))
+    cache = CompletionCache(str(tmp_path / "completions.db"), ttl_seconds=3600, max_entries=10)
+    for i in range(10):
+        clock.now += 1
+        cache.put(f"key{i}", "model", f"text{i}")
+    clock.now += 1
+    assert cache.get("key0") is not None
+
+    # Over the limit: trimmed to 90%, least recently used first (key0 was just read)
+    clock.now += 1
+    cache.put("key10", "model", "text10")
+    assert cache.get("key0") is not None
+    assert cache.get("key1") is None
+    assert cache.get("key2") is None
+    assert cache.get("key3") is not None
+    assert cache.stats()["entries"] == 9
+
+
+class ScriptedLLM(CustomLLM):
+    """Returns the scripted completions in order."""
+
+    texts: list = []
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="scripted")
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return CompletionResponse(text=self.texts[self.calls - 1])
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        raise NotImplementedError
+
+
+def _is_grade_list(text: str) -> bool:
+    return text.startswith("[")
+
+
+def test_completions_the_caller_cannot_use_are_not_stored_or_replayed(tmp_path, monkeypatch):
+    cache = CompletionCache(str(tmp_path / "completions.db"))
+    monkeypatch.setattr(completion_cache, "_completion_cache", cache)
+    monkeypatch.setattr(completion_cache, "_completion_cache_loaded", True)
+    inner = ScriptedLLM(texts=["garbage", '["yes"]'])
+    llm = AdaptedLLM(inner)
+
+    async def grade():
+        with completion_cache_scope("relevance", validate=_is_grade_list):
+            return (await llm.acomplete("grade these")).text
+
+    # A bad entry left over from before validation is a miss, not a replay
+    cache.put(llm._completion_key("grade these", False, {}), "scripted", "old garbage")
+    assert asyncio.run(grade()) == "garbage"
+    assert asyncio.run(grade()) == '["yes"]'
+    assert asyncio.run(grade()) == '["yes"]'
+    assert inner.calls == 2
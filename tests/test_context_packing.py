@@ -0,0 +1,83 @@
+from context_packing import (
+    MIN_TRUNCATED_CHUNK_TOKENS,
+    ContextChunk,
+    count_tokens,
+    merge_adjacent_chunks,
+    pack_context,
+)
+
+SEPARATOR = "\n\n"
+
+
+def _words(prefix: str, count: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_overlapping_chunks_from_one_source_are_merged_without_repeating_text():
+    text = "The quick brown fox jumps over the lazy dog."
+    first = ContextChunk(text=text[0:20], score=0.4, source_id="doc", start=0, end=20, node_ids=["n1"])
+    second = ContextChunk(text=text[15:44], score=0.9, source_id="doc", start=15, end=44, node_ids=["n2"])
+
+    merged = merge_adjacent_chunks([second, first])
+    assert len(merged) == 1
+    assert merged[0].text == text
+    assert merged[0].score == 0.9
+    assert merged[0].node_ids == ["n1", "n2"]
+
+
+def test_separate_ranges_and_sources_stay_apart():
+    chunks = [
+        ContextChunk(text="a" * 10, source_id="doc", start=0, end=10),
+        ContextChunk(text="b" * 10, source_id="doc", start=50, end=60),
+        ContextChunk(text="c" * 10, source_id="other", start=5, end=15),
+    ]
+    assert len(merge_adjacent_chunks(chunks)) == 3
+
+
+def test_chunks_without_positions_are_deduplicated_by_text():
+    chunks = [
+        ContextChunk(text="Termination requires  30 days notice.", score=0.5),
+        ContextChunk(text="30 days notice", score=0.1),
+        ContextChunk(text="Termination requires 30 days notice.", score=0.8),
+        ContextChunk(text="Payment is due monthly.", score=0.3),
+    ]
+    texts = [chunk.text for chunk in merge_adjacent_chunks(chunks)]
+    assert texts == ["Termination requires 30 days notice.", "Payment is due monthly."]
+
+
+def test_packs_most_relevant_chunks_first_within_the_budget():
+    low = ContextChunk(text=_words("low", 40), score=0.1, node_ids=["low"])
+    high = ContextChunk(text=_words("high", 40), score=0.9, node_ids=["high"])
+    budget = count_tokens(high.text) + count_tokens(SEPARATOR) + count_tokens(low.text)
+
+    packed = pack_context([low, high], token_budget=budget, separator=SEPARATOR)
+    assert packed.text == high.text + SEPARATOR + low.text
+    assert packed.node_ids == ["high", "low"]
+    assert packed.tokens <= budget
+    assert not packed.truncated
+
+
+def test_fills_the_rest_of_the_budget_with_the_head_of_the_next_chunk():
+    first = ContextChunk(text=_words("first", 50), score=0.9, node_ids=["first"])
+    second = ContextChunk(text=_words("second", 400), score=0.5, node_ids=["second"])
+    budget = count_tokens(first.text) + count_tokens(SEPARATOR) + MIN_TRUNCATED_CHUNK_TOKENS * 2
+
+    packed = pack_context([first, second], token_budget=budget, separator=SEPARATOR)
+    assert packed.truncated
+    assert packed.chunks_used == 2
+    assert packed.tokens <= budget
+    head = packed.text.split(SEPARATOR)[1]
+    assert second.text.startswith(head) and len(head) < len(second.text)
+
+
+def test_skips_a_chunk_that_does_not_fit_for_a_smaller_one_that_does():
+    first = ContextChunk(text=_words("first", 50), score=0.9)
+    big = ContextChunk(text=_words("big", 400), score=0.5)
+    small = ContextChunk(text="A short note.", score=0.1)
+    # Too little room left for a useful truncated piece of the big chunk, but enough for the small one
+    budget = count_tokens(first.text) + 2 * count_tokens(SEPARATOR) + count_tokens(small.text)
+
+    packed = pack_context([first, big, small], token_budget=budget, separator=SEPARATOR)
+    assert packed.text == first.text + SEPARATOR + small.text
+    assert packed.truncated
+    assert packed.chunks_total == 3
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import deadline as deadline_module
+from deadline import DEFAULT_QUERY_DEADLINE_SECONDS, MAX_DEADLINE_SECONDS, Deadline, run_stage
+
+
+@pytest.fixture
+def frozen(monkeypatch, clock):
+    monkeypatch.setattr(deadline_module, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_optional_stages_leave_the_answer_reserve(frozen):
+    deadline = Deadline(120, stage_budgets={"relevance": 20, "web_search": 100}, answer_reserve=30)
+    assert deadline.budget_for("relevance") == 20
+    assert deadline.budget_for("web_search") == 90
+    # Required stages may use everything that is left
+    assert deadline.budget_for("retrieval", required=True) == 20
+    assert deadline.budget_for("answer", required=True) == 120
+
+    frozen.now += 100
+    assert deadline.budget_for("web_search") == 0
+    assert deadline.budget_for("answer", required=True) == 20
+
+
+def test_short_deadlines_scale_the_answer_reserve(frozen):
+    deadline = Deadline(20, stage_budgets={"relevance": 20}, answer_reserve=30, answer_reserve_fraction=0.5)
+    assert deadline.answer_reserve == 10
+    assert deadline.budget_for("relevance") == 10
+
+
+def test_expired_deadline_has_no_budget(frozen):
+    deadline = Deadline(5)
+    frozen.now += 6
+    assert deadline.expired
+    assert deadline.remaining() == 0
+    assert deadline.budget_for("answer", required=True) == 0
+
+
+def test_largest_accepted_deadline_is_never_below_the_default():
+    assert MAX_DEADLINE_SECONDS >= DEFAULT_QUERY_DEADLINE_SECONDS
+
+
+def test_run_stage_cancels_a_stage_that_overruns_its_budget():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def slow_stage():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        deadline = Deadline(60, stage_budgets={"transform": 0.05}, answer_reserve=0)
+        with pytest.raises(asyncio.TimeoutError):
+            await run_stage(slow_stage(), deadline, "transform")
+        return cancelled.is_set()
+
+    assert asyncio.run(scenario())
+
+
+def test_run_stage_without_budget_does_not_start_the_stage(frozen):
+    started = []
+
+    async def stage():
+        started.append(True)
+
+    async def scenario():
+        deadline = Deadline(10, answer_reserve=30, answer_reserve_fraction=1.0)
+        with pytest.raises(asyncio.TimeoutError):
+            await run_stage(stage(), deadline, "relevance")
+        # Without a deadline the stage just runs
+        await run_stage(stage(), None, "relevance")
+
+    asyncio.run(scenario())
+    assert started == [True]
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+import resilience
+from llm_adapter import AdaptedLLM, adapt_llm, llm_unavailable, to_completion_response
+from llm_governor import LLMGovernorRejected
+from resilience import CircuitOpenError
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class StandInLLM(CustomLLM):
+    """Answers "answer" after `delay` seconds, raising `failures` (in order) on the first calls."""
+
+    model: str = ""
+    delay: float = 0.0
+    failures: list = []
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model)
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= len(self.failures):
+            raise self.failures[self.calls - 1]
+        return CompletionResponse(text="answer")
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        return CompletionResponse(text="answer")
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        yield CompletionResponse(text="answer", delta="answer")
+
+
+def test_completion_responses_with_str_text_are_returned_as_is():
+    response = CompletionResponse(text="yes")
+    assert to_completion_response(response) is response
+
+
+@pytest.mark.parametrize("response", [
+    SimpleNamespace(text="yes"),
+    SimpleNamespace(content="yes"),
+    "yes",
+])
+def test_other_responses_are_normalized_to_str_text(response):
+    normalized = to_completion_response(response)
+    assert isinstance(normalized, CompletionResponse)
+    assert normalized.text == "yes"
+
+
+@pytest.mark.parametrize("exc, unavailable", [
+    (LLMGovernorRejected("shed"), True),
+    (CircuitOpenError("open"), True),
+    (StatusError(503), True),
+    (httpx.ConnectError("refused"), True),
+    (StatusError(400), False),
+    (ValueError("unparseable"), False),
+])
+def test_llm_unavailable_only_for_shedding_open_circuits_and_transient_errors(exc, unavailable):
+    assert llm_unavailable(exc) is unavailable
+
+
+def test_adapting_twice_returns_the_same_adapter():
+    adapted = adapt_llm(StandInLLM(model="adapter-idempotent"))
+    assert adapt_llm(adapted) is adapted
+
+
+def test_transient_failures_are_retried_by_the_resilience_layer(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: 0.0)
+    inner = StandInLLM(model="adapter-retry", failures=[httpx.ConnectError("refused")])
+    llm = AdaptedLLM(inner)
+
+    assert asyncio.run(llm.acomplete("question")).text == "answer"
+    assert inner.calls == 2
+
+
+def test_bad_requests_are_not_retried():
+    inner = StandInLLM(model="adapter-bad-request", failures=[StatusError(400)])
+    llm = AdaptedLLM(inner)
+
+    with pytest.raises(StatusError):
+        asyncio.run(llm.acomplete("question"))
+    assert inner.calls == 1
+
+
+def test_identical_concurrent_prompts_share_one_upstream_call():
+    inner = StandInLLM(model="adapter-single-flight", delay=0.05)
+    llm = AdaptedLLM(inner)
+
+    async def ask_three_times():
+        return await asyncio.gather(*(llm.acomplete("question") for _ in range(3)))
+
+    assert [response.text for response in asyncio.run(ask_three_times())] == ["answer"] * 3
+    assert inner.calls == 1
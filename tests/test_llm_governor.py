@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from llm_governor import LLMGovernor, LLMGovernorRejected
+
+
+async def _wait_until_queued(governor: LLMGovernor, depth: int) -> None:
+    while governor.stats()["queue_depth"] < depth:
+        await asyncio.sleep(0)
+
+
+def test_waiting_callers_are_served_round_robin():
+    async def scenario():
+        governor = LLMGovernor(max_concurrency=1, max_wait=5)
+        holder = await governor.acquire(0, caller="holder")
+        order = []
+
+        async def call(caller: str) -> None:
+            async with governor.permit(0, caller=caller):
+                order.append(caller)
+
+        # One query fans out into three calls, then a second query arrives with one
+        tasks = [asyncio.create_task(call("fan-out")) for _ in range(3)]
+        await _wait_until_queued(governor, 3)
+        tasks.append(asyncio.create_task(call("other")))
+        await _wait_until_queued(governor, 4)
+
+        governor.release(holder)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["fan-out", "other", "fan-out", "fan-out"]
+
+
+def test_full_queue_sheds_new_calls_at_once():
+    async def scenario():
+        governor = LLMGovernor(max_concurrency=1, max_queue=1, max_wait=5)
+        holder = await governor.acquire(0)
+        waiter = asyncio.create_task(governor.acquire(0, caller="waiter"))
+        await _wait_until_queued(governor, 1)
+
+        with pytest.raises(LLMGovernorRejected):
+            await governor.acquire(0, caller="late")
+
+        governor.release(holder)
+        governor.release(await waiter)
+        return governor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected_queue_full"] == 1
+    assert stats["granted"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_waiting_longer_than_max_wait_is_rejected_and_leaves_the_queue():
+    async def scenario():
+        governor = LLMGovernor(max_concurrency=1, max_wait=0.05)
+        holder = await governor.acquire(0)
+
+        with pytest.raises(LLMGovernorRejected):
+            await governor.acquire(0, caller="impatient")
+        assert governor.stats()["queue_depth"] == 0
+
+        # The slot is still usable once the holder is done
+        governor.release(holder)
+        permit = await asyncio.wait_for(governor.acquire(0), timeout=1)
+        governor.release(permit)
+        return governor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected_timeout"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def scenario():
+        governor = LLMGovernor(max_concurrency=1, max_wait=5)
+        holder = await governor.acquire(0)
+        waiter = asyncio.create_task(governor.acquire(0, caller="gone"))
+        await _wait_until_queued(governor, 1)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        governor.release(holder)
+        permit = await asyncio.wait_for(governor.acquire(0), timeout=1)
+        governor.release(permit)
+        return governor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_upstream_throttle_drains_the_request_bucket():
+    governor = LLMGovernor(rpm=60, burst_seconds=5)
+    assert governor.requests.wait_time(1) == 0
+    governor.record_throttle()
+    assert governor.requests.wait_time(1) > 0
+    assert governor.stats()["upstream_throttled"] == 1
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Optional
+
+import httpx
+import pytest
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+import model_router
+from model_router import ROUTER_MIN_SAMPLES, RoutedLLM, get_model_health, rank_models
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class StandInModel(CustomLLM):
+    """Answers (or streams char by char) its own name; with `error` set, raises it (streams: after `tokens_before_error` chars)."""
+
+    name: str = ""
+    error: Optional[Exception] = None
+    tokens_before_error: int = 0
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.name)
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return CompletionResponse(text=self.name)
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        for i, token in enumerate(self.name):
+            if self.error is not None and i == self.tokens_before_error:
+                raise self.error
+            yield CompletionResponse(text=self.name[: i + 1], delta=token)
+
+
+@pytest.fixture(autouse=True)
+def fresh_router_state(monkeypatch, clock):
+    monkeypatch.setattr(model_router, "_health", {})
+    monkeypatch.setattr(model_router, "ROUTER_EXPLORE_RATE", 0.0)
+    monkeypatch.setattr(model_router, "time", SimpleNamespace(monotonic=clock))
+
+
+def _measure(model: str, seconds: float) -> None:
+    for _ in range(ROUTER_MIN_SAMPLES):
+        get_model_health(model).record_success(seconds)
+
+
+def test_fastest_measured_model_goes_first_and_unmeasured_ones_keep_list_order():
+    _measure("slow", 2.0)
+    _measure("fast", 0.5)
+    assert rank_models(["new-a", "slow", "new-b", "fast"]) == ["fast", "slow", "new-a", "new-b"]
+
+
+def test_model_with_a_high_error_rate_is_routed_around_until_the_cooldown_ends(clock):
+    _measure("fast", 0.1)
+    _measure("slow", 1.0)
+    for _ in range(ROUTER_MIN_SAMPLES):
+        get_model_health("fast").record_error(httpx.ConnectError("refused"))
+    assert rank_models(["fast", "slow"]) == ["slow", "fast"]
+
+    clock.now += model_router.ROUTER_COOLDOWN_SECONDS
+    assert rank_models(["fast", "slow"]) == ["fast", "slow"]
+
+
+def test_failed_call_falls_back_to_the_next_model():
+    broken = StandInModel(name="broken", error=httpx.ConnectError("refused"))
+    backup = StandInModel(name="backup")
+    llm = RoutedLLM("test", {"broken": broken, "backup": backup})
+
+    assert asyncio.run(llm.acomplete("question")).text == "backup"
+    assert get_model_health("broken").errors == 1
+    assert get_model_health("backup").calls == 1
+
+
+def test_bad_request_falls_back_without_counting_against_the_model():
+    picky = StandInModel(name="picky", error=StatusError(400))
+    backup = StandInModel(name="backup")
+    llm = RoutedLLM("test", {"picky": picky, "backup": backup})
+
+    assert asyncio.run(llm.acomplete("question")).text == "backup"
+    assert get_model_health("picky").errors == 0
+
+
+def test_last_error_is_raised_when_every_model_fails():
+    llm = RoutedLLM("test", {
+        "a": StandInModel(name="a", error=httpx.ConnectError("refused")),
+        "b": StandInModel(name="b", error=httpx.ReadTimeout("slow")),
+    })
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(llm.acomplete("question"))
+
+
+def _stream(llm: RoutedLLM):
+    async def collect():
+        deltas = []
+        async for chunk in await llm.astream_complete("question"):
+            deltas.append(chunk.delta)
+        return "".join(deltas)
+
+    return asyncio.run(collect())
+
+
+def test_stream_that_fails_before_its_first_token_falls_back():
+    llm = RoutedLLM("test", {
+        "broken": StandInModel(name="broken", error=httpx.ConnectError("refused")),
+        "backup": StandInModel(name="backup"),
+    })
+    assert _stream(llm) == "backup"
+
+
+def test_stream_that_fails_midway_is_not_spliced_with_another_model():
+    backup = StandInModel(name="backup")
+    llm = RoutedLLM("test", {
+        "flaky": StandInModel(name="flaky", error=httpx.ReadError("reset"), tokens_before_error=2),
+        "backup": backup,
+    })
+    with pytest.raises(httpx.ReadError):
+        _stream(llm)
+    assert backup.calls == 0
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from agentic_workflow import RelevanceAgent
+
+parse = RelevanceAgent._parse_batch_grades
+
+
+def test_parses_a_plain_json_array():
+    assert parse('["yes", "no", "yes"]', 3) == ["yes", "no", "yes"]
+
+
+def test_ignores_reasoning_and_surrounding_text():
+    text = '<think>Doc 2 is about [something else]</think>Grades: ["Yes", " NO "]. Done.'
+    assert parse(text, 2) == ["yes", "no"]
+
+
+def test_finds_the_array_inside_a_wrapping_object():
+    assert parse('{"grades": ["yes", "no"]}', 2) == ["yes", "no"]
+
+
+def test_accepts_booleans_and_scores():
+    assert parse("[true, false, 0.7, 0.2, 1, 0]", 6) == ["yes", "no", "yes", "no", "yes", "no"]
+
+
+@pytest.mark.parametrize("text", [
+    "yes, no",
+    '["yes", "no"',
+    '["yes"]',
+    '["yes", "no", "no"]',
+    '["yes", "maybe"]',
+    '["yes", null]',
+    "[yes, no]",
+])
+def test_unusable_output_falls_back_to_per_node_grading(text):
+    assert parse(text, 2) is None
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyGrader:
+    """Rejects the first grading request, then grades every node 'no'."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def acomplete(self, prompt, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise StatusError(400)
+        return SimpleNamespace(text="no")
+
+
+def test_fallback_verdict_of_a_failed_grading_call_is_not_cached():
+    llm = FlakyGrader()
+    agent = RelevanceAgent("relevance", llm, mode="per_node", accept_score=None, reject_score=None)
+    nodes = [NodeWithScore(node=TextNode(id_="chunk", text="chunk"), score=0.5)]
+
+    async def grade():
+        return await agent.execute("", {"nodes": nodes, "query": "question"})
+
+    # The failed call keeps the node, but only for this query
+    assert asyncio.run(grade())["all_results"] == ["yes"]
+    assert asyncio.run(grade())["all_results"] == ["no"]
+    assert asyncio.run(grade())["all_results"] == ["no"]
+    assert llm.calls == 2
+
+
+class OverloadedGrader:
+    """The first grading call finds the LLM unavailable; the others never finish."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+
+    async def acomplete(self, prompt, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise StatusError(503)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_unavailable_llm_cancels_the_other_grading_calls():
+    llm = OverloadedGrader()
+    agent = RelevanceAgent(
+        "relevance", llm, mode="per_node", max_concurrency=3, accept_score=None, reject_score=None
+    )
+    nodes = [NodeWithScore(node=TextNode(id_=f"chunk{i}", text=f"chunk{i}"), score=0.5) for i in range(3)]
+
+    async def grade():
+        with pytest.raises(StatusError):
+            await agent.execute("", {"nodes": nodes, "query": "question"})
+        # Checked before asyncio.run would cancel any leftover tasks itself
+        return llm.cancelled
+
+    assert asyncio.run(grade()) == 2
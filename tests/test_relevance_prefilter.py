@@ -0,0 +1,48 @@
+import asyncio
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from agentic_workflow import RelevanceAgent
+
+QUERY = [1.0, 0.0]
+
+
+class FailingLLM:
+    """The LLM judge must not be consulted for nodes the prefilter decides."""
+
+    async def acomplete(self, prompt, **kwargs):
+        raise AssertionError("unexpected grading call")
+
+
+def _node(node_id: str, score: float, embedding=None) -> NodeWithScore:
+    return NodeWithScore(node=TextNode(id_=node_id, text=node_id, embedding=embedding), score=score)
+
+
+def _grade(agent: RelevanceAgent, nodes):
+    async def run():
+        return await agent.execute("", {"nodes": nodes, "query": "question", "query_embedding": QUERY})
+
+    return asyncio.run(run())
+
+
+def test_thresholds_apply_to_embedding_similarity_not_the_store_score():
+    stored = {"close": [0.9, 0.1], "far": [0.0, 1.0]}
+    agent = RelevanceAgent(
+        "relevance", FailingLLM(), accept_score=0.65, reject_score=0.2, node_embedding=stored.get
+    )
+    # Store scores on another scale (exp(-distance)) would decide these the other way round
+    result = _grade(agent, [_node("close", score=0.1), _node("far", score=0.99)])
+    assert result["all_results"] == ["yes", "no"]
+    assert result["grading_calls"] == 0
+
+
+def test_embeddings_on_the_nodes_are_used_directly():
+    agent = RelevanceAgent("relevance", FailingLLM(), accept_score=0.65, reject_score=0.2)
+    result = _grade(agent, [_node("a", score=0.0, embedding=[1.0, 0.05])])
+    assert result["auto_accepted"] == 1
+
+
+def test_none_disables_both_thresholds():
+    agent = RelevanceAgent("relevance", FailingLLM(), accept_score=None, reject_score=None)
+    assert agent._similarities([_node("a", 0.9, [1.0, 0.0])], QUERY) == [None]
+    assert agent._prefilter(0.99) is None
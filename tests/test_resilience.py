@@ -0,0 +1,177 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import resilience
+from resilience import (
+    HEDGE_MIN_SAMPLES,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientEndpoint,
+    RetryBudget,
+    is_retryable,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: 0.0)
+
+
+@pytest.mark.parametrize("exc", [
+    httpx.ConnectError("refused"),
+    httpx.ReadTimeout("slow"),
+    asyncio.TimeoutError(),
+    ConnectionResetError(),
+    StatusError(429),
+    StatusError(408),
+    StatusError(503),
+])
+def test_transport_errors_timeouts_and_server_errors_are_retryable(exc):
+    assert is_retryable(exc)
+
+
+@pytest.mark.parametrize("exc", [
+    StatusError(400),
+    StatusError(401),
+    TypeError("bug"),
+    KeyError("choices"),
+    json.JSONDecodeError("bad", "", 0),
+    CircuitOpenError(),
+])
+def test_bad_requests_and_bugs_are_not_retryable(exc):
+    assert not is_retryable(exc)
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once_after_the_reset(monkeypatch, clock):
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=clock))
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow()
+
+    # A failed probe reopens the circuit straight away
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.times_opened == 2
+
+
+def test_retry_budget_allows_retries_only_while_requests_fund_them():
+    budget = RetryBudget(ratio=0.5, initial=1.0)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_endpoint_stops_retrying_when_the_budget_is_spent():
+    endpoint = ResilientEndpoint("test", hedge=False, max_attempts=5)
+    endpoint.retry_budget = RetryBudget(ratio=0.0, initial=1.0)
+    endpoint.breaker = CircuitBreaker("test", failure_threshold=100)
+    attempts = 0
+
+    async def failing():
+        nonlocal attempts
+        attempts += 1
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(endpoint.call(failing))
+    # The first attempt plus the one retry the budget could pay for
+    assert attempts == 2
+    assert endpoint.retries == 1
+    assert endpoint.retry_budget_exhausted == 1
+
+
+def test_non_retryable_errors_are_raised_without_retrying_or_tripping_the_breaker():
+    endpoint = ResilientEndpoint("test", hedge=False)
+    attempts = 0
+
+    async def bad_request():
+        nonlocal attempts
+        attempts += 1
+        raise StatusError(400)
+
+    for _ in range(10):
+        with pytest.raises(StatusError):
+            asyncio.run(endpoint.call(bad_request))
+    assert attempts == 10
+    assert endpoint.breaker.state == "closed"
+
+
+def test_open_circuit_fails_fast():
+    endpoint = ResilientEndpoint("test", hedge=False, max_attempts=1)
+    endpoint.breaker = CircuitBreaker("test", failure_threshold=1)
+
+    async def failing():
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(endpoint.call(failing))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(endpoint.call(failing))
+    assert endpoint.short_circuited == 1
+
+
+def test_hedge_wins_over_a_slow_primary_and_the_primary_is_cancelled():
+    endpoint = ResilientEndpoint("test", hedge=True)
+    endpoint._latencies.extend([0.001] * HEDGE_MIN_SAMPLES)
+    started = 0
+    primary_cancelled = False
+
+    async def request():
+        nonlocal started, primary_cancelled
+        started += 1
+        if started == 1:
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                primary_cancelled = True
+                raise
+        return "hedge"
+
+    assert asyncio.run(endpoint.call(request)) == "hedge"
+    assert started == 2
+    assert primary_cancelled
+    assert endpoint.hedges == 1 and endpoint.hedge_wins == 1
+
+
+def test_fast_calls_are_not_hedged():
+    endpoint = ResilientEndpoint("test", hedge=True)
+    endpoint._latencies.extend([1.0] * HEDGE_MIN_SAMPLES)
+    started = 0
+
+    async def request():
+        nonlocal started
+        started += 1
+        return "ok"
+
+    assert asyncio.run(endpoint.call(request)) == "ok"
+    assert started == 1
+    assert endpoint.hedges == 0
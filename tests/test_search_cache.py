@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+import search_cache
+from search_cache import SearchResultCache
+
+
+def test_serves_fresh_then_stale_then_refetches(monkeypatch, clock):
+    monkeypatch.setattr(search_cache, "time", SimpleNamespace(monotonic=clock))
+
+    async def scenario():
+        cache = SearchResultCache(max_entries=8, ttl_seconds=60, stale_seconds=60)
+        fetched = []
+
+        async def fetch(query, limit):
+            fetched.append(query)
+            return [f"result {len(fetched)}"]
+
+        statuses = [(await cache.get_or_fetch("Query?", 5, fetch))[1]]
+        clock.now += 30
+        statuses.append((await cache.get_or_fetch("query", 5, fetch))[1])
+        clock.now += 60
+        statuses.append((await cache.get_or_fetch("query", 5, fetch))[1])
+        # Let the background refresh run
+        await asyncio.gather(*cache._tasks)
+        clock.now += 200
+        statuses.append((await cache.get_or_fetch("query", 5, fetch))[1])
+        return statuses, len(fetched), cache.stats()
+
+    statuses, fetches, stats = asyncio.run(scenario())
+    assert statuses == ["miss", "hit", "stale", "miss"]
+    assert fetches == 3
+    # The stale hit's background refresh cost a call, so only the fresh hit saved one
+    assert stats["saved_api_calls"] == 1
+
+
+def test_evicts_least_recently_used():
+    async def scenario():
+        cache = SearchResultCache(max_entries=2, ttl_seconds=60, stale_seconds=0)
+
+        async def fetch(query, limit):
+            return [query]
+
+        await cache.get_or_fetch("a", 5, fetch)
+        await cache.get_or_fetch("b", 5, fetch)
+        await cache.get_or_fetch("a", 5, fetch)
+        await cache.get_or_fetch("c", 5, fetch)
+        return [(await cache.get_or_fetch(query, 5, fetch))[1] for query in ("a", "c", "b")]
+
+    assert asyncio.run(scenario()) == ["hit", "hit", "miss"]
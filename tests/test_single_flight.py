@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_upstream_call():
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "result"
+
+        tasks = [asyncio.create_task(flights.do("key", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks), calls, flights.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert stats["upstream_calls"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_different_keys_are_not_coalesced():
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def fetch(value):
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(flights.do("a", lambda: fetch("a")), flights.do("b", lambda: fetch("b")))
+        return results, flights.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == ["a", "b"]
+    assert stats["upstream_calls"] == 2
+    assert stats["coalesced"] == 0
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(*(flights.do("key", failing) for _ in range(3)), return_exceptions=True)
+        # The failed call is forgotten, so the next caller tries again
+        again = await asyncio.gather(flights.do("key", failing), return_exceptions=True)
+        return results + again, calls
+
+    results, calls = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == 2
+
+
+def test_one_caller_giving_up_does_not_cancel_the_call_for_the_others():
+    async def scenario():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "result"
+
+        impatient = asyncio.create_task(flights.do("key", fetch))
+        patient = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        release.set()
+        return await patient
+
+    assert asyncio.run(scenario()) == "result"
+
+
+def test_call_is_cancelled_when_every_caller_has_gone():
+    async def scenario():
+        flights = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return flights.stats()
+
+    assert asyncio.run(scenario())["in_flight"] == 0
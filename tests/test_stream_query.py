@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from llama_index.core import Document, Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+# backend/app must shadow the root app.py, as in backend/main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from agentic_workflow import AgenticRAGWorkflow, StageEvent, TokenEvent  # noqa: E402
+from app.services import workflow_service  # noqa: E402
+from app.services.workflow_service import WorkflowService  # noqa: E402
+
+
+class StandInLLM(CustomLLM):
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="stand-in")
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        return CompletionResponse(text="yes")
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        yield CompletionResponse(text="yes", delta="yes")
+
+
+@pytest.fixture
+def workflow():
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+    index = VectorStoreIndex.from_documents([Document(text="The notice period is 30 days.")])
+    return AgenticRAGWorkflow(index=index, firecrawl_api_key="test", llm=StandInLLM(), enable_answer_cache=False)
+
+
+async def _answer_in_two_tokens(task, context):
+    context["emit"](StageEvent(stage="retrieval", status="started"))
+    context["emit"](TokenEvent(delta="30 "))
+    context["emit"](TokenEvent(delta="days."))
+    return {"result": "30 days.", "status": "success", "streamed": True}
+
+
+def _collect(workflow, deadline_seconds=None):
+    async def run():
+        return [
+            item
+            async for item in WorkflowService().stream_query(workflow, "Notice period?", deadline_seconds=deadline_seconds)
+        ]
+
+    return asyncio.run(run())
+
+
+def test_streams_stages_and_tokens_then_the_final_answer(workflow):
+    workflow.orchestrator.execute = _answer_in_two_tokens
+    items = _collect(workflow)
+
+    assert [item["event"] for item in items] == ["stage", "token", "token", "done"]
+    assert items[0]["data"] == {"stage": "retrieval", "status": "started"}
+    assert "".join(item["data"]["delta"] for item in items if item["event"] == "token") == "30 days."
+    assert items[-1]["data"]["response"] == "30 days."
+    assert items[-1]["data"]["degraded"] is False
+
+
+def test_a_run_past_its_deadline_ends_with_a_degraded_answer(workflow, monkeypatch):
+    monkeypatch.setattr(workflow_service, "DEADLINE_GRACE_SECONDS", 0)
+
+    async def stalled(task, context):
+        await asyncio.Event().wait()
+
+    workflow.orchestrator.execute = stalled
+    items = _collect(workflow, deadline_seconds=0.1)
+
+    assert items[-1]["event"] == "done"
+    assert items[-1]["data"]["degraded"] is True
+
+
+def test_closing_the_stream_early_cancels_the_run(workflow):
+    cancelled = False
+
+    async def slow_answer(task, context):
+        nonlocal cancelled
+        context["emit"](StageEvent(stage="retrieval", status="started"))
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    workflow.orchestrator.execute = slow_answer
+
+    async def disconnect_after_first_event():
+        stream = WorkflowService().stream_query(workflow, "Notice period?")
+        first = await stream.__anext__()
+        await stream.aclose()
+        # Let the cancellation reach the orchestrator
+        await asyncio.sleep(0.05)
+        return first
+
+    assert asyncio.run(disconnect_after_first_event())["event"] == "stage"
+    assert cancelled
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from agentic_workflow import SummaryAgent
+
+
+@pytest.mark.parametrize("query", [
+    "Summarize this document",
+    "summarise it",
+    "Please summarize.",
+    "Can you summarize the whole paper?",
+    "Summarize the document in detail, section by section",
+    "Summarize in 5 bullet points",
+    "Give me a summary of the report",
+    "Could you give me an overview of the entire document",
+    "TL;DR",
+    "Key takeaways?",
+    "What are the main points of the paper?",
+    "What is this document about?",
+    "Can I get the document summarized?",
+    "Summarizing the PDF would help",
+])
+def test_whole_document_requests_use_summaries(query):
+    assert SummaryAgent.is_summary_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "what does the executive summary say about termination?",
+    "Is the termination clause summarized in section 4?",
+    "summarize what the contract says about termination",
+    "Summarize the termination clause",
+    "summarize section 3",
+    "Give me an overview of the payment terms",
+    "What are the key points about liability?",
+    "Who wrote the summary?",
+    "",
+])
+def test_questions_mentioning_summaries_use_retrieval(query):
+    assert not SummaryAgent.is_summary_query(query)
+
+
+class EchoSummarizer:
+    async def acomplete(self, prompt, **kwargs):
+        return SimpleNamespace(text="combined summary")
+
+
+def _reduce(agent: SummaryAgent, summaries):
+    return asyncio.run(agent._reduce(summaries, asyncio.Semaphore(2)))
+
+
+def test_section_summaries_are_reduced_into_one():
+    agent = SummaryAgent("summary", EchoSummarizer())
+    assert _reduce(agent, ["part one", "part two"]) == "combined summary"
+
+
+def test_a_reduce_that_makes_no_progress_gives_no_document_summary():
+    # Every summary is over the budget on its own, so no pass can merge any of them
+    agent = SummaryAgent("summary", EchoSummarizer(), reduce_token_budget=1)
+    assert _reduce(agent, ["part one", "part two"]) is None
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import web_scrape
+from web_scrape import EphemeralIndex, WebChunk, WebScraper
+
+PAGES = {
+    "https://fast.example/a": "Termination requires 30 days written notice.",
+    "https://slow.example/b": "This page takes too long.",
+    "https://broken.example/c": None,
+    "https://fast.example/d": "Payment is due monthly.",
+}
+
+
+class KeywordEmbedding:
+    """Two-dimensional embeddings: [mentions notice, mentions payment]."""
+
+    model_name = "keywords"
+
+    @staticmethod
+    def _embed(text: str):
+        text = text.lower()
+        return [1.0 if "notice" in text else 0.0, 1.0 if "payment" in text else 0.0]
+
+    async def aget_text_embedding_batch(self, texts):
+        return [self._embed(text) for text in texts]
+
+    async def aget_query_embedding(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture(autouse=True)
+def fresh_domain_limits(monkeypatch):
+    # The per-domain semaphores are process-wide; each test runs its own event loop
+    monkeypatch.setattr(web_scrape, "_domain_semaphores", {})
+
+
+def _results(*urls):
+    return [{"url": url, "title": url.rsplit("/", 1)[-1]} for url in urls]
+
+
+def _stub_scrape(monkeypatch):
+    async def scrape(api_key, url, timeout=30):
+        if "slow" in url:
+            await asyncio.sleep(10)
+        await asyncio.sleep(0.01)
+        if PAGES[url] is None:
+            raise RuntimeError("scrape failed")
+        return PAGES[url]
+
+    monkeypatch.setattr(web_scrape, "firecrawl_scrape", scrape)
+
+
+def test_ephemeral_index_ranks_chunks_by_cosine_similarity():
+    chunks = [WebChunk(url="u1", title="", text="a"), WebChunk(url="u2", title="", text="b")]
+    index = EphemeralIndex(chunks, [[0.0, 2.0], [3.0, 0.1]])
+    top = index.top_k([1.0, 0.0], k=2)
+    assert [chunk.url for chunk in top] == ["u2", "u1"]
+    assert top[0].score > top[1].score
+    assert index.top_k([1.0, 0.0], k=0) == []
+
+
+def test_slow_and_failed_pages_are_dropped_and_rank_order_is_kept(monkeypatch):
+    _stub_scrape(monkeypatch)
+    scraper = WebScraper("test", KeywordEmbedding(), top_n=4)
+    pages = asyncio.run(scraper.fetch_pages(_results(*PAGES), timeout=0.2))
+    assert [page["url"] for page in pages] == ["https://fast.example/a", "https://fast.example/d"]
+
+
+def test_only_the_top_n_results_are_scraped(monkeypatch):
+    _stub_scrape(monkeypatch)
+    scraper = WebScraper("test", KeywordEmbedding(), top_n=1)
+    pages = asyncio.run(scraper.fetch_pages(_results(*PAGES), timeout=0.2))
+    assert [page["url"] for page in pages] == ["https://fast.example/a"]
+
+
+def test_per_domain_concurrency_is_limited(monkeypatch):
+    in_flight = peak = 0
+
+    async def scrape(api_key, url, timeout=30):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "Some text."
+
+    monkeypatch.setattr(web_scrape, "firecrawl_scrape", scrape)
+    scraper = WebScraper("test", KeywordEmbedding(), top_n=6, per_domain_concurrency=2)
+    urls = [f"https://one.example/page{i}" for i in range(6)]
+
+    pages = asyncio.run(scraper.fetch_pages(_results(*urls), timeout=1.0))
+    assert len(pages) == 6
+    assert peak == 2
+
+
+def test_retrieve_returns_the_chunks_closest_to_the_query(monkeypatch):
+    _stub_scrape(monkeypatch)
+    scraper = WebScraper("test", KeywordEmbedding(), top_n=4, top_chunks=1)
+    result = asyncio.run(scraper.retrieve("What notice is required?", _results(*PAGES), timeout=0.3))
+    assert result["pages"] == 2
+    assert result["chunks_indexed"] == 2
+    assert [chunk.url for chunk in result["chunks"]] == ["https://fast.example/a"]
@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+
+import firecrawl_client
+from agentic_workflow import WebSearchAgent
+
+SEARCH_LATENCY = 0.2
+
+
+async def _slow_search(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(SEARCH_LATENCY)
+    return httpx.Response(200, json={
+        "success": True,
+        "data": [{"title": "Notice periods", "description": "30 days", "url": "https://example.com"}],
+    })
+
+
+def test_web_search_does_not_block_the_event_loop(monkeypatch):
+    agent = WebSearchAgent("web", llm=None, firecrawl_api_key="test", scrape=False)
+
+    async def scenario():
+        client = httpx.AsyncClient(base_url="https://firecrawl.test", transport=httpx.MockTransport(_slow_search))
+        monkeypatch.setattr(firecrawl_client, "_client", client)
+        monkeypatch.setattr(firecrawl_client, "_client_loop", asyncio.get_running_loop())
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        try:
+            results = await agent._firecrawl_search("notice period")
+        finally:
+            ticking.cancel()
+            await client.aclose()
+        return results, ticks
+
+    results, ticks = asyncio.run(scenario())
+    assert results == [{"title": "Notice periods", "description": "30 days", "url": "https://example.com"}]
+    # Other requests kept being served while the search was in flight
+    assert ticks >= 5
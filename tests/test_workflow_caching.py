@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from llama_index.core import Document, Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+from agentic_workflow import AgenticRAGWorkflow
+from answer_cache import SharedAnswerCache
+
+EMBEDDING = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+
+class StandInLLM(CustomLLM):
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="stand-in")
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        return CompletionResponse(text="yes")
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        yield CompletionResponse(text="yes", delta="yes")
+
+
+@pytest.fixture
+def workflow(tmp_path):
+    Settings.embed_model = MockEmbedding(embed_dim=len(EMBEDDING))
+    index = VectorStoreIndex.from_documents([Document(text="The notice period is 30 days.")])
+    return AgenticRAGWorkflow(
+        index=index,
+        firecrawl_api_key="test",
+        llm=StandInLLM(),
+        document_hash="doc",
+        enable_answer_cache=True,
+        shared_answer_cache=SharedAnswerCache(str(tmp_path / "answers.db")),
+        timeout=30,
+    )
+
+
+def _answer_with(workflow, result):
+    async def execute(task, context):
+        return result
+
+    async def run():
+        return await workflow.run(query_str="What is the notice period?", query_embedding=EMBEDDING)
+
+    workflow.orchestrator.execute = execute
+    return asyncio.run(run())
+
+
+def test_complete_answers_are_cached(workflow):
+    response = _answer_with(workflow, {"result": "30 days.", "status": "success", "llm_tokens": 10})
+    assert response.metadata["cached"] is False
+    assert workflow.answer_cache.lookup(EMBEDDING, document_hash="doc") is not None
+    assert workflow.shared_answer_cache.get(workflow._shared_cache_key("What is the notice period?")) is not None
+
+
+def test_degraded_answers_are_not_cached(workflow):
+    response = _answer_with(workflow, {
+        "result": "No relevant information found in the documents.",
+        "status": "success",
+        "degraded": True,
+        "timed_out_stages": ["retrieval"],
+    })
+    assert response.metadata["degraded"] is True
+    assert workflow.answer_cache.lookup(EMBEDDING, document_hash="doc") is None
+    assert workflow.shared_answer_cache.get(workflow._shared_cache_key("What is the notice period?")) is None
+
+
+def test_a_new_document_version_is_not_answered_from_the_old_ones_cache(workflow):
+    _answer_with(workflow, {"result": "30 days.", "status": "success"})
+    assert _answer_with(workflow, {"result": "unused", "status": "success"}).metadata["cached"] is True
+
+    workflow.set_document_hash("doc-v2")
+    response = _answer_with(workflow, {"result": "60 days.", "status": "success"})
+    assert response.metadata["cached"] is False
+    assert str(response) == "60 days."
@@ -0,0 +1,174 @@
+"""
+Scrape-and-embed of top web search results into a per-request ephemeral index.
+
+Search snippets (title, description, URL) are often too thin to answer from. In
+scrape mode the top search results are fetched through FireCrawl concurrently
+(with a global and a per-domain concurrency limit), chunked, embedded in batches
+into an in-memory numpy index that lives only for the request, and only the
+chunks closest to the query are handed to the answer step. Pages that have not
+been fetched when the time budget runs out are dropped.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import numpy as np
+from llama_index.core.node_parser import TokenTextSplitter
+
+from firecrawl_client import firecrawl_scrape
+from single_flight import coalesced_query_embedding, coalesced_text_embedding_batch
+
+WEB_SCRAPE_ENABLED = os.getenv("WEB_SCRAPE_ENABLED", "0") == "1"
+DEFAULT_SCRAPE_TOP_N = int(os.getenv("WEB_SCRAPE_TOP_N", "3"))
+DEFAULT_SCRAPE_TOP_CHUNKS = int(os.getenv("WEB_SCRAPE_TOP_CHUNKS", "4"))
+DEFAULT_SCRAPE_TIMEOUT = float(os.getenv("WEB_SCRAPE_TIMEOUT", "15"))
+DEFAULT_SCRAPE_CONCURRENCY = int(os.getenv("WEB_SCRAPE_CONCURRENCY", "5"))
+DEFAULT_SCRAPE_PER_DOMAIN = int(os.getenv("WEB_SCRAPE_PER_DOMAIN_CONCURRENCY", "2"))
+DEFAULT_SCRAPE_CHUNK_TOKENS = int(os.getenv("WEB_SCRAPE_CHUNK_TOKENS", "256"))
+
+# Share of the time budget spent fetching pages; the rest is left for embedding
+_FETCH_SHARE = 0.75
+
+# Process-wide per-domain limits, so concurrent requests don't pile onto one site
+_domain_semaphores: Dict[str, asyncio.Semaphore] = {}
+_MAX_TRACKED_DOMAINS = 1024
+
+
+def _domain_semaphore(url: str, limit: int) -> asyncio.Semaphore:
+    domain = urlparse(url).netloc.lower()
+    if domain not in _domain_semaphores and len(_domain_semaphores) >= _MAX_TRACKED_DOMAINS:
+        # Forget idle domains rather than growing without bound
+        for idle in [d for d, sem in _domain_semaphores.items() if not sem.locked()]:
+            del _domain_semaphores[idle]
+    if domain not in _domain_semaphores:
+        _domain_semaphores[domain] = asyncio.Semaphore(limit)
+    return _domain_semaphores[domain]
+
+
+@dataclass
+class WebChunk:
+    """A chunk of scraped page content."""
+    url: str
+    title: str
+    text: str
+    score: Optional[float] = None
+
+
+class EphemeralIndex:
+    """In-memory cosine-similarity index over one request's web chunks."""
+
+    def __init__(self, chunks: List[WebChunk], embeddings: Sequence[Sequence[float]]):
+        self.chunks = chunks
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True) if len(matrix) else 1
+        self._matrix = matrix / np.where(norms == 0, 1, norms)
+
+    def top_k(self, query_embedding: Sequence[float], k: int) -> List[WebChunk]:
+        if not self.chunks or k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = self._matrix @ (query / norm if norm else query)
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        ranked = top[np.argsort(-scores[top])]
+        return [
+            WebChunk(url=self.chunks[i].url, title=self.chunks[i].title, text=self.chunks[i].text, score=float(scores[i]))
+            for i in ranked
+        ]
+
+
+class WebScraper:
+    """Fetches, chunks and embeds top search results, keeping the chunks closest to the query."""
+
+    def __init__(
+        self,
+        firecrawl_api_key: str,
+        embed_model,
+        top_n: int = DEFAULT_SCRAPE_TOP_N,
+        top_chunks: int = DEFAULT_SCRAPE_TOP_CHUNKS,
+        max_concurrency: int = DEFAULT_SCRAPE_CONCURRENCY,
+        per_domain_concurrency: int = DEFAULT_SCRAPE_PER_DOMAIN,
+        chunk_tokens: int = DEFAULT_SCRAPE_CHUNK_TOKENS,
+    ):
+        self.firecrawl_api_key = firecrawl_api_key
+        self.embed_model = embed_model
+        self.top_n = top_n
+        self.top_chunks = top_chunks
+        self.per_domain_concurrency = per_domain_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._splitter = TokenTextSplitter(chunk_size=chunk_tokens, chunk_overlap=min(32, chunk_tokens // 8))
+
+    async def _fetch(self, result: Dict, timeout: float) -> Optional[Dict]:
+        url = result.get("url")
+        async with self._semaphore, _domain_semaphore(url, self.per_domain_concurrency):
+            try:
+                content = await firecrawl_scrape(self.firecrawl_api_key, url, timeout=timeout)
+            except Exception as e:
+                print(f"FireCrawl scrape error for {url}: {e}")
+                return None
+        return {"url": url, "title": result.get("title", ""), "content": content} if content.strip() else None
+
+    async def fetch_pages(self, results: List[Dict], timeout: float) -> List[Dict]:
+        """Scrape the top results concurrently; pages not done within `timeout` are dropped."""
+        candidates = [r for r in results if r.get("url")][: self.top_n]
+        if not candidates or timeout <= 0:
+            return []
+        tasks = [asyncio.create_task(self._fetch(result, timeout)) for result in candidates]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        # Keep search-rank order among the pages that made it
+        return [task.result() for task in tasks if task in done and not task.exception() and task.result()]
+
+    async def retrieve(
+        self,
+        query: str,
+        results: List[Dict],
+        query_embedding: Optional[Sequence[float]] = None,
+        timeout: float = DEFAULT_SCRAPE_TIMEOUT,
+    ) -> Dict:
+        """
+        Scrape, chunk and embed the top results and return the best chunks for the query.
+
+        Returns {"chunks": [WebChunk], "pages": int, "chunks_indexed": int}. Raises
+        asyncio.TimeoutError if embedding does not finish inside the time budget.
+        """
+        started = time.monotonic()
+        pages = await self.fetch_pages(results, timeout * _FETCH_SHARE)
+        chunks = [
+            WebChunk(url=page["url"], title=page["title"], text=text)
+            for page in pages
+            for text in self._splitter.split_text(page["content"])
+            if text.strip()
+        ]
+        if not chunks:
+            return {"chunks": [], "pages": len(pages), "chunks_indexed": 0}
+
+        async def _embed():
+            # One batched embedding request for all chunks (split by the model's embed_batch_size)
+            embeddings = await coalesced_text_embedding_batch(self.embed_model, [c.text for c in chunks])
+            embedded_query = query_embedding
+            if embedded_query is None:
+                embedded_query = await coalesced_query_embedding(self.embed_model, query)
+            return embeddings, embedded_query
+
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+        embeddings, embedded_query = await asyncio.wait_for(_embed(), timeout=remaining or 0.001)
+        index = EphemeralIndex(chunks, embeddings)
+        return {
+            "chunks": index.top_k(embedded_query, self.top_chunks),
+            "pages": len(pages),
+            "chunks_indexed": len(chunks),
+        }
+
+
+def format_web_chunks(chunks: List[WebChunk]) -> str:
+    """Render retrieved web chunks as answer context, citing their source page."""
+    return "\n---\n".join(
+        f"Source: {chunk.title} ({chunk.url})\n{chunk.text}" if chunk.title else f"Source: {chunk.url}\n{chunk.text}"
+        for chunk in chunks
+    )